@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, City, Category, Service, Cart, Booking, Payment, Review, BookingService
+from .models import (
+    User, City, Category, Service, Cart, Booking, Payment, Review, BookingService, TimeslotCapacity, BookingRollup, ServiceRollup,
+    ArchivedBooking,
+)
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
-        (None, {'fields': ('phone',)}),
+        (None, {'fields': ('phone', 'city', 'latitude', 'longitude')}),
     )
     add_fieldsets = UserAdmin.add_fieldsets + (
         (None, {'fields': ('phone',)}),
@@ -13,7 +16,7 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(City)
 class CityAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name')
+    list_display = ('id', 'name', 'latitude', 'longitude', 'radius_km')
     search_fields = ('name',)
 
 @admin.register(Category)
@@ -58,4 +61,31 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ('id', 'booking', 'user', 'rating', 'created_at')
     list_filter = ('rating',)
     search_fields = ('booking__booking_id', 'user__username', 'review_text')
-    raw_id_fields = ('booking', 'user')
\ No newline at end of file
+    raw_id_fields = ('booking', 'user')
+
+@admin.register(TimeslotCapacity)
+class TimeslotCapacityAdmin(admin.ModelAdmin):
+    list_display = ('id', 'service', 'city', 'date', 'start_time', 'booked', 'capacity')
+    list_filter = ('city', 'date')
+    search_fields = ('service__name', 'city__name')
+    raw_id_fields = ('service', 'city')
+
+@admin.register(BookingRollup)
+class BookingRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'status', 'payment_method', 'payment_status', 'bookings', 'revenue')
+    list_filter = ('status', 'payment_method', 'payment_status')
+    date_hierarchy = 'date'
+
+@admin.register(ServiceRollup)
+class ServiceRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'status', 'service', 'lines', 'quantity', 'revenue')
+    list_filter = ('status',)
+    date_hierarchy = 'date'
+    raw_id_fields = ('service',)
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ('id', 'booking_id', 'user', 'date', 'total_amount', 'status', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('booking_id', 'user__username')
+    raw_id_fields = ('user', 'city')
@@ -0,0 +1,201 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import F, Q, Sum
+
+from .models import (
+    Booking, BookingService, BookingRollup, BookingRollupState, ServiceRollup, ArchivedBooking, ArchivedBookingService,
+    PendingRollup,
+)
+
+
+def booking_states(queryset):
+    rows = queryset.values(
+        'id', 'date', 'status', 'total_amount', method=F('payment__payment_method'), paid=F('payment__status'),
+    )
+    return {row['id']: (row['date'], row['status'], row['method'] or '', row['paid'] or '', row['total_amount']) for row in rows}
+
+
+def booking_lines(queryset):
+    lines = defaultdict(list)
+    for booking_id, *line in queryset.values_list('booking_id', 'service_id', 'quantity', 'price_at_booking'):
+        lines[booking_id].append(line)
+    return lines
+
+
+class RollupDelta:
+    """Signed changes to rollup cells, applied with one UPDATE per touched cell."""
+
+    def __init__(self):
+        self.bookings = defaultdict(lambda: [0, Decimal(0)])
+        self.services = defaultdict(lambda: [0, 0, Decimal(0)])
+
+    def add(self, state, lines, sign):
+        day, status, method, paid, total = state
+        cell = self.bookings[day, status, method, paid]
+        cell[0] += sign
+        cell[1] += sign * total
+        for service_id, quantity, price in lines:
+            cell = self.services[day, status, service_id]
+            cell[0] += sign
+            cell[1] += sign * quantity
+            cell[2] += sign * quantity * price
+
+    def apply(self, using):
+        # Sorted, so concurrent syncs lock shared cells in the same order.
+        bookings = {key: cell for key, cell in sorted(self.bookings.items()) if any(cell)}
+        services = {key: cell for key, cell in sorted(self.services.items()) if any(cell)}
+        # Make sure every touched cell exists, then increment them in place so
+        # concurrent writers never overwrite each other's counts.
+        BookingRollup.objects.using(using).bulk_create([
+            BookingRollup(date=day, status=status, payment_method=method, payment_status=paid)
+            for day, status, method, paid in bookings
+        ], ignore_conflicts=True)
+        ServiceRollup.objects.using(using).bulk_create([
+            ServiceRollup(date=day, status=status, service_id=service_id) for day, status, service_id in services
+        ], ignore_conflicts=True)
+        for (day, status, method, paid), (count, revenue) in bookings.items():
+            BookingRollup.objects.using(using).filter(
+                date=day, status=status, payment_method=method, payment_status=paid,
+            ).update(bookings=F('bookings') + count, revenue=F('revenue') + revenue)
+        for (day, status, service_id), (lines, quantity, revenue) in services.items():
+            ServiceRollup.objects.using(using).filter(date=day, status=status, service_id=service_id).update(
+                lines=F('lines') + lines, quantity=F('quantity') + quantity, revenue=F('revenue') + revenue,
+            )
+
+
+def sync_booking_rollups(booking_ids, removed=False, using=None):
+    """
+    Bring the rollups in line with the current state of the given bookings
+    (or take them out, when ``removed``). Each booking's last contribution is
+    kept in BookingRollupState, so only what changed is applied and syncing
+    the same booking twice is harmless.
+    """
+    booking_ids = set(booking_ids)
+    if not booking_ids:
+        return 0
+    using = using or router.db_for_write(BookingRollup)
+    with transaction.atomic(using=using):
+        bookings = Booking.objects.using(using).filter(id__in=booking_ids)
+        # Locking the bookings serialises concurrent syncs of the same booking.
+        current = {} if removed else booking_states(bookings.select_for_update(of=('self',)))
+        previous = {
+            state.booking_id: (state.date, state.status, state.payment_method, state.payment_status, state.total_amount)
+            for state in BookingRollupState.objects.using(using).filter(booking_id__in=booking_ids)
+        }
+        changed = [booking_id for booking_id in booking_ids if current.get(booking_id) != previous.get(booking_id)]
+        if not changed:
+            return 0
+
+        lines = booking_lines(BookingService.objects.using(using).filter(booking_id__in=changed))
+        delta = RollupDelta()
+        for booking_id in changed:
+            if booking_id in previous:
+                delta.add(previous[booking_id], lines[booking_id], -1)
+            if booking_id in current:
+                delta.add(current[booking_id], lines[booking_id], 1)
+        delta.apply(using)
+
+        BookingRollupState.objects.using(using).filter(booking_id__in=[i for i in changed if i not in current]).delete()
+        BookingRollupState.objects.using(using).bulk_create([
+            BookingRollupState(
+                booking_id=booking_id, date=day, status=status, payment_method=method, payment_status=paid, total_amount=total,
+            )
+            for booking_id in changed if booking_id in current
+            for day, status, method, paid, total in [current[booking_id]]
+        ], update_conflicts=True, unique_fields=['booking'], update_fields=['date', 'status', 'payment_method', 'payment_status', 'total_amount'])
+    return len(changed)
+
+
+def add_archived_rollups(booking_ids, using=None):
+    """
+    Count archived bookings into the rollups, for rebuilds. Archived
+    bookings never change, so they have no BookingRollupState.
+    """
+    using = using or router.db_for_write(BookingRollup)
+    with transaction.atomic(using=using):
+        states = booking_states(ArchivedBooking.objects.using(using).filter(id__in=booking_ids))
+        lines = booking_lines(ArchivedBookingService.objects.using(using).filter(booking_id__in=booking_ids))
+        delta = RollupDelta()
+        for booking_id, state in states.items():
+            delta.add(state, lines[booking_id], 1)
+        delta.apply(using)
+    return len(states)
+
+
+def queue_booking_rollups(booking_ids, using=None):
+    # One insert in the caller's transaction, so the change and its queue
+    # entry commit together; sync_pending_rollups does the actual work.
+    PendingRollup.objects.using(using).bulk_create(
+        [PendingRollup(booking_id=booking_id) for booking_id in set(booking_ids)], ignore_conflicts=True,
+    )
+
+
+def sync_pending_rollups(batch_size, using=None):
+    """
+    Sync the bookings queued by queue_booking_rollups, ``batch_size`` at a
+    time, until the queue is empty. Returns the number of bookings whose
+    rollups changed. Safe to run on several nodes at once.
+    """
+    using = using or router.db_for_write(BookingRollup)
+    synced = 0
+    while True:
+        with transaction.atomic(using=using):
+            # Rows another node is working on are left to it.
+            booking_ids = list(
+                PendingRollup.objects.using(using).select_for_update(skip_locked=True)
+                .order_by('booking_id').values_list('booking_id', flat=True)[:batch_size]
+            )
+            if not booking_ids:
+                return synced
+            PendingRollup.objects.using(using).filter(booking_id__in=booking_ids).delete()
+            synced += sync_booking_rollups(booking_ids, using=using)
+
+
+def money(value):
+    return f'{value or 0:.2f}'
+
+
+def summarize(date_from, date_to, top_services=0):
+    """Booking, revenue and payment figures for a date range, read from the rollups only."""
+    summary = {
+        'date_from': date_from, 'date_to': date_to,
+        'bookings': 0, 'revenue': Decimal(0), 'by_status': {}, 'payments': {},
+    }
+    rows = (
+        BookingRollup.objects.filter(date__range=(date_from, date_to))
+        .values_list('status', 'payment_method', 'payment_status')
+        .annotate(count=Sum('bookings'), amount=Sum('revenue'))
+        .order_by()
+    )
+    for status, method, paid, count, amount in rows:
+        if not count:
+            continue
+        by_status = summary['by_status'].setdefault(status, {'bookings': 0, 'revenue': Decimal(0)})
+        by_status['bookings'] += count
+        by_status['revenue'] += amount
+        summary['bookings'] += count
+        if status != 'Cancelled':
+            summary['revenue'] += amount
+        if method:
+            payments = summary['payments'].setdefault(method, {'payments': 0, 'succeeded': 0, 'failed': 0, 'pending': 0})
+            payments['payments'] += count
+            payments[{'Success': 'succeeded', 'Failed': 'failed'}.get(paid, 'pending')] += count
+
+    summary['revenue'] = money(summary['revenue'])
+    for by_status in summary['by_status'].values():
+        by_status['revenue'] = money(by_status['revenue'])
+    for payments in summary['payments'].values():
+        payments['success_rate'] = round(payments['succeeded'] / payments['payments'], 4)
+
+    if top_services:
+        services = (
+            ServiceRollup.objects.filter(Q(date__range=(date_from, date_to)) & ~Q(status='Cancelled'))
+            .values('service_id', service_name=F('service__name'))
+            .annotate(bookings=Sum('lines'), quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(bookings__gt=0)
+            .order_by('-revenue', 'service_id')[:top_services]
+        )
+        summary['services'] = [dict(row, revenue=money(row['revenue'])) for row in services]
+    return summary
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class YesMadamApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'yes_madam_api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .conf import get_setting
+
+        if get_setting('SEARCH_WARM_ON_STARTUP'):
+            from django.core.signals import request_started
+
+            from .search import WARM_UID, warm_on_first_request
+
+            request_started.connect(warm_on_first_request, dispatch_uid=WARM_UID)
@@ -0,0 +1,135 @@
+from contextvars import ContextVar
+from operator import attrgetter, itemgetter
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .analytics import sync_booking_rollups
+from .fastpath import ROW_MODEL
+from .models import (
+    Booking, BookingService, Payment, Review,
+    ArchivedBooking, ArchivedBookingService, ArchivedPayment, ArchivedReview,
+)
+
+ARCHIVABLE_STATUSES = ('Completed', 'Cancelled')
+
+# (hot model, archive model, lookup of the booking id)
+ARCHIVE_TABLES = [
+    (Booking, ArchivedBooking, 'id'),
+    (BookingService, ArchivedBookingService, 'booking_id'),
+    (Payment, ArchivedPayment, 'booking_id'),
+    (Review, ArchivedReview, 'booking_id'),
+]
+
+# Set while archived bookings are deleted from the hot tables, so delete
+# signals can tell a move from a real removal.
+archiving = ContextVar('archiving', default=False)
+
+
+def copy_rows(source, target, queryset):
+    fields = [field.attname for field in source._meta.concrete_fields]
+    target.objects.bulk_create([target(**row) for row in queryset.values(*fields)])
+
+
+def archive_batch(cutoff, batch_size, after=0):
+    """
+    Move up to ``batch_size`` completed or cancelled bookings dated before
+    ``cutoff`` (and with an id above ``after``) into the archive tables,
+    with their lines, payment and review, in one transaction. Returns the
+    moved ids; an empty list means there is nothing left to archive.
+    """
+    with transaction.atomic():
+        # Rows locked by live traffic are left for a later run.
+        booking_ids = list(
+            Booking.objects.select_for_update(skip_locked=True)
+            .filter(status__in=ARCHIVABLE_STATUSES, date__lt=cutoff, id__gt=after)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not booking_ids:
+            return booking_ids
+        # Archived bookings stay counted as they were last synced, so apply
+        # any change still queued for the analytics first.
+        sync_booking_rollups(booking_ids)
+        for source, target, lookup in ARCHIVE_TABLES:
+            copy_rows(source, target, source.objects.filter(**{f'{lookup}__in': booking_ids}))
+        token = archiving.set(True)
+        try:
+            Booking.objects.filter(id__in=booking_ids).delete()
+        finally:
+            archiving.reset(token)
+    return booking_ids
+
+
+class BookingHistory:
+    """
+    Hot and archived bookings behind the part of the QuerySet API that
+    KeysetPagination and FastListMixin use. Every call is applied to both
+    tables and a slice is merged on the ordering, so a page costs one
+    indexed range scan per table. Archived rows keep their ids, so the
+    ordering stays unique across both.
+    """
+    model = Booking
+
+    def __init__(self, *querysets, ordering=(), limit=None):
+        self.querysets = querysets
+        self.ordering = ordering
+        self.limit = limit
+
+    def _clone(self, querysets, **kwargs):
+        return type(self)(*querysets, **{'ordering': self.ordering, 'limit': self.limit, **kwargs})
+
+    def _each(self, method, *args, **kwargs):
+        return self._clone([getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets])
+
+    def filter(self, *args, **kwargs):
+        return self._each('filter', *args, **kwargs)
+
+    def prefetch_related(self, *lookups):
+        return self._each('prefetch_related', *lookups)
+
+    def values(self, *fields):
+        return self._each('values', *fields)
+
+    def order_by(self, *ordering):
+        if len({name.startswith('-') for name in ordering}) > 1:
+            raise ValueError('BookingHistory only merges on orderings in a single direction')
+        return self._clone([queryset.order_by(*ordering) for queryset in self.querysets], ordering=ordering)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.start or key.step or key.stop is None:
+            raise TypeError('BookingHistory only supports [:n] slices')
+        return self._clone([queryset[:key.stop] for queryset in self.querysets], limit=key.stop)
+
+    def merge(self, parts):
+        rows = []
+        for queryset, part in zip(self.querysets, parts):
+            for row in part:
+                if isinstance(row, dict):
+                    row[ROW_MODEL] = queryset.model
+            rows.extend(part)
+        if self.ordering:
+            fields = [name.lstrip('-') for name in self.ordering]
+            key = itemgetter(*fields) if rows and isinstance(rows[0], dict) else attrgetter(*fields)
+            rows.sort(key=key, reverse=self.ordering[0].startswith('-'))
+        return rows[:self.limit]
+
+    def __iter__(self):
+        return iter(self.merge([list(queryset) for queryset in self.querysets]))
+
+    async def __aiter__(self):
+        parts = [[row async for row in queryset] for queryset in self.querysets]
+        for row in self.merge(parts):
+            yield row
+
+
+def booking_history(*related, **filters):
+    """The bookings matching ``filters`` in both tables, lines prefetched and ``related`` joined."""
+    querysets = []
+    for booking_model, line_model in ((Booking, BookingService), (ArchivedBooking, ArchivedBookingService)):
+        queryset = booking_model.objects.filter(**filters)
+        if related:
+            queryset = queryset.select_related(*related)
+        querysets.append(queryset.prefetch_related(
+            Prefetch('bookingservice_set', queryset=line_model.objects.select_related('service')),
+        ))
+    return BookingHistory(*querysets)
@@ -0,0 +1,171 @@
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .archive import booking_history
+from .catalog import aget_catalog_version, aget_or_build, catalog_etag, services_key
+from .models import City, Category, Service, Cart, Booking, Payment
+from .pagination import BookingCursorPagination
+from .serializers import (
+    CitySerializer, CategorySerializer, ServiceSerializer, CartItemSerializer,
+    PaymentStatusSerializer, BookingHistorySerializer
+)
+
+# Async-native versions of the read-heavy endpoints, for ASGI deployments.
+# URLs and response bodies match the DRF views in views.py; urls.py swaps
+# them in when the ASYNC_VIEWS setting is on.
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json', headers=headers)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+class AsyncAPIView(View):
+    # The same authenticators as the DRF views: the REST_FRAMEWORK default
+    # unless a view sets its own.
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    authentication_required = True
+    http_method_names = ['get', 'options']
+
+    async def get(self, request, *args, **kwargs):
+        request = Request(request)
+        authenticators = [auth() for auth in self.authentication_classes]
+        if getattr(request._request, '_force_auth_user', None) is not None:
+            # Authenticated already, by the batch request this is part of.
+            result = (request._request._force_auth_user, request._request._force_auth_token)
+        else:
+            try:
+                result = await self.authenticate(request, authenticators)
+            except AuthenticationFailed as exc:
+                return self.unauthorized(request, authenticators, exc.detail)
+        if result is not None:
+            request.user, request.auth = result
+        elif self.authentication_required:
+            return self.unauthorized(request, authenticators, 'Authentication credentials were not provided.')
+        try:
+            return await self.respond(request, *args, **kwargs)
+        except APIException as exc:
+            return json_response({"detail": exc.detail}, exc.status_code)
+
+    async def authenticate(self, request, authenticators):
+        # First authenticator to return a user wins, as in DRF. Those with an
+        # aauthenticate (CachedTokenAuthentication) may answer without leaving
+        # the event loop; the rest run on a worker thread.
+        for authenticator in authenticators:
+            if hasattr(authenticator, 'aauthenticate'):
+                result = await authenticator.aauthenticate(request._request)
+            else:
+                result = await sync_to_async(authenticator.authenticate)(request)
+            if result is not None:
+                return result
+        return None
+
+    def unauthorized(self, request, authenticators, detail):
+        # 401 with a challenge when the first authenticator has one, else 403, as DRF answers.
+        header = authenticators[0].authenticate_header(request) if authenticators else None
+        if header is None:
+            return json_response({"detail": detail}, status.HTTP_403_FORBIDDEN)
+        return json_response({"detail": detail}, status.HTTP_401_UNAUTHORIZED, headers={'WWW-Authenticate': header})
+
+    async def respond(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+
+class AsyncCatalogListView(AsyncAPIView):
+    authentication_required = False
+    catalog_key = None
+    serializer_class = None
+
+    def get_catalog_key(self, **kwargs):
+        return self.catalog_key
+
+    def get_queryset(self, **kwargs):
+        raise NotImplementedError
+
+    async def respond(self, request, *args, **kwargs):
+        key = self.get_catalog_key(**kwargs)
+        version = await aget_catalog_version(key)
+        etag = catalog_etag(version, key)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+        async def build():
+            rows = [row async for row in self.get_queryset(**kwargs)]
+            return self.serializer_class(rows, many=True, context={'request': request}).data
+
+        return json_response(await aget_or_build(version, key, build), headers=headers)
+
+
+class CityListView(AsyncCatalogListView):
+    catalog_key = 'cities'
+    serializer_class = CitySerializer
+
+    def get_queryset(self, **kwargs):
+        return City.objects.all()
+
+
+class CategoryListView(AsyncCatalogListView):
+    catalog_key = 'categories'
+    serializer_class = CategorySerializer
+
+    def get_queryset(self, **kwargs):
+        return Category.objects.all()
+
+
+class ServiceByCategoryView(AsyncCatalogListView):
+    serializer_class = ServiceSerializer
+
+    def get_catalog_key(self, **kwargs):
+        return services_key(kwargs['category_id'])
+
+    def get_queryset(self, **kwargs):
+        return Service.objects.filter(category_id=kwargs['category_id']).select_related('rating')
+
+
+class ViewCartView(AsyncAPIView):
+
+    async def respond(self, request):
+        user_id = request.query_params.get('user_id')
+        rows = []
+        if user_id:
+            queryset = Cart.objects.filter(user_id=user_id).select_related('service__rating').annotate(total=F('quantity') * F('service__price'))
+            rows = [row async for row in queryset]
+        return json_response(CartItemSerializer(rows, many=True, context={'request': request}).data)
+
+
+class BookingHistoryView(AsyncAPIView):
+    pagination_class = BookingCursorPagination
+
+    async def respond(self, request):
+        user_id = request.query_params.get('user_id')
+        queryset = Booking.objects.none()
+        if user_id:
+            queryset = booking_history(user_id=user_id)
+        paginator = self.pagination_class()
+        rows = await paginator.apaginate_queryset(queryset, request)
+        data = BookingHistorySerializer(rows, many=True, context={'request': request}).data
+        return json_response(paginator.get_paginated_response(data).data)
+
+
+class PaymentStatusView(AsyncAPIView):
+
+    async def respond(self, request, booking_id):
+        try:
+            payment = await Payment.objects.select_related('booking').aget(booking__booking_id=booking_id)
+        except Payment.DoesNotExist:
+            return json_response({"detail": "Payment status not found for this booking ID"}, status.HTTP_404_NOT_FOUND)
+        return json_response(PaymentStatusSerializer(payment).data)
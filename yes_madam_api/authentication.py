@@ -0,0 +1,92 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from .caching import LocalLRUCache
+from .conf import get_setting
+
+local_tokens = LocalLRUCache(get_setting('AUTH_LOCAL_CACHE_SIZE'), ttl=get_setting('AUTH_LOCAL_CACHE_TTL'))
+
+# What views and permissions read from request.user. Credentials (the
+# password hash) never go into either cache tier.
+CACHED_USER_FIELDS = ('id', 'username', 'phone', 'city_id', 'is_active', 'is_staff', 'is_superuser')
+
+
+def shared_cache():
+    return caches[get_setting('AUTH_CACHE_ALIAS')]
+
+
+def token_cache_key(key):
+    # Hash the key so raw tokens never show up in cache keys or cache dumps.
+    return 'yes_madam_api:auth:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_fields(user):
+    return [(field.attname, getattr(user, field.attname)) for field in user._meta.concrete_fields if field.attname in CACHED_USER_FIELDS]
+
+
+def cached_user(model, fields):
+    # The other fields are deferred: reading one loads it rather than
+    # returning a blank.
+    return model.from_db(None, [name for name, _ in fields], [value for _, value in fields])
+
+
+def forget_token(key):
+    local_tokens.delete(key)
+    shared_cache().delete(token_cache_key(key))
+
+
+def forget_tokens(keys, using=None):
+    # Drop the entries now and again once the surrounding transaction commits,
+    # so a request that re-cached the old user in between cannot linger.
+    keys = list(keys)
+
+    def forget():
+        for key in keys:
+            forget_token(key)
+
+    forget()
+    transaction.on_commit(forget, using=using)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for DRF's TokenAuthentication that resolves tokens
+    from a short-lived per-process LRU, then the shared cache, and only then
+    the database. Signal handlers evict a token on logout, password change
+    or deactivation; other processes see that within AUTH_LOCAL_CACHE_TTL.
+    """
+
+    def authenticate_credentials(self, key):
+        fields = local_tokens.get(key)
+        if fields is None:
+            cache = shared_cache()
+            cache_key = token_cache_key(key)
+            fields = cache.get(cache_key)
+            if fields is None:
+                user, token = super().authenticate_credentials(key)
+                fields = user_fields(user)
+                cache.set(cache_key, fields, get_setting('AUTH_CACHE_TIMEOUT'))
+                local_tokens.set(key, fields)
+                return user, token
+            local_tokens.set(key, fields)
+        user = cached_user(self.get_model()._meta.get_field('user').related_model, fields)
+        return user, self.get_model()(key=key, user=user)
+
+    async def aauthenticate(self, request):
+        # For async views: a token in the local LRU resolves without leaving
+        # the event loop; anything else takes the sync path on a worker thread.
+        auth = get_authorization_header(request).split()
+        if len(auth) == 2 and auth[0].lower() == self.keyword.lower().encode():
+            try:
+                key = auth[1].decode()
+            except UnicodeError:
+                key = None
+            fields = local_tokens.get(key) if key else None
+            if fields is not None:
+                user = cached_user(self.get_model()._meta.get_field('user').related_model, fields)
+                return user, self.get_model()(key=key, user=user)
+        return await sync_to_async(self.authenticate)(request)
@@ -0,0 +1,112 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.db import connection
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Request headers that belong to the batch request itself, not its parts.
+DROPPED_META = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_IF_NONE_MATCH', 'HTTP_IDEMPOTENCY_KEY')
+PASSED_HEADERS = ('ETag', 'Cache-Control', 'Retry-After')
+
+
+def batch_routes():
+    from .urls import batch_routes
+
+    return batch_routes
+
+
+def subrequest(request, path, query_string, etag=None):
+    """A GET for ``path`` carrying the batch request's headers and, if any, its authenticated user."""
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {key: value for key, value in request.META.items() if key not in DROPPED_META}
+    sub.META.update(REQUEST_METHOD='GET', PATH_INFO=path, QUERY_STRING=query_string, HTTP_ACCEPT='application/json')
+    if etag:
+        sub.META['HTTP_IF_NONE_MATCH'] = etag
+    sub.GET = QueryDict(query_string)
+    sub.COOKIES = request.COOKIES
+    sub.user = request.user
+    if request.user.is_authenticated:
+        # DRF's forced authentication: the view takes the user as it is
+        # rather than looking the token up again.
+        sub._force_auth_user, sub._force_auth_token = request.user, request.auth
+    return sub
+
+
+def error(status, detail):
+    return status, {}, json.dumps({'detail': detail}).encode()
+
+
+def dispatch(request, item):
+    """Run one sub-request; returns (status, headers, JSON body bytes)."""
+    path, _, query_string = item['path'].partition('?')
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return error(404, 'Not found.')
+    if match.view_name not in batch_routes():
+        return error(400, 'This path is not available in a batch.')
+
+    sub = subrequest(request, path, query_string, item.get('etag'))
+    sub.resolver_match = match
+    # Each part counts against its own route's limits, as if sent alone.
+    throttle = getattr(request, 'throttle', None)
+    response = throttle(sub, match.view_name) if throttle else None
+    if response is None:
+        view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+        try:
+            response = view(sub, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        except Exception:
+            logger.exception('Batched request for %s failed', path)
+            return error(500, 'Internal server error.')
+
+    headers = {name: response[name] for name in PASSED_HEADERS if response.has_header(name)}
+    body = response.content
+    if not body:
+        body = b'null'
+    elif not response.get('Content-Type', '').startswith('application/json'):
+        body = json.dumps(body.decode(errors='replace')).encode()
+    return response.status_code, headers, body
+
+
+def dispatch_in_thread(request, item):
+    try:
+        return dispatch(request, item)
+    finally:
+        connection.close()
+
+
+def run_batch(request, items, concurrent=False):
+    """
+    Run GET sub-requests against the routes in urls.batch_routes and return
+    the JSON body of the combined response. Sequential parts share the
+    request's database connection; concurrent ones run on up to
+    BATCH_MAX_WORKERS threads, each with its own connection.
+    """
+    workers = min(get_setting('BATCH_MAX_WORKERS'), len(items)) if concurrent else 1
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(lambda item: dispatch_in_thread(request, item), items))
+    else:
+        results = [dispatch(request, item) for item in items]
+
+    # Bodies are already rendered JSON, so they are spliced in as they are
+    # rather than parsed and serialised a second time.
+    parts = []
+    for item, (status, headers, body) in zip(items, results):
+        head = {'id': item['id']} if 'id' in item else {}
+        head['status'] = status
+        if headers:
+            head['headers'] = headers
+        parts.append(json.dumps(head)[:-1].encode() + b', "body": ' + body + b'}')
+    return b'{"responses": [' + b', '.join(parts) + b']}'
@@ -0,0 +1,136 @@
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .caching import LocalLRUCache
+from .conf import get_setting
+
+VERSION_KEY = 'yes_madam_api:catalog:version'
+
+local_cache = LocalLRUCache(get_setting('CATALOG_LOCAL_CACHE_SIZE'))
+
+
+def shared_cache():
+    return caches[get_setting('CATALOG_CACHE_ALIAS')]
+
+
+def version_keys(key):
+    # A listing's version is the catalog-wide one plus its own, so a change
+    # that touches one listing (a rating) only has to bump that listing.
+    return [VERSION_KEY] if key is None else [VERSION_KEY, f'{VERSION_KEY}:{key}']
+
+
+def get_catalog_version(key=None):
+    # Versions are random tokens rather than counters so that an evicted or
+    # flushed key can never resurrect an ETag that described older data.
+    cache = shared_cache()
+    names = version_keys(key)
+    versions = cache.get_many(names)
+    if len(versions) < len(names):
+        for name in names:
+            if name not in versions:
+                cache.add(name, uuid.uuid4().hex, None)
+        versions = cache.get_many(names)
+    return ':'.join(versions[name] for name in names)
+
+
+async def aget_catalog_version(key=None):
+    cache = shared_cache()
+    names = version_keys(key)
+    versions = await cache.aget_many(names)
+    if len(versions) < len(names):
+        for name in names:
+            if name not in versions:
+                await cache.aadd(name, uuid.uuid4().hex, None)
+        versions = await cache.aget_many(names)
+    return ':'.join(versions[name] for name in names)
+
+
+def bump_catalog_version():
+    shared_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def bump_catalog_version_on_commit(using=None):
+    transaction.on_commit(bump_catalog_version, using=using)
+
+
+def bump_catalog_keys(keys):
+    shared_cache().set_many({version_keys(key)[1]: uuid.uuid4().hex for key in keys}, None)
+
+
+def bump_catalog_keys_on_commit(keys, using=None):
+    keys = set(keys)
+    transaction.on_commit(lambda: bump_catalog_keys(keys), using=using)
+
+
+def services_key(category_id):
+    return f'services:{category_id}'
+
+
+def clear_catalog_cache():
+    local_cache.clear()
+    shared_cache().delete(VERSION_KEY)
+
+
+def catalog_etag(version, key):
+    return quote_etag(hashlib.sha1(f'{version}:{key}'.encode()).hexdigest())
+
+
+def catalog_cache_key(version, key):
+    return f'yes_madam_api:catalog:{version}:{key}'
+
+
+def get_or_build(version, key, build):
+    cache_key = catalog_cache_key(version, key)
+    data = local_cache.get(cache_key)
+    if data is not None:
+        return data
+    cache = shared_cache()
+    data = cache.get(cache_key)
+    if data is None:
+        data = build()
+        cache.set(cache_key, data, get_setting('CATALOG_CACHE_TIMEOUT'))
+    local_cache.set(cache_key, data)
+    return data
+
+
+async def aget_or_build(version, key, build):
+    cache_key = catalog_cache_key(version, key)
+    data = local_cache.get(cache_key)
+    if data is not None:
+        return data
+    cache = shared_cache()
+    data = await cache.aget(cache_key)
+    if data is None:
+        data = await build()
+        await cache.aset(cache_key, data, get_setting('CATALOG_CACHE_TIMEOUT'))
+    local_cache.set(cache_key, data)
+    return data
+
+
+class CatalogCacheMixin:
+    """
+    Serves a list view from the catalog cache. Clients presenting the
+    current ETag get a 304 without the view touching the database.
+    """
+    catalog_key = None
+
+    def get_catalog_key(self):
+        return self.catalog_key
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_catalog_key()
+        version = get_catalog_version(key)
+        etag = catalog_etag(version, key)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        data = get_or_build(version, key, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs).data)
+        return Response(data, headers=headers)
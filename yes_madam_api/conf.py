@@ -0,0 +1,51 @@
+from django.conf import settings
+
+DEFAULTS = {
+    'CATALOG_CACHE_ALIAS': 'default',
+    'CATALOG_CACHE_TIMEOUT': 60 * 60,
+    'CATALOG_LOCAL_CACHE_SIZE': 512,
+    'AUTH_CACHE_ALIAS': 'default',
+    'AUTH_CACHE_TIMEOUT': 5 * 60,
+    'AUTH_LOCAL_CACHE_SIZE': 10000,
+    'AUTH_LOCAL_CACHE_TTL': 5,
+    'IDEMPOTENCY_CACHE_ALIAS': 'default',
+    'IDEMPOTENCY_TTL': 24 * 60 * 60,
+    'IDEMPOTENCY_LOCK_TIMEOUT': 60,
+    'PAYMENT_GATEWAY': 'yes_madam_api.payments.SimulatedGateway',
+    'PAYMENT_GATEWAY_OPTIONS': {},
+    'PAYMENT_WORKERS': 4,
+    'PAYMENT_MAX_ATTEMPTS': 5,
+    'PAYMENT_RETRY_BACKOFF': 0.5,
+    'PAYMENT_BATCH_SIZE': 100,
+    'PAYMENT_FLUSH_INTERVAL': 0.2,
+    'PAYMENT_RESUME_AFTER': 5 * 60,
+    'PAYMENT_RESUME_ON_START': False,
+    'NOTIFICATION_TOPICS_SIZE': 100000,
+    'NOTIFICATION_LONG_POLL_TIMEOUT': 25,
+    'NOTIFICATION_LONG_POLL_MAX_TIMEOUT': 60,
+    'NOTIFICATION_STREAM_MAX_AGE': 5 * 60,
+    'NOTIFICATION_KEEPALIVE': 15,
+    'ASYNC_VIEWS': False,
+    'FAST_SERIALIZATION': False,
+    'METRICS_SLOW_REQUEST_SECONDS': 1.0,
+    'METRICS_SLOW_REQUEST_SAMPLES': 100,
+    'METRICS_SLOW_REQUEST_STATEMENTS': 50,
+    'ANALYTICS_SYNC_BATCH_SIZE': 1000,
+    'ARCHIVE_AFTER_DAYS': 180,
+    'LIFECYCLE_COMPLETE_AFTER': 2 * 60 * 60,
+    'LIFECYCLE_UNPAID_TIMEOUT': 30 * 60,
+    'LIFECYCLE_CHUNK_SIZE': 500,
+    'THROTTLE_RATES': {},
+    'THROTTLE_CACHE_ALIAS': None,
+    'THROTTLE_SYNC_INTERVAL': 1.0,
+    'THROTTLE_LOCAL_CACHE_SIZE': 100000,
+    'THROTTLE_CLIENT_IP_HEADER': None,
+    'ADMIN_BULK_MAX_ROWS': 10000,
+    'SEARCH_WARM_ON_STARTUP': False,
+    'BATCH_MAX_REQUESTS': 20,
+    'BATCH_MAX_WORKERS': 4,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'YES_MADAM_API', {}).get(name, DEFAULTS[name])
@@ -0,0 +1,191 @@
+import decimal
+import json
+from collections import defaultdict
+from functools import lru_cache
+
+from django.http import HttpResponse
+from django.utils.http import parse_header_parameters
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from .conf import get_setting
+from .serializers import ServiceSerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Read-only list endpoints can skip DRF's per-field machinery: a serializer
+# is compiled once into (key, values() lookup, converter) steps, rows come
+# from QuerySet.values(), and the result is encoded in one call. The bytes
+# match what the serializer and JSONRenderer would produce.
+
+# values() rows merged from several tables (archive.BookingHistory) carry
+# their model under this key, so related rows are read from the right table.
+ROW_MODEL = '_model'
+
+
+def decimal_converter(field):
+    if (not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            or field.localize or field.normalize_output or field.decimal_places is None):
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return f'{value.quantize(exponent, rounding=rounding, context=context):f}'
+
+    return convert
+
+
+def converter_for(field):
+    if isinstance(field, serializers.DecimalField):
+        return decimal_converter(field)
+    if isinstance(field, serializers.DateField) and getattr(field, 'format', api_settings.DATE_FORMAT) == 'iso-8601':
+        return lambda value: value if isinstance(value, str) else value.isoformat()
+    if type(field) in (serializers.CharField, serializers.IntegerField):
+        return None
+    return field.to_representation
+
+
+def rating_summary(prefix):
+    # ServiceSerializer.get_rating, read from the LEFT JOINed summary row.
+    lookups = [f'{prefix}rating__{column}' for column in ('count', 'total', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5')]
+
+    def build(row, related):
+        count, total, *stars = (row[lookup] or 0 for lookup in lookups)
+        return {
+            'count': count,
+            'average': float(round(total / count, 2)) if count else None,
+            'histogram': {str(number): value for number, value in enumerate(stars, 1)},
+        }
+
+    return lookups, build
+
+
+METHOD_FIELDS = {
+    (ServiceSerializer, 'rating'): rating_summary,
+}
+
+
+class RowMapping:
+    """
+    A ModelSerializer's readable fields compiled into steps over values()
+    rows. Nested serializers become prefixed lookups on the same row;
+    many=True reverse relations are fetched with one extra query per page.
+    """
+
+    def __init__(self, serializer_class, prefix=''):
+        self.model = model = serializer_class.Meta.model
+        self.pk = prefix + model._meta.pk.attname
+        self.lookups = [self.pk]
+        self.steps = []
+        self.children = []
+
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if (serializer_class, name) in METHOD_FIELDS:
+                lookups, build = METHOD_FIELDS[serializer_class, name](prefix)
+                self.lookups.extend(lookups)
+                self.steps.append((name, None, build))
+            elif isinstance(field, serializers.SerializerMethodField):
+                raise TypeError(f'{serializer_class.__name__}.{name}: register method fields in METHOD_FIELDS')
+            elif isinstance(field, serializers.ListSerializer):
+                if prefix:
+                    raise TypeError(f'{serializer_class.__name__}.{name}: nested lists are only supported at the top level')
+                self.children.append((name, field.source, RowMapping(type(field.child))))
+                self.steps.append((name, None, self.child_getter(name)))
+            elif isinstance(field, serializers.BaseSerializer):
+                nested = RowMapping(type(field), f"{prefix}{field.source.replace('.', '__')}__")
+                self.lookups.extend(nested.lookups)
+                self.steps.append((name, None, lambda row, related, nested=nested: nested.build(row, related) if row[nested.pk] is not None else None))
+            else:
+                lookup = prefix + field.source.replace('.', '__')
+                self.lookups.append(lookup)
+                self.steps.append((name, lookup, converter_for(field)))
+        self.lookups = list(dict.fromkeys(self.lookups))
+
+    def child_getter(self, name):
+        def get(row, related):
+            return related[name].get(row[self.pk], [])
+        return get
+
+    def build(self, row, related):
+        data = {}
+        for name, lookup, convert in self.steps:
+            if lookup is None:
+                data[name] = convert(row, related)
+                continue
+            value = row[lookup]
+            data[name] = value if value is None or convert is None else convert(value)
+        return data
+
+    def values(self, queryset, *extra):
+        return queryset.prefetch_related(None).values(*dict.fromkeys(self.lookups + list(extra)))
+
+    def serialize(self, rows):
+        related = {}
+        ids = defaultdict(list)
+        for row in rows:
+            ids[row.get(ROW_MODEL, self.model)].append(row[self.pk])
+        for name, accessor, mapping in self.children:
+            grouped = related[name] = defaultdict(list)
+            for model, model_ids in ids.items():
+                relation = next(rel for rel in model._meta.related_objects if rel.get_accessor_name() == accessor)
+                key = relation.field.attname
+                children = relation.related_model._default_manager.filter(**{f'{relation.field.name}__in': model_ids})
+                for child in children.values(key, *mapping.lookups):
+                    grouped[child[key]].append(mapping.build(child, None))
+        return [self.build(row, related) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def row_mapping(serializer_class):
+    return RowMapping(serializer_class)
+
+
+def render_json(data, renderer=JSONRenderer):
+    if orjson is not None and not renderer.ensure_ascii and renderer.compact:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(
+            data, cls=renderer.encoder_class, ensure_ascii=renderer.ensure_ascii, allow_nan=not renderer.strict,
+            separators=(',', ':') if renderer.compact else (', ', ': '),
+        ).encode()
+    # JSONRenderer escapes these two so its output is valid JavaScript too.
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def accepts_plain_json(request):
+    media_type, params = parse_header_parameters(request.accepted_media_type or '')
+    return isinstance(request.accepted_renderer, JSONRenderer) and media_type == 'application/json' and 'indent' not in params
+
+
+class FastListMixin:
+    """
+    For ListAPIView subclasses: when FAST_SERIALIZATION is on, plain JSON
+    requests are answered from values() rows instead of the serializer.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not get_setting('FAST_SERIALIZATION') or not accepts_plain_json(request):
+            return super().list(request, *args, **kwargs)
+
+        mapping = row_mapping(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset())
+        paginator = self.paginator
+        if paginator is None:
+            data = mapping.serialize(list(mapping.values(queryset)))
+        else:
+            ordering = [name.lstrip('-') for name in paginator.ordering]
+            rows = paginator.page(list(mapping.values(paginator.page_queryset(queryset, request), *ordering)))
+            data = {'next': paginator.get_next_link(), 'results': mapping.serialize(rows)}
+        return HttpResponse(render_json(data, request.accepted_renderer), content_type=request.accepted_renderer.media_type)
@@ -0,0 +1,81 @@
+import math
+import threading
+from collections import defaultdict
+
+from .catalog import get_catalog_version
+from .models import City
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_DEGREES = 0.25
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell(latitude, longitude):
+    return math.floor(latitude / CELL_DEGREES), math.floor(longitude / CELL_DEGREES)
+
+
+class ServiceAreaIndex:
+    """
+    Fixed grid over latitude/longitude. Every city is registered in each cell
+    its service circle overlaps, so resolving a point only measures the
+    distance to the handful of cities sharing its cell.
+    """
+
+    def __init__(self, cities=(), version=None):
+        self.cells = defaultdict(list)
+        self.names = {}
+        self.version = version
+        for city in cities:
+            self.add(*city)
+
+    def add(self, city_id, name, latitude, longitude, radius_km):
+        self.names[city_id] = name
+        lat_span = radius_km / KM_PER_DEGREE
+        # Near the poles a degree of longitude shrinks to nothing; clamp so the
+        # span stays finite and simply covers every column.
+        lon_span = min(180.0, lat_span / max(math.cos(math.radians(latitude)), 1e-6))
+        low_row, low_column = cell(latitude - lat_span, longitude - lon_span)
+        high_row, high_column = cell(latitude + lat_span, longitude + lon_span)
+        entry = (city_id, latitude, longitude, radius_km)
+        for row in range(low_row, high_row + 1):
+            for column in range(low_column, high_column + 1):
+                self.cells[row, column].append(entry)
+
+    def locate(self, latitude, longitude):
+        # Overlapping service areas go to the city whose centre is nearest.
+        best, best_distance = None, None
+        for city_id, city_latitude, city_longitude, radius_km in self.cells.get(cell(latitude, longitude), ()):
+            distance = distance_km(latitude, longitude, city_latitude, city_longitude)
+            if distance <= radius_km and (best_distance is None or distance < best_distance):
+                best, best_distance = city_id, distance
+        return best
+
+
+_index = ServiceAreaIndex()
+_lock = threading.Lock()
+
+
+def service_area_index():
+    # City changes bump the catalog version, which is all it takes to rebuild.
+    global _index
+    version = get_catalog_version()
+    if _index.version != version:
+        with _lock:
+            if _index.version != version:
+                cities = City.objects.filter(
+                    latitude__isnull=False, longitude__isnull=False, radius_km__gt=0,
+                ).values_list('id', 'name', 'latitude', 'longitude', 'radius_km')
+                _index = ServiceAreaIndex(cities, version)
+    return _index
+
+
+def resolve_city(latitude, longitude):
+    index = service_area_index()
+    city_id = index.locate(latitude, longitude)
+    return (city_id, index.names[city_id]) if city_id is not None else (None, None)
@@ -0,0 +1,89 @@
+import functools
+import hashlib
+import json
+
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conf import get_setting
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+PENDING = 'pending'
+
+
+def shared_cache():
+    return caches[get_setting('IDEMPOTENCY_CACHE_ALIAS')]
+
+
+def record_key(request, key):
+    scope = f'{request.user.pk}:{request.method}:{request.path}:{key}'
+    return 'yes_madam_api:idempotency:' + hashlib.sha256(scope.encode()).hexdigest()
+
+
+def fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def replay(record, body):
+    if record['fingerprint'] != body:
+        return Response(
+            {"detail": f"{HEADER} was already used with a different request body"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record['state'] == PENDING:
+        return Response(
+            {"detail": f"A request with this {HEADER} is still being processed"},
+            status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'},
+        )
+    return Response(record['data'], status=record['status'], headers={REPLAYED_HEADER: 'true'})
+
+
+def idempotent(handler):
+    """
+    Lets clients retry a POST safely by sending an Idempotency-Key header.
+    The first request under a key runs normally and its response is kept
+    for IDEMPOTENCY_TTL seconds; retries with the same body get that
+    response back without the handler running again.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({"detail": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache = shared_cache()
+        cache_key = record_key(request, key)
+        body = fingerprint(request.data)
+
+        # cache.add is atomic, so exactly one of several concurrent requests
+        # claims the key; the others see its record. A record that expired
+        # between the two calls is reported as in flight and the client retries.
+        pending = {'state': PENDING, 'fingerprint': body}
+        if not cache.add(cache_key, pending, get_setting('IDEMPOTENCY_LOCK_TIMEOUT')):
+            return replay(cache.get(cache_key) or pending, body)
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        # Server errors are not final: release the key so a retry runs again.
+        if response.status_code >= 500:
+            cache.delete(cache_key)
+        else:
+            cache.set(cache_key, {
+                'state': 'done',
+                'fingerprint': body,
+                'status': response.status_code,
+                'data': response.data,
+            }, get_setting('IDEMPOTENCY_TTL'))
+        return response
+
+    return wrapper
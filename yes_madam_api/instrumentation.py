@@ -0,0 +1,180 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+from django.db import connection
+from django.utils import timezone
+
+from .conf import get_setting
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+FAMILIES = {
+    'request_duration_seconds': ('Time spent handling the request, rendering included.', LATENCY_BUCKETS),
+    'db_queries': ('SQL statements executed per request.', QUERY_BUCKETS),
+    'db_duration_seconds': ('Time spent in SQL statements per request.', LATENCY_BUCKETS),
+    'view_duration_seconds': ('Time spent in the view, serializers and SQL included, up to rendering.', LATENCY_BUCKETS),
+    'render_duration_seconds': ('Time spent rendering response data to the response body.', LATENCY_BUCKETS),
+}
+PREFIX = 'yes_madam_api_'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Per-process request metrics keyed by URL name, rendered in the Prometheus text exposition format. Observing a request
+    is a handful of list increments under one lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.requests = {}
+
+    def observe(self, route, method, status, values):
+        with self.lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for family, value in values.items():
+                histogram = self.histograms.get((family, route))
+                if histogram is None:
+                    histogram = self.histograms[family, route] = Histogram(FAMILIES[family][1])
+                histogram.observe(value)
+
+    def render(self):
+        with self.lock:
+            requests = sorted(self.requests.items())
+            histograms = sorted((key, list(h.counts), h.sum) for key, h in self.histograms.items())
+
+        lines = [
+            f'# HELP {PREFIX}requests_total Requests handled, by route, method and status.',
+            f'# TYPE {PREFIX}requests_total counter',
+        ]
+        for (route, method, status), count in requests:
+            lines.append(f'{PREFIX}requests_total{{route="{label(route)}",method="{method}",status="{status}"}} {count}')
+
+        for family, (help_text, buckets) in FAMILIES.items():
+            name = PREFIX + family
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (histogram_family, route), counts, total in histograms:
+                if histogram_family != family:
+                    continue
+                route = label(route)
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{route="{route}"}} {total}')
+                lines.append(f'{name}_count{{route="{route}"}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+slow_requests = deque(maxlen=get_setting('METRICS_SLOW_REQUEST_SAMPLES'))
+
+
+class QueryRecorder:
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            # Statements only, never parameters: samples must not leak user data.
+            if len(self.statements) < self.keep:
+                self.statements.append((sql, elapsed))
+
+
+class InstrumentationMiddleware:
+    """
+    Records latency, query count, query time, view time (serializers
+    included) and render time for every request under its URL name, and
+    keeps the SQL of the slowest ones.
+    Streaming responses are measured up to the first byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_after = get_setting('METRICS_SLOW_REQUEST_SECONDS')
+        self.keep = get_setting('METRICS_SLOW_REQUEST_STATEMENTS')
+
+    def __call__(self, request):
+        recorder = QueryRecorder(self.keep)
+        request.view_started = request.view_duration = None
+        request.render_duration = 0.0
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        if request.view_duration is None and request.view_started is not None:
+            # Not a DRF or template response: nothing was left to render.
+            request.view_duration = started + elapsed - request.view_started
+
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        metrics.observe(route, request.method, response.status_code, {
+            'request_duration_seconds': elapsed,
+            'db_queries': recorder.count,
+            'db_duration_seconds': recorder.duration,
+            'view_duration_seconds': request.view_duration or 0.0,
+            'render_duration_seconds': request.render_duration,
+        })
+        if elapsed >= self.slow_after:
+            slow_requests.append({
+                'at': timezone.now().isoformat(),
+                'route': route,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 3),
+                'db_duration_ms': round(recorder.duration * 1000, 3),
+                'queries': recorder.count,
+                'statements': [{'sql': sql, 'duration_ms': round(duration * 1000, 3)} for sql, duration in recorder.statements],
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The view and the next two hooks bracket the serializer work, which
+        # DRF does inside the view, without instrumenting DRF itself.
+        request.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns.
+        started = time.perf_counter()
+        if request.view_started is not None:
+            request.view_duration = started - request.view_started
+
+        def rendered(response):
+            request.render_duration = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
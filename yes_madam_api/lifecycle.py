@@ -0,0 +1,104 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .analytics import sync_booking_rollups
+from .conf import get_setting
+from .models import Booking, BookingService
+from .notifications import publish_booking_change_on_commit
+from .timeslots import parse_timeslot, release
+
+# Bookings in ``source`` that match ``condition(bookings, now)`` move to
+# ``target``. Rules run in order, so a paid Pending booking is confirmed
+# before the unpaid timeout can cancel it.
+Rule = namedtuple('Rule', 'name source target condition releases_seats')
+
+
+def paid(bookings, now):
+    return Q(payment__status='Success')
+
+
+def unpaid_timeout(bookings, now):
+    # A Pending payment may still be charged by the payment pipeline; the
+    # booking waits for its outcome rather than lose its seats under it.
+    cutoff = now - timedelta(seconds=get_setting('LIFECYCLE_UNPAID_TIMEOUT'))
+    return Q(booked_at__lt=cutoff) & ~Q(payment__status__in=('Success', 'Pending'))
+
+
+def slot_ended(bookings, now):
+    # The slot is stored as a label, so only the labels of the cutoff day are
+    # read and compared; any earlier day is over whatever its slot.
+    cutoff = timezone.localtime(now) - timedelta(seconds=get_setting('LIFECYCLE_COMPLETE_AFTER'))
+    ended = []
+    for label in bookings.filter(date=cutoff.date()).values_list('timeslot', flat=True).distinct():
+        try:
+            if parse_timeslot(label) <= cutoff.time():
+                ended.append(label)
+        except ValueError:
+            continue
+    return Q(date__lt=cutoff.date()) | Q(date=cutoff.date(), timeslot__in=ended)
+
+
+RULES = [
+    Rule('paid', 'Pending', 'Confirmed', paid, False),
+    Rule('unpaid_timeout', 'Pending', 'Cancelled', unpaid_timeout, True),
+    Rule('slot_ended', 'Confirmed', 'Completed', slot_ended, False),
+]
+
+
+def release_seats(booking_ids):
+    slots = []
+    for city_id, service_id, slot_date, label in BookingService.objects.filter(
+        booking_id__in=booking_ids, booking__city__isnull=False,
+    ).values_list('booking__city_id', 'service_id', 'booking__date', 'booking__timeslot'):
+        try:
+            slots.append((city_id, service_id, slot_date, parse_timeslot(label)))
+        except ValueError:
+            continue
+    release(slots)
+
+
+def advance_chunk(rule, condition, chunk_size):
+    with transaction.atomic():
+        # Another node working the same rule skips the rows locked here and
+        # takes the next ones, so schedulers can run side by side.
+        rows = list(
+            Booking.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(condition, status=rule.source)
+            .order_by('date', 'id')
+            .values_list('id', 'booking_id')[:chunk_size]
+        )
+        if not rows:
+            return 0, 0
+        booking_ids = [booking_id for booking_id, _ in rows]
+        moved = Booking.objects.filter(id__in=booking_ids, status=rule.source).update(status=rule.target)
+        if rule.releases_seats:
+            release_seats(booking_ids)
+        # update() skips the model signals; do their work for the whole chunk.
+        sync_booking_rollups(booking_ids)
+        for _, reference in rows:
+            publish_booking_change_on_commit(reference)
+    return len(rows), moved
+
+
+def advance_bookings(now=None, chunk_size=None):
+    """
+    Apply every lifecycle rule with set-based UPDATEs of at most
+    ``chunk_size`` bookings per transaction, until nothing matches.
+    Returns the number of bookings moved by each rule.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or get_setting('LIFECYCLE_CHUNK_SIZE')
+    moved = {}
+    for rule in RULES:
+        condition = rule.condition(Booking.objects.filter(status=rule.source), now)
+        moved[rule.name] = 0
+        while True:
+            selected, count = advance_chunk(rule, condition, chunk_size)
+            moved[rule.name] += count
+            if selected < chunk_size:
+                break
+    return moved
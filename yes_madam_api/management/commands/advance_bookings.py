@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from yes_madam_api.lifecycle import advance_bookings
+
+
+class Command(BaseCommand):
+    help = (
+        'Move bookings along their lifecycle: paid Pending bookings are confirmed, unpaid ones cancelled after '
+        'LIFECYCLE_UNPAID_TIMEOUT, and Confirmed bookings completed once their slot has passed. Safe to run on '
+        'several nodes at once; with --loop it keeps running every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='Defaults to the LIFECYCLE_CHUNK_SIZE setting.')
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            moved = advance_bookings(chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{timezone.now().isoformat()} '
+                + ', '.join(f'{name}: {count}' for name, count in moved.items())
+                + f' ({elapsed:.2f}s)'
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from yes_madam_api.archive import archive_batch
+from yes_madam_api.conf import get_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Move completed and cancelled bookings older than the cutoff, with their lines, payment and review, '
+        'into the archive tables, one small transaction per batch. Safe to stop and run again at any time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None, help='Defaults to the ARCHIVE_AFTER_DAYS setting.')
+        parser.add_argument('--before', type=date.fromisoformat, default=None, help='Cutoff date (YYYY-MM-DD); overrides --older-than-days.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        cutoff = options['before']
+        if cutoff is None:
+            days = options['older_than_days']
+            cutoff = date.today() - timedelta(days=get_setting('ARCHIVE_AFTER_DAYS') if days is None else days)
+
+        last_id, archived, batches = 0, 0, 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            booking_ids = archive_batch(cutoff, options['batch_size'], after=last_id)
+            if not booking_ids:
+                break
+            last_id = booking_ids[-1]
+            archived += len(booking_ids)
+            batches += 1
+            self.stdout.write(f'{archived} bookings archived')
+            # Give live traffic room between batches.
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} bookings dated before {cutoff}'))
@@ -0,0 +1,295 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.urls import resolve, reverse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from yes_madam_api import async_views, views
+from yes_madam_api.authentication import CachedTokenAuthentication, local_tokens
+from yes_madam_api.fastpath import render_json, row_mapping
+from yes_madam_api.models import User, Category, Service, ServiceRating, Cart, Booking, BookingService, Payment
+from yes_madam_api.search import ServiceSearchIndex
+from yes_madam_api.serializers import AdminBookingListSerializer, BookingHistorySerializer, CartItemSerializer
+from yes_madam_api.throttling import Throttle, ThrottleMiddleware
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run an in-process benchmark against the configured database and print throughput '
+        'before and after an optimisation. Fixtures are created in a transaction that is rolled back.'
+    )
+    scenarios = {
+        'async': 'bench_async',
+        'auth': 'bench_auth',
+        'search': 'bench_search',
+        'serialize': 'bench_serialize',
+        'throttle': 'bench_throttle',
+    }
+    # Scenarios that serve requests from other threads, which cannot see an
+    # uncommitted transaction; they commit their fixtures and delete them after.
+    committed_scenarios = {'async'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios))
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per variant.')
+        parser.add_argument('--size', type=int, default=100000, help='Rows of synthetic data, where the scenario uses any.')
+        parser.add_argument('--concurrency', type=int, default=1000, help='Requests in flight at once (async scenario).')
+        parser.add_argument('--workers', type=int, default=32, help='Worker threads serving the sync views (async scenario).')
+
+    def handle(self, *args, **options):
+        self.options = options
+        bench = getattr(self, self.scenarios[options['scenario']])
+        if options['scenario'] in self.committed_scenarios:
+            bench(options['requests'], options['size'])
+            return
+        with transaction.atomic():
+            bench(options['requests'], options['size'])
+            transaction.set_rollback(True)
+
+    def run(self, label, count, send):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            for _ in range(count):
+                send()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:28} {count / elapsed:10.0f} req/s {counter.count / count:8.2f} queries/req')
+
+    def latencies(self, label, samples):
+        samples = sorted(samples)
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        self.stdout.write(
+            f'{label:28} p50 {statistics.median(samples) * 1000:8.3f} ms  p99 {p99 * 1000:8.3f} ms  max {samples[-1] * 1000:8.3f} ms'
+        )
+
+    def run_concurrently(self, label, count, concurrency, send):
+        # A closed loop of ``concurrency`` clients; latency is measured from
+        # the moment a client sends, so it includes time queued for a worker.
+        async def main():
+            gate = asyncio.Semaphore(concurrency)
+            samples = []
+
+            async def client():
+                async with gate:
+                    started = time.perf_counter()
+                    await send()
+                    samples.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(count)))
+            return samples, time.perf_counter() - started
+
+        # Run the loop on a fresh thread: it must not inherit this thread's
+        # database connection through the context.
+        result = []
+        thread = threading.Thread(target=lambda: result.append(asyncio.run(main())))
+        thread.start()
+        thread.join()
+        samples, elapsed = result[0]
+        self.stdout.write(f'{label:28} {count / elapsed:10.0f} req/s')
+        self.latencies(label, samples)
+
+    def bench_async(self, count, size):
+        concurrency, workers = self.options['concurrency'], self.options['workers']
+        user = User.objects.create_user(username='bench-async', email='bench-async@example.com', phone='0000000001')
+        category = Category.objects.create(name='bench-async')
+        try:
+            token = Token.objects.create(user=user)
+            services = Service.objects.bulk_create([
+                Service(category=category, name=f'Bench service {i}', price=Decimal('499.00'), duration='45 mins', description='Benchmark')
+                for i in range(10)
+            ])
+            Cart.objects.add_items(user.id, {service.id: 1 for service in services[:3]})
+            bookings = Booking.objects.bulk_create([
+                Booking(user=user, booking_id=f'YB{i:06d}', date=date.today(), timeslot='10:00 AM', address='Bench',
+                        total_amount=Decimal('1497.00'), status='Confirmed')
+                for i in range(min(size, 500))
+            ])
+            BookingService.objects.bulk_create([
+                BookingService(booking=booking, service=service, quantity=1, price_at_booking=service.price)
+                for booking in bookings for service in services[:3]
+            ])
+            Payment.objects.create(booking=bookings[0], payment_method='UPI', transaction_id='TXNBENCH0001', status='Success')
+
+            factory = APIRequestFactory()
+            headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+            targets = [
+                ('ServiceByCategoryView', '/', None, {'category_id': category.id}),
+                ('ViewCartView', '/', {'user_id': user.id}, {}),
+                ('BookingHistoryView', '/', {'user_id': user.id}, {}),
+                ('PaymentStatusView', '/', None, {'booking_id': bookings[0].booking_id}),
+            ]
+            self.stdout.write(f'{count} requests per variant, {concurrency} concurrent, {workers} sync workers')
+            with ThreadPoolExecutor(workers) as pool:
+                for name, path, params, kwargs in targets:
+                    sync_view = getattr(views, name).as_view()
+                    async_view = getattr(async_views, name).as_view()
+
+                    def call_sync():
+                        sync_view(factory.get(path, params, **headers), **kwargs).render()
+
+                    async def send_sync():
+                        await asyncio.get_running_loop().run_in_executor(pool, call_sync)
+
+                    async def send_async():
+                        # One thread-sensitive context per request, as under an
+                        # ASGI server, which also closes connections at the end.
+                        async with ThreadSensitiveContext():
+                            await async_view(factory.get(path, params, **headers), **kwargs)
+                            await sync_to_async(close_old_connections)()
+
+                    self.run_concurrently(f'{name} (sync)', count, concurrency, send_sync)
+                    self.run_concurrently(f'{name} (async)', count, concurrency, send_async)
+        finally:
+            user.delete()
+            category.delete()
+
+    def bench_auth(self, count, size):
+        user = User.objects.create_user(username='bench', email='bench@example.com', phone='0000000000')
+        token = Token.objects.create(user=user)
+        factory = APIRequestFactory()
+
+        for label, authentication in [('TokenAuthentication', TokenAuthentication), ('CachedTokenAuthentication', CachedTokenAuthentication)]:
+            local_tokens.clear()
+            view = views.ViewCartView.as_view(authentication_classes=[authentication])
+
+            def send():
+                request = factory.get('/cart/', {'user_id': user.id}, HTTP_AUTHORIZATION=f'Token {token.key}')
+                view(request).render()
+
+            self.run(label, count, send)
+
+    def bench_search(self, count, size):
+        rng = random.Random(42)
+        words = ['facial', 'waxing', 'manicure', 'pedicure', 'massage', 'threading', 'bleach', 'cleanup', 'hair',
+                 'spa', 'keratin', 'smoothening', 'detan', 'polish', 'gel', 'aroma', 'deep', 'tissue', 'bridal', 'makeup']
+        vocabulary = words + [f'{rng.choice(words)}{n}' for n in range(5000)]
+        categories = [f'{word} care' for word in words]
+
+        index = ServiceSearchIndex()
+        started = time.perf_counter()
+        for service_id in range(size):
+            index.add(
+                service_id,
+                ' '.join(rng.choices(vocabulary, k=3)),
+                ' '.join(rng.choices(vocabulary, k=12)),
+                rng.choice(categories),
+            )
+        self.stdout.write(f'Indexed {size} services in {time.perf_counter() - started:.2f} s')
+
+        queries = {
+            'exact': lambda: rng.choice(words),
+            'prefix': lambda: rng.choice(words)[:3],
+            'typo': lambda: (lambda word: word[:2] + word[3:])(rng.choice(words)),
+            'two terms': lambda: f'{rng.choice(words)} {rng.choice(words)[:4]}',
+        }
+        for label, make_query in queries.items():
+            samples = []
+            for _ in range(count):
+                query = make_query()
+                started = time.perf_counter()
+                index.search(query, 10)
+                samples.append(time.perf_counter() - started)
+            self.latencies(f'search ({label})', samples)
+
+    def bench_serialize(self, count, size):
+        # Rows per second through the DRF serializers and JSONRenderer against
+        # the values() fast path, over the same querysets the list views use.
+        user = User.objects.create_user(username='bench-serialize', email='bench-serialize@example.com', phone='0000000002')
+        category = Category.objects.create(name='bench-serialize')
+        services = Service.objects.bulk_create([
+            Service(category=category, name=f'Bench service {i}', price=Decimal('499.00') + i, duration='45 mins', description='Benchmark')
+            for i in range(50)
+        ])
+        ServiceRating.objects.record([service.id for service in services[::2]], 4)
+        Cart.objects.bulk_create([Cart(user=user, service=service, quantity=2) for service in services])
+        for start in range(0, size, 5000):
+            bookings = Booking.objects.bulk_create([
+                Booking(user=user, booking_id=f'SB{i:08d}', date=date.today(), timeslot='10:00 AM', address='Bench',
+                        total_amount=Decimal('1497.00'), status='Confirmed')
+                for i in range(start, min(start + 5000, size))
+            ])
+            BookingService.objects.bulk_create([
+                BookingService(booking=booking, service=service, quantity=1, price_at_booking=service.price)
+                for booking in bookings for service in services[:3]
+            ])
+
+        bookings = Booking.objects.filter(user=user).order_by('-booked_at', '-id')
+        targets = [
+            ('booking history', BookingHistorySerializer, bookings.prefetch_related(views.booking_lines_prefetch())),
+            ('admin booking list', AdminBookingListSerializer,
+             bookings.select_related('user').prefetch_related(views.booking_lines_prefetch())),
+            ('cart', CartItemSerializer,
+             Cart.objects.filter(user=user).select_related('service__rating').annotate(total=F('quantity') * F('service__price'))),
+        ]
+        for label, serializer_class, queryset in targets:
+            mapping = row_mapping(serializer_class)
+            variants = [
+                ('serializer', lambda: JSONRenderer().render(serializer_class(list(queryset), many=True).data)),
+                ('fast path', lambda: render_json(mapping.serialize(list(mapping.values(queryset))))),
+            ]
+            rows = queryset.count()
+            for variant, render in variants:
+                timings = []
+                for _ in range(3):
+                    started = time.perf_counter()
+                    render()
+                    timings.append(time.perf_counter() - started)
+                self.stdout.write(f'{f"{label} ({variant})":40} {rows / min(timings):12.0f} rows/s')
+
+    def bench_throttle(self, count, size):
+        # What the throttle adds to requests it lets through, spread over
+        # --size client IPs, and what a rejected request costs.
+        factory = APIRequestFactory()
+        view = views.CityListView.as_view()
+        path = reverse('city-list')
+        match = resolve(path)
+
+        def middleware(limit, cache_alias=None):
+            throttle = ThrottleMiddleware(view)
+            throttle.rates = {match.view_name: [('ip', limit, 60)]}
+            throttle.throttle = Throttle(size, cache_alias)
+            return throttle
+
+        variants = [
+            ('no throttle', None),
+            ('throttle (local)', middleware(count * 2)),
+            ('throttle (shared cache)', middleware(count * 2, 'default')),
+            ('throttle (rejecting)', middleware(0)),
+        ]
+        for label, throttle in variants:
+            clients = iter(range(count))
+
+            def send():
+                n = next(clients) % size
+                request = factory.get(path, REMOTE_ADDR=f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}')
+                request.resolver_match = match
+                response = throttle.process_view(request, view, (), {}) if throttle else None
+                if response is None:
+                    view(request).render()
+
+            self.run(label, count, send)
+
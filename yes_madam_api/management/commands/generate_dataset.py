@@ -0,0 +1,181 @@
+import random
+import zlib
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from yes_madam_api.catalog import bump_catalog_version
+from yes_madam_api.models import User, City, Category, Service, Cart, Booking, BookingService, Payment, Review
+from yes_madam_api.search import invalidate_search_index
+
+STATUSES = ['Completed', 'Confirmed', 'Cancelled', 'Pending']
+STATUS_WEIGHTS = [60, 25, 10, 5]
+RATING_WEIGHTS = [4, 6, 15, 35, 40]
+TIMESLOTS = ['8:00 AM', '10:00 AM', '12:00 PM', '3:00 PM', '5:00 PM', '7:00 PM']
+METHODS = ['UPI', 'Card', 'Cash']
+DURATIONS = ['30 mins', '45 mins', '60 mins', '90 mins']
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a deterministic synthetic dataset of cities, categories, services, users, carts, '
+        'bookings with their lines, payments and reviews using bulk inserts. The same --seed and '
+        '--prefix always produce the same rows; use another prefix to add a second dataset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--cities', type=int, default=20)
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--services-per-category', type=int, default=25)
+        parser.add_argument('--bookings-per-user', type=int, default=5)
+        parser.add_argument('--lines-per-booking', type=int, default=3, help='Upper bound; each booking gets 1 to this many.')
+        parser.add_argument('--cart-lines', type=int, default=2, help='Upper bound of open cart lines per user.')
+        parser.add_argument('--review-rate', type=float, default=0.5, help='Share of completed bookings that are reviewed.')
+        parser.add_argument('--password', default='password', help='Password of every generated user.')
+        parser.add_argument('--prefix', default='gen', help='Prefix of generated names and ids, at most 6 characters.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--timeslot-days', type=int, default=8, help='Days of timeslots opened in every city, from today.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Users generated and inserted per transaction.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if not 0 < len(prefix) <= 6 or not prefix.isalnum():
+            raise CommandError('--prefix must be 1 to 6 letters or digits')
+        self.rng = random.Random(options['seed'])
+        self.prefix = prefix
+        self.options = options
+
+        with transaction.atomic():
+            cities = self.create_cities()
+            services = self.create_catalog()
+        # One hash for everyone: hashing a million passwords would dominate the run.
+        password = make_password(options['password'])
+        counts = {'users': 0, 'carts': 0, 'bookings': 0, 'lines': 0, 'payments': 0, 'reviews': 0}
+
+        for start in range(0, options['users'], options['batch_size']):
+            stop = min(start + options['batch_size'], options['users'])
+            with transaction.atomic():
+                for name, created in self.create_users(range(start, stop), password, cities, services).items():
+                    counts[name] += created
+            self.stdout.write(f'{stop} of {options["users"]} users generated')
+
+        for city in cities:
+            if options['timeslot_days']:
+                call_command('open_timeslots', city=city.name, days=options['timeslot_days'], stdout=self.stdout)
+        call_command('rebuild_service_ratings', stdout=self.stdout)
+        call_command('rebuild_analytics', stdout=self.stdout)
+        bump_catalog_version()
+        invalidate_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(cities)} cities, {len(services)} services, '
+            + ', '.join(f'{count} {name}' for name, count in counts.items())
+        ))
+
+    def create_cities(self):
+        cities = [
+            City(
+                name=f'{self.prefix} city {i}',
+                latitude=round(self.rng.uniform(8.0, 32.0), 4),
+                longitude=round(self.rng.uniform(70.0, 90.0), 4),
+                radius_km=self.rng.choice([15, 25, 40]),
+            )
+            for i in range(self.options['cities'])
+        ]
+        return City.objects.bulk_create(cities, batch_size=self.options['batch_size'])
+
+    def create_catalog(self):
+        categories = Category.objects.bulk_create([
+            Category(name=f'{self.prefix} category {i}')
+            for i in range(self.options['categories'])
+        ])
+        services = [
+            Service(
+                category=category,
+                name=f'{category.name} service {i}',
+                price=Decimal(self.rng.randrange(199, 4999, 50)),
+                duration=self.rng.choice(DURATIONS),
+                description=f'Generated service {i} of {category.name}',
+            )
+            for category in categories
+            for i in range(self.options['services_per_category'])
+        ]
+        return Service.objects.bulk_create(services, batch_size=self.options['batch_size'])
+
+    def create_users(self, numbers, password, cities, services):
+        rng, prefix = self.rng, self.prefix
+        # Phones are unique across the whole table, so they start with a
+        # number derived from the prefix.
+        phone_prefix = f'{zlib.crc32(prefix.encode()) % 10000:04d}'
+        users = User.objects.bulk_create([
+            User(
+                username=f'{prefix}_user{n}',
+                email=f'{prefix}_user{n}@example.com',
+                phone=f'{phone_prefix}{n:09d}',
+                password=password,
+                city=rng.choice(cities) if cities else None,
+            )
+            for n in numbers
+        ], batch_size=self.options['batch_size'])
+
+        carts = [
+            Cart(user=user, service=service, quantity=rng.randint(1, 3))
+            for user in users
+            for service in rng.sample(services, min(len(services), rng.randint(0, self.options['cart_lines'])))
+        ]
+        Cart.objects.bulk_create(carts, batch_size=self.options['batch_size'])
+
+        bookings, lines = [], []
+        today = date.today()
+        for user, n in zip(users, numbers):
+            for k in range(self.options['bookings_per_user']):
+                picked = rng.sample(services, min(len(services), rng.randint(1, self.options['lines_per_booking'])))
+                quantities = [rng.randint(1, 2) for _ in picked]
+                booking_status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+                offset = -rng.randint(1, 365) if booking_status in ('Completed', 'Cancelled') else rng.randint(0, 30)
+                bookings.append(Booking(
+                    user=user,
+                    booking_id=f'{prefix.upper()}{n:010d}{k:02d}',
+                    date=today + timedelta(days=offset),
+                    timeslot=rng.choice(TIMESLOTS),
+                    address=f'{n} Generated Street',
+                    total_amount=sum(service.price * quantity for service, quantity in zip(picked, quantities)),
+                    status=booking_status,
+                    city_id=user.city_id,
+                ))
+                lines.append(list(zip(picked, quantities)))
+        Booking.objects.bulk_create(bookings, batch_size=self.options['batch_size'])
+
+        booking_lines, payments, reviews = [], [], []
+        for booking, picked in zip(bookings, lines):
+            booking_lines.extend(
+                BookingService(booking=booking, service=service, quantity=quantity, price_at_booking=service.price)
+                for service, quantity in picked
+            )
+            if booking.status in ('Completed', 'Confirmed', 'Pending'):
+                paid = booking.status != 'Pending'
+                payments.append(Payment(
+                    booking=booking,
+                    payment_method=rng.choice(METHODS),
+                    transaction_id=f'TXN-{booking.booking_id}' if paid else None,
+                    status='Success' if paid else 'Pending',
+                ))
+            if booking.status == 'Completed' and rng.random() < self.options['review_rate']:
+                reviews.append(Review(
+                    booking=booking,
+                    user_id=booking.user_id,
+                    rating=rng.choices(range(1, 6), RATING_WEIGHTS)[0],
+                    review_text=rng.choice(['', 'Great service', 'On time and friendly', 'Could be better']),
+                ))
+        BookingService.objects.bulk_create(booking_lines, batch_size=self.options['batch_size'])
+        Payment.objects.bulk_create(payments, batch_size=self.options['batch_size'])
+        Review.objects.bulk_create(reviews, batch_size=self.options['batch_size'])
+
+        return {
+            'users': len(users), 'carts': len(carts), 'bookings': len(bookings),
+            'lines': len(booking_lines), 'payments': len(payments), 'reviews': len(reviews),
+        }
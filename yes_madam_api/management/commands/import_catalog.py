@@ -0,0 +1,126 @@
+import csv
+import itertools
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework import serializers
+
+from yes_madam_api.catalog import bump_catalog_version
+from yes_madam_api.models import City, Category, Service
+from yes_madam_api.search import invalidate_search_index
+from yes_madam_api.serializers import AdminAddServiceSerializer, CategorySerializer, CitySerializer
+
+
+# The import upserts, so the per-row uniqueness checks of the API serializers
+# are dropped; the database constraints decide between insert and update.
+class CityRowSerializer(CitySerializer):
+    class Meta(CitySerializer.Meta):
+        extra_kwargs = {'name': {'validators': []}}
+
+
+class CategoryRowSerializer(CategorySerializer):
+    class Meta(CategorySerializer.Meta):
+        extra_kwargs = {'name': {'validators': []}}
+
+
+class ServiceRowSerializer(AdminAddServiceSerializer):
+    category = serializers.CharField(max_length=100)
+
+    class Meta(AdminAddServiceSerializer.Meta):
+        validators = []
+
+    def validate_category(self, value):
+        # Categories are resolved by name once per chunk, not once per row.
+        try:
+            return self.context['categories'][value]
+        except KeyError:
+            raise serializers.ValidationError(f'Unknown category {value!r}')
+
+
+MODELS = {
+    'city': (City, CityRowSerializer, ['name'], []),
+    'category': (Category, CategoryRowSerializer, ['name'], []),
+    'service': (Service, ServiceRowSerializer, ['category', 'name'], ['price', 'duration', 'description']),
+}
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream cities, categories or services from a CSV or JSONL file and upsert them in batches. '
+        'Rows are validated with the API serializers; services are matched on (category, name).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS))
+        parser.add_argument('path', help="Input file, or '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-errors', type=int, default=20, help='Invalid rows to print before going quiet.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            processed, written, invalid = self.import_rows(read_rows(stream, fmt), options)
+        except (csv.Error, json.JSONDecodeError) as exc:
+            raise CommandError(f'Could not parse input: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            # Each batch commits on its own, so a failed import may still have
+            # changed the catalog.
+            bump_catalog_version()
+            invalidate_search_index()
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {written} of {processed} rows ({invalid} invalid)'))
+
+    def import_rows(self, rows, options):
+        model, row_serializer, unique_fields, update_fields = MODELS[options['model']]
+        processed = written = invalid = 0
+        numbered = enumerate(rows, start=1)
+
+        while True:
+            chunk = list(itertools.islice(numbered, options['batch_size']))
+            if not chunk:
+                return processed, written, invalid
+
+            context = {}
+            if model is Service:
+                names = {row.get('category') for _, row in chunk}
+                context['categories'] = {category.name: category for category in Category.objects.filter(name__in=names)}
+
+            objects = {}
+            for line, row in chunk:
+                serializer = row_serializer(data=row, context=context)
+                if not serializer.is_valid():
+                    invalid += 1
+                    if invalid <= options['max_errors']:
+                        self.stderr.write(f'row {line}: {json.dumps(serializer.errors)}')
+                    continue
+                obj = model(**serializer.validated_data)
+                # The last occurrence of a key within a chunk wins.
+                objects[tuple(getattr(obj, field) for field in unique_fields)] = obj
+
+            with transaction.atomic():
+                if update_fields:
+                    model.objects.bulk_create(
+                        objects.values(), update_conflicts=True,
+                        unique_fields=unique_fields, update_fields=update_fields,
+                    )
+                else:
+                    model.objects.bulk_create(objects.values(), ignore_conflicts=True)
+
+            processed += len(chunk)
+            written += len(objects)
+            self.stdout.write(f'{processed} rows processed, {written} upserted, {invalid} invalid')
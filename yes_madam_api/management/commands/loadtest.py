@@ -0,0 +1,163 @@
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+# Every step of one booking flow, with the statuses that count as success.
+# Rating only succeeds once a booking is Completed, so a 400 is expected for
+# the booking the flow has just made.
+STEPS = [
+    ('register', (201,)),
+    ('login', (200,)),
+    ('city-list', (200,)),
+    ('category-list', (200,)),
+    ('services-by-category', (200,)),
+    ('add-to-cart', (200,)),
+    ('view-cart', (200,)),
+    ('confirm-booking', (201,)),
+    ('initiate-payment', (202,)),
+    ('submit-rating', (201, 400)),
+]
+
+
+class Session:
+    def __init__(self, base_url, timeout, record):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.record = record
+        self.token = None
+
+    def call(self, step, method, path, data=None, params=None):
+        url = urljoin(self.base_url, path) + (f'?{urlencode(params)}' if params else '')
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+            if method == 'POST':
+                headers['Idempotency-Key'] = uuid.uuid4().hex
+        body = json.dumps(data).encode() if data is not None else None
+
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, data=body, headers=headers, method=method), timeout=self.timeout) as response:
+                status, payload = response.status, response.read()
+        except HTTPError as exc:
+            status, payload = exc.code, exc.read()
+        except (URLError, OSError):
+            status, payload = None, b''
+        self.record(step, time.perf_counter() - started, status)
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the booking flow (register, login, browse, cart/add, book, payment/initiate, rate) '
+        'end to end against a running server from concurrent virtual users, then report '
+        'per-endpoint throughput and latency percentiles.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/api/')
+        parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users.')
+        parser.add_argument('--iterations', type=int, default=5, help='Flows each virtual user runs.')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds before a request counts as failed.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/') + '/'
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+        run = uuid.uuid4().int % 10 ** 5
+
+        threads = [
+            threading.Thread(target=self.virtual_user, args=(base_url, options, run, number))
+            for number in range(options['users'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.report(time.perf_counter() - started)
+
+    def record(self, step, elapsed, status):
+        with self.lock:
+            self.samples[step].append(elapsed)
+            self.statuses[step][status] += 1
+
+    def virtual_user(self, base_url, options, run, number):
+        rng = random.Random(options['seed'] * 100003 + number)
+        for iteration in range(options['iterations']):
+            self.flow(Session(base_url, options['timeout'], self.record), rng, f'{run:05d}{number:05d}{iteration:04d}')
+
+    def flow(self, session, rng, ident):
+        password = 'loadtest-password'
+        status, body = session.call('register', 'POST', 'register/', {
+            'username': f'load{ident}', 'email': f'load{ident}@example.com', 'phone': ident[:15], 'password': password,
+        })
+        if status != 201:
+            return
+        user_id = body['user_id']
+        status, body = session.call('login', 'POST', 'login/', {'phone': ident[:15], 'password': password})
+        if status != 200:
+            return
+        session.token = body['token']
+
+        status, cities = session.call('city-list', 'GET', 'cities/')
+        if status != 200 or not cities:
+            return
+        status, categories = session.call('category-list', 'GET', 'categories/')
+        if status != 200 or not categories:
+            return
+        category = rng.choice(categories)
+        status, services = session.call('services-by-category', 'GET', f"categories/{category['id']}/services/")
+        if status != 200 or not services:
+            return
+
+        for service in rng.sample(services, min(len(services), rng.randint(1, 3))):
+            session.call('add-to-cart', 'POST', 'cart/add/', {'user_id': user_id, 'service_id': service['id'], 'quantity': 1})
+        status, cart = session.call('view-cart', 'GET', 'cart/', params={'user_id': user_id})
+        if status != 200 or not cart:
+            return
+
+        status, booking = session.call('confirm-booking', 'POST', 'book/', {
+            'user_id': user_id, 'cart_ids': [line['id'] for line in cart], 'city_id': rng.choice(cities)['id'],
+            'date': (date.today() + timedelta(days=rng.randint(1, 7))).isoformat(),
+            'timeslot': '10:00 AM', 'address': f'{ident} Load Test Road',
+        })
+        if status != 201:
+            return
+        session.call('initiate-payment', 'POST', 'payment/initiate/', {
+            'booking_id': booking['booking_id'], 'payment_method': rng.choice(['UPI', 'Card']),
+        })
+        session.call('submit-rating', 'POST', 'rate/', {'booking_id': booking['booking_id'], 'rating': rng.randint(1, 5)})
+
+    def report(self, elapsed):
+        self.stdout.write(f'{"endpoint":22} {"requests":>9} {"errors":>7} {"req/s":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+        for step, expected in STEPS:
+            samples = sorted(self.samples.get(step, ()))
+            if not samples:
+                continue
+            errors = sum(count for status, count in self.statuses[step].items() if status not in expected)
+
+            def percentile(share):
+                return samples[min(len(samples) - 1, int(len(samples) * share))] * 1000
+
+            self.stdout.write(
+                f'{step:22} {len(samples):9d} {errors:7d} {len(samples) / elapsed:8.1f} '
+                f'{statistics.median(samples) * 1000:9.1f} {percentile(0.95):9.1f} {percentile(0.99):9.1f} {samples[-1] * 1000:9.1f}'
+            )
+        total = sum(len(samples) for samples in self.samples.values())
+        self.stdout.write(f'{total} requests in {elapsed:.1f} s ({total / elapsed:.1f} req/s)')
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from yes_madam_api.models import City, Service, TimeslotCapacity
+from yes_madam_api.timeslots import parse_timeslot
+
+
+class Command(BaseCommand):
+    help = 'Open bookable timeslots for every service in a city over a range of days. Existing slots are left untouched.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--city', required=True, help='City name.')
+        parser.add_argument('--category', help='Only open slots for services in this category.')
+        parser.add_argument('--start', type=date.fromisoformat, default=None, help='First day (YYYY-MM-DD), defaults to today.')
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--times', default='10:00 AM,12:00 PM,3:00 PM,5:00 PM', help='Comma-separated slot labels.')
+        parser.add_argument('--capacity', type=int, default=4, help='Concurrent bookings allowed per slot.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            city = City.objects.get(name=options['city'])
+        except City.DoesNotExist:
+            raise CommandError(f"City {options['city']!r} does not exist")
+        try:
+            times = [parse_timeslot(label) for label in options['times'].split(',')]
+        except ValueError:
+            raise CommandError('Timeslots must look like "10:00 AM"')
+
+        services = Service.objects.all()
+        if options['category']:
+            services = services.filter(category__name=options['category'])
+        service_ids = list(services.values_list('id', flat=True))
+        start = options['start'] or date.today()
+        days = [start + timedelta(days=offset) for offset in range(options['days'])]
+
+        slots = [
+            TimeslotCapacity(city=city, service_id=service_id, date=day, start_time=start_time, capacity=options['capacity'])
+            for service_id in service_ids
+            for day in days
+            for start_time in times
+        ]
+        TimeslotCapacity.objects.bulk_create(slots, batch_size=options['batch_size'], ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Opened up to {len(slots)} slots for {len(service_ids)} services in {city.name} from {start} for {len(days)} days'
+        ))
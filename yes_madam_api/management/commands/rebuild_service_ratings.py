@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from yes_madam_api.catalog import bump_catalog_version
+from yes_madam_api.models import ArchivedBookingService, BookingService, Service, ServiceRating
+
+SUMMARY_FIELDS = ['count', 'total', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5']
+
+
+class Command(BaseCommand):
+    help = 'Recompute every service rating summary from the reviews, a batch of services at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        last_id = 0
+        rebuilt = 0
+        while True:
+            service_ids = list(
+                Service.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not service_ids:
+                break
+            last_id = service_ids[-1]
+
+            summaries = {service_id: ServiceRating(service_id=service_id) for service_id in service_ids}
+            # Archived bookings keep their reviews, and still count.
+            for lines in (BookingService, ArchivedBookingService):
+                counts = (
+                    lines.objects.filter(service_id__in=service_ids, booking__review__isnull=False)
+                    .values_list('service_id', 'booking__review__rating')
+                    .annotate(reviews=Count('id'))
+                    .order_by()
+                )
+                for service_id, stars, reviews in counts:
+                    summary = summaries[service_id]
+                    summary.count += reviews
+                    summary.total += stars * reviews
+                    setattr(summary, f'stars_{stars}', getattr(summary, f'stars_{stars}') + reviews)
+
+            with transaction.atomic():
+                ServiceRating.objects.bulk_create(
+                    summaries.values(), update_conflicts=True,
+                    unique_fields=['service'], update_fields=SUMMARY_FIELDS,
+                )
+            rebuilt += len(service_ids)
+            self.stdout.write(f'{rebuilt} services rebuilt')
+
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating summaries for {rebuilt} services'))
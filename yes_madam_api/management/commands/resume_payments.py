@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from yes_madam_api.payments import payment_pipeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Charge payments that have been Pending for longer than PAYMENT_RESUME_AFTER, e.g. after a restart lost '
+        'the in-memory payment queue, and wait for the outcomes. With --loop it keeps running every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, default=None, help='Seconds; defaults to the PAYMENT_RESUME_AFTER setting.')
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            queued = payment_pipeline.resume_pending(options['older_than'])
+            payment_pipeline.wait()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{timezone.now().isoformat()} resumed {queued} payments ({elapsed:.2f}s)')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
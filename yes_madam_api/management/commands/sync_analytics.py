@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from yes_madam_api.analytics import sync_pending_rollups
+from yes_madam_api.conf import get_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply the booking and payment changes queued since the last run to the analytics rollups, a batch of '
+        'bookings at a time. Safe to run on several nodes at once; with --loop it keeps running every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Defaults to the ANALYTICS_SYNC_BATCH_SIZE setting.')
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or get_setting('ANALYTICS_SYNC_BATCH_SIZE')
+        while True:
+            started = time.perf_counter()
+            synced = sync_pending_rollups(batch_size)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{timezone.now().isoformat()} {synced} bookings synced ({elapsed:.2f}s)')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
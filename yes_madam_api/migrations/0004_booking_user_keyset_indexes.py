@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('yes_madam_api', '0003_category_booking_payment_review_service_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', '-booked_at', '-id'], name='booking_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-booked_at', '-id'], name='booking_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-date_joined', '-id'], name='user_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0004_booking_user_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='city',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='yes_madam_api.city'),
+        ),
+        migrations.CreateModel(
+            name='TimeslotCapacity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeslots', to='yes_madam_api.city')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeslots', to='yes_madam_api.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service', 'date', 'start_time'], name='timeslot_service_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('service', 'city', 'date', 'start_time'), name='unique_timeslot'), models.CheckConstraint(condition=models.Q(('booked__lte', models.F('capacity'))), name='timeslot_not_overbooked')],
+            },
+        ),
+    ]
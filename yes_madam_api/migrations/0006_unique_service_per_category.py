@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:07
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+# (model, fields that are unique together with the service, fields summed on a clash)
+SERVICE_REFERENCES = [
+    ('BookingService', ['booking'], ['quantity']),
+    ('Cart', ['user'], ['quantity']),
+    ('TimeslotCapacity', ['city', 'date', 'start_time'], ['capacity', 'booked']),
+]
+
+
+def merge_duplicate_services(apps, schema_editor):
+    """Fold services sharing a (category, name) into the oldest one, so the constraint can be added."""
+    Service = apps.get_model('yes_madam_api', 'Service')
+    duplicates = (
+        Service.objects.values('category_id', 'name')
+        .annotate(keep=Min('id'), copies=Count('id')).filter(copies__gt=1)
+    )
+    for group in duplicates:
+        keep = group['keep']
+        extra = list(Service.objects.filter(category_id=group['category_id'], name=group['name']).exclude(id=keep).values_list('id', flat=True))
+        for model_name, key_fields, summed in SERVICE_REFERENCES:
+            model = apps.get_model('yes_madam_api', model_name)
+            key_names = [model._meta.get_field(field).attname for field in key_fields]
+            for row in model.objects.filter(service_id__in=extra).order_by('id'):
+                clash = model.objects.filter(service_id=keep, **{name: getattr(row, name) for name in key_names})
+                if clash.update(**{field: F(field) + getattr(row, field) for field in summed}):
+                    row.delete()
+                else:
+                    model.objects.filter(id=row.id).update(service_id=keep)
+        Service.objects.filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0005_timeslot_capacity'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_services, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='service',
+            constraint=models.UniqueConstraint(fields=('category', 'name'), name='unique_service_per_category'),
+        ),
+    ]
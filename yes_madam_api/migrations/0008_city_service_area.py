@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0007_service_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='radius_km',
+            field=models.FloatField(blank=True, help_text='Service area around the city centre.', null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='city',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='residents', to='yes_madam_api.city'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
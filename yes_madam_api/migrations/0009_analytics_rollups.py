@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0008_city_service_area'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingRollupState',
+            fields=[
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup_state', serialize=False, to='yes_madam_api.booking')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('payment_method', models.CharField(blank=True, max_length=50)),
+                ('payment_status', models.CharField(blank=True, max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('Confirmed', 'Confirmed'), ('Pending', 'Pending'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('payment_method', models.CharField(blank=True, max_length=50)),
+                ('payment_status', models.CharField(blank=True, max_length=20)),
+                ('bookings', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'status', 'payment_method', 'payment_status'), name='unique_booking_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ServiceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('Confirmed', 'Confirmed'), ('Pending', 'Pending'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('lines', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='yes_madam_api.service')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'status', 'service'), name='unique_service_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0009_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('booking_id', models.CharField(max_length=20, unique=True)),
+                ('date', models.DateField()),
+                ('timeslot', models.CharField(max_length=50)),
+                ('address', models.TextField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('Confirmed', 'Confirmed'), ('Pending', 'Pending'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('booked_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_bookings', to='yes_madam_api.city')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedBookingService',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('price_at_booking', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookingservice_set', to='yes_madam_api.archivedbooking')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_lines', to='yes_madam_api.service')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('payment_method', models.CharField(choices=[('UPI', 'UPI'), ('Card', 'Card'), ('Cash', 'Cash')], max_length=50)),
+                ('transaction_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(choices=[('Success', 'Success'), ('Failed', 'Failed'), ('Pending', 'Pending')], max_length=20)),
+                ('paid_at', models.DateTimeField()),
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='payment', to='yes_madam_api.archivedbooking')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedReview',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('rating', models.PositiveIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5')])),
+                ('review_text', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='review', to='yes_madam_api.archivedbooking')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_reviews', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['user', '-booked_at', '-id'], name='archived_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['-booked_at', '-id'], name='archived_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0010_booking_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'date'], name='booking_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0011_booking_status_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRollup',
+            fields=[
+                ('booking_id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_paid_at(apps, schema_editor):
+    for name in ('Payment', 'ArchivedPayment'):
+        apps.get_model('yes_madam_api', name).objects.update(pending_since=models.F('paid_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yes_madam_api', '0012_pendingrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='pending_since',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='archivedpayment',
+            name='pending_since',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_paid_at, migrations.RunPython.noop),
+    ]
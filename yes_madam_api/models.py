@@ -1,16 +1,29 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 class User(AbstractUser):
     phone = models.CharField(max_length=15, unique=True)
+    city = models.ForeignKey('City', on_delete=models.SET_NULL, null=True, blank=True, related_name='residents')
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     USERNAME_FIELD = 'phone'
     REQUIRED_FIELDS = ['username', 'email']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='user_joined_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
 class City(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    radius_km = models.FloatField(null=True, blank=True, help_text='Service area around the city centre.')
 
     def __str__(self):
         return self.name
@@ -28,15 +41,76 @@ class Service(models.Model):
     duration = models.CharField(max_length=50)
     description = models.TextField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'name'], name='unique_service_per_category'),
+        ]
+
     def __str__(self):
         return self.name
 
+class ServiceRatingQuerySet(models.QuerySet):
+    def record(self, service_ids, rating, previous=None):
+        # Apply one new (or edited) review to the summary of every service it
+        # covers with a single UPDATE; missing summary rows are created first.
+        service_ids = set(service_ids)
+        if not service_ids or rating == previous:
+            return
+        changes = {f'stars_{rating}': F(f'stars_{rating}') + 1}
+        if previous is None:
+            changes.update(count=F('count') + 1, total=F('total') + rating)
+        else:
+            changes.update({'total': F('total') + (rating - previous), f'stars_{previous}': F(f'stars_{previous}') - 1})
+        with transaction.atomic(using=self.db):
+            self.bulk_create([self.model(service_id=service_id) for service_id in service_ids], ignore_conflicts=True)
+            self.filter(service_id__in=service_ids).update(**changes)
+
+class ServiceRating(models.Model):
+    service = models.OneToOneField(Service, on_delete=models.CASCADE, primary_key=True, related_name='rating')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    objects = ServiceRatingQuerySet.as_manager()
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+    @property
+    def histogram(self):
+        return {str(stars): getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
+    def __str__(self):
+        return f"Rating for {self.service.name}: {self.average} from {self.count} reviews"
+
+class CartQuerySet(models.QuerySet):
+    def add_items(self, user_id, quantities):
+        # Make sure every (user, service) row exists, then increment them all in
+        # one UPDATE. Concurrent adds serialize on the row instead of racing a
+        # read-modify-write in Python.
+        with transaction.atomic(using=self.db):
+            self.bulk_create(
+                [self.model(user_id=user_id, service_id=service_id, quantity=0) for service_id in quantities],
+                ignore_conflicts=True,
+            )
+            return self.filter(user_id=user_id, service_id__in=quantities).update(quantity=F('quantity') + Case(
+                *[When(service_id=service_id, then=Value(quantity)) for service_id, quantity in quantities.items()],
+                output_field=models.PositiveIntegerField(),
+            ))
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items')
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'service')
 
@@ -60,6 +134,14 @@ class Booking(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     booked_at = models.DateTimeField(auto_now_add=True)
     services = models.ManyToManyField(Service, through='BookingService')
+    city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True, blank=True, related_name='bookings')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-booked_at', '-id'], name='booking_user_history_idx'),
+            models.Index(fields=['-booked_at', '-id'], name='booking_recent_idx'),
+            models.Index(fields=['status', 'date'], name='booking_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.booking_id} by {self.user.username}"
@@ -76,6 +158,30 @@ class BookingService(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.service.name} for Booking {self.booking.booking_id}"
 
+class TimeslotCapacity(models.Model):
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='timeslots')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='timeslots')
+    date = models.DateField()
+    start_time = models.TimeField()
+    capacity = models.PositiveIntegerField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'city', 'date', 'start_time'], name='unique_timeslot'),
+            models.CheckConstraint(condition=Q(booked__lte=F('capacity')), name='timeslot_not_overbooked'),
+        ]
+        indexes = [
+            models.Index(fields=['service', 'date', 'start_time'], name='timeslot_service_date_idx'),
+        ]
+
+    @property
+    def label(self):
+        return self.start_time.strftime('%I:%M %p').lstrip('0')
+
+    def __str__(self):
+        return f"{self.service.name} in {self.city.name} on {self.date} at {self.label}: {self.booked}/{self.capacity}"
+
 class Payment(models.Model):
     METHOD_CHOICES = [
         ('UPI', 'UPI'),
@@ -93,6 +199,8 @@ class Payment(models.Model):
     transaction_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     paid_at = models.DateTimeField(auto_now_add=True)
+    # When the payment last became Pending; paid_at never moves on a retry.
+    pending_since = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"Payment for {self.booking.booking_id}: {self.status}"
@@ -105,4 +213,102 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Review for {self.booking.booking_id} by {self.user.username} - Rating: {self.rating}"
\ No newline at end of file
+        return f"Review for {self.booking.booking_id} by {self.user.username} - Rating: {self.rating}"
+
+class BookingRollup(models.Model):
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    payment_method = models.CharField(max_length=50, blank=True)
+    payment_status = models.CharField(max_length=20, blank=True)
+    bookings = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'payment_method', 'payment_status'], name='unique_booking_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.status} via {self.payment_method or 'no payment'}: {self.bookings} bookings"
+
+class ServiceRollup(models.Model):
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='rollups')
+    lines = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'service'], name='unique_service_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.status} {self.service.name}: {self.quantity} booked"
+
+class BookingRollupState(models.Model):
+    # What each booking currently contributes to the rollups, so a change can
+    # be applied as a delta instead of re-aggregating the day.
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, primary_key=True, related_name='rollup_state')
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    payment_method = models.CharField(max_length=50, blank=True)
+    payment_status = models.CharField(max_length=20, blank=True)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+class PendingRollup(models.Model):
+    # Bookings changed since their last rollup sync. Requests only add a row
+    # here; sync_analytics applies them in batches off the request path.
+    booking_id = models.BigIntegerField(primary_key=True)
+
+# Completed and cancelled bookings past the archive cutoff move here with
+# their lines, payment and review (see archive.py). Rows keep their original
+# ids, so cursors and ids stay valid across both tables.
+
+class ArchivedBooking(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    booking_id = models.CharField(max_length=20, unique=True)
+    date = models.DateField()
+    timeslot = models.CharField(max_length=50)
+    address = models.TextField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    booked_at = models.DateTimeField()
+    city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_bookings')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-booked_at', '-id'], name='archived_user_history_idx'),
+            models.Index(fields=['-booked_at', '-id'], name='archived_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived booking {self.booking_id}"
+
+class ArchivedBookingService(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    # Same accessor as on Booking, so the booking serializers read either.
+    booking = models.ForeignKey(ArchivedBooking, on_delete=models.CASCADE, related_name='bookingservice_set')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='archived_lines')
+    quantity = models.PositiveIntegerField(default=1)
+    price_at_booking = models.DecimalField(max_digits=10, decimal_places=2)
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.OneToOneField(ArchivedBooking, on_delete=models.CASCADE, related_name='payment')
+    payment_method = models.CharField(max_length=50, choices=Payment.METHOD_CHOICES)
+    transaction_id = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES)
+    paid_at = models.DateTimeField()
+    pending_since = models.DateTimeField()
+
+class ArchivedReview(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.OneToOneField(ArchivedBooking, on_delete=models.CASCADE, related_name='review')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_reviews')
+    rating = models.PositiveIntegerField(choices=[(i, str(i)) for i in range(1, 6)])
+    review_text = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
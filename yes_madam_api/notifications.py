@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+from .caching import LocalLRUCache
+from .conf import get_setting
+
+
+class NotificationHub:
+    """
+    In-process change notifications keyed by topic. Publishing bumps the
+    topic's counter and wakes only that topic's waiters, so an idle waiter
+    is a parked thread or coroutine that costs no queries. Waiters first
+    note ``current(topic)`` and then read the state they report; a change
+    in between is seen as a counter mismatch instead of being missed.
+    """
+
+    def __init__(self, maxsize):
+        self.lock = threading.Lock()
+        self.counters = LocalLRUCache(maxsize)
+        self.waiters = defaultdict(set)
+
+    def current(self, topic):
+        return self.counters.get(topic) or 0
+
+    def publish(self, topic):
+        with self.lock:
+            self.counters.set(topic, self.current(topic) + 1)
+            waiters = self.waiters.pop(topic, ())
+        for wake in waiters:
+            wake()
+
+    def subscribe(self, topic, seen, wake):
+        # Returns False when the topic already moved past ``seen``.
+        with self.lock:
+            if self.current(topic) != seen:
+                return False
+            self.waiters[topic].add(wake)
+            return True
+
+    def unsubscribe(self, topic, wake):
+        with self.lock:
+            waiters = self.waiters.get(topic)
+            if waiters is not None:
+                waiters.discard(wake)
+                if not waiters:
+                    del self.waiters[topic]
+
+    def wait(self, topic, seen, timeout):
+        event = threading.Event()
+        if not self.subscribe(topic, seen, event.set):
+            return True
+        try:
+            return event.wait(timeout)
+        finally:
+            self.unsubscribe(topic, event.set)
+
+    async def wait_async(self, topic, seen, timeout):
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(event.set)
+
+        if not self.subscribe(topic, seen, wake):
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.unsubscribe(topic, wake)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(waiters) for waiters in self.waiters.values())
+
+
+hub = NotificationHub(get_setting('NOTIFICATION_TOPICS_SIZE'))
+
+
+def booking_topic(booking_id):
+    return f'booking:{booking_id}'
+
+
+def publish_booking_change(booking_id):
+    hub.publish(booking_topic(booking_id))
+
+
+def publish_booking_change_on_commit(booking_id, using=None):
+    transaction.on_commit(lambda: publish_booking_change(booking_id), using=using)
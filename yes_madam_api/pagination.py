@@ -0,0 +1,119 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination over a unique ordering such as
+    ('-booked_at', '-id'). The cursor carries the ordering values of the
+    last row served, so every page is a single indexed range scan no
+    matter how deep the client has paged.
+    """
+    ordering = ('-id',)
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.page([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        fields = [name.lstrip('-') for name in self.ordering]
+        self.model_fields = [queryset.model._meta.get_field(name) for name in fields]
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, self.model_fields)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        return queryset[:self.page_size + 1]
+
+    def page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.position(rows[-1]) if rows else None
+        return rows
+
+    def position(self, row):
+        if isinstance(row, dict):
+            # A values() row: the cursor encoding wants a model instance.
+            row = self.model_fields[0].model(**{field.attname: row[field.attname] for field in self.model_fields})
+        return [field.value_to_string(row) for field in self.model_fields]
+
+    def after(self, position):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y), expanded for any number of keys.
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            field = name.lstrip('-')
+            lookup = f'{field}__lt' if name.startswith('-') else f'{field}__gt'
+            equal = {other.lstrip('-'): position[i] for i, other in enumerate(self.ordering[:index])}
+            condition |= Q(**equal, **{lookup: position[index]})
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request, model_fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(raw, list) or len(raw) != len(model_fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(model_fields, raw)]
+        except (binascii.Error, UnicodeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class BookingCursorPagination(KeysetPagination):
+    ordering = ('-booked_at', '-id')
+
+
+class UserCursorPagination(KeysetPagination):
+    ordering = ('-date_joined', '-id')
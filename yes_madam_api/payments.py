@@ -0,0 +1,206 @@
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .analytics import queue_booking_rollups, sync_booking_rollups
+from .conf import get_setting
+from .models import Payment
+from .notifications import publish_booking_change
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """Transient gateway failure; the charge is retried with backoff."""
+
+
+class PaymentDeclined(Exception):
+    """Final answer from the gateway; the payment is marked Failed."""
+
+
+class PaymentGateway:
+    def charge(self, reference, amount, method):
+        # Return the gateway's transaction id. Implementations must treat a
+        # repeated reference as the same charge, since retries resend it.
+        raise NotImplementedError
+
+
+class SimulatedGateway(PaymentGateway):
+    def __init__(self, latency=0.05, failure_rate=0.0, decline_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.charges = {}
+
+    def charge(self, reference, amount, method):
+        time.sleep(self.latency)
+        with self.lock:
+            if reference in self.charges:
+                return self.charges[reference]
+            roll = self.random.random()
+        if roll < self.failure_rate:
+            raise GatewayError('Simulated gateway timeout')
+        if roll < self.failure_rate + self.decline_rate:
+            raise PaymentDeclined('Simulated decline')
+        with self.lock:
+            return self.charges.setdefault(reference, 'TXN' + uuid.uuid4().hex[:12].upper())
+
+
+def get_gateway():
+    return import_string(get_setting('PAYMENT_GATEWAY'))(**get_setting('PAYMENT_GATEWAY_OPTIONS'))
+
+
+class PaymentPipeline:
+    """
+    Charges Pending payments off the request path. Worker threads call the
+    gateway, retrying transient errors with exponential backoff, and a single
+    writer thread lands the outcomes on Payment rows in batched UPDATEs.
+    """
+
+    def __init__(self, gateway=None):
+        self.gateway = gateway
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.queued = set()
+        self.started = False
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self.gateway = self.gateway or get_gateway()
+            threads = [threading.Thread(target=self.work, daemon=True) for _ in range(get_setting('PAYMENT_WORKERS'))]
+            threads.append(threading.Thread(target=self.write, daemon=True))
+            # Off by default: resume_payments on a schedule covers restarts
+            # without a database thread in every process that charges once.
+            if get_setting('PAYMENT_RESUME_ON_START'):
+                threads.append(threading.Thread(target=self.resume_on_start, daemon=True))
+        for thread in threads:
+            thread.start()
+
+    def resume_pending(self, older_than=None):
+        """
+        Queue payments left Pending for longer than ``older_than`` seconds
+        (PAYMENT_RESUME_AFTER): their charge was lost with the queue of a
+        process that stopped. Returns how many were queued. A charge that is
+        in fact still in flight elsewhere is safe to resend, since gateways
+        treat a repeated reference as the same charge. Payments of bookings
+        cancelled meanwhile are marked Failed instead of charged.
+        """
+        older_than = get_setting('PAYMENT_RESUME_AFTER') if older_than is None else older_than
+        stale = Payment.objects.filter(status='Pending', pending_since__lte=timezone.now() - timedelta(seconds=older_than))
+        with transaction.atomic():
+            cancelled = list(stale.filter(booking__status='Cancelled').values_list('id', 'booking_id', 'booking__booking_id'))
+            if cancelled:
+                Payment.objects.filter(id__in=[row[0] for row in cancelled], status='Pending').update(status='Failed')
+                # update() skips the signals that keep the analytics in step.
+                queue_booking_rollups([row[1] for row in cancelled])
+        for _, _, reference in cancelled:
+            publish_booking_change(reference)
+        rows = stale.exclude(booking__status='Cancelled').values_list('id', 'booking__booking_id', 'booking__total_amount', 'payment_method')
+        return sum(self.submit(*row) for row in rows.iterator(chunk_size=1000))
+
+    def resume_on_start(self):
+        try:
+            self.resume_pending()
+        except DatabaseError:
+            logger.exception('Could not resume pending payments')
+        finally:
+            connection.close()
+
+    def submit(self, payment_id, reference, amount, method):
+        # A payment already queued or in flight is not charged twice.
+        with self.lock:
+            if payment_id in self.queued:
+                return False
+            self.queued.add(payment_id)
+        self.start()
+        self.jobs.put((payment_id, reference, amount, method))
+        return True
+
+    def submit_on_commit(self, payment_id, reference, amount, method, using=None):
+        transaction.on_commit(lambda: self.submit(payment_id, reference, amount, method), using=using)
+
+    def wait(self):
+        self.jobs.join()
+        self.results.join()
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self.results.put(self.charge(*job))
+            except Exception:
+                logger.exception('Payment %s could not be charged', job[0])
+                self.results.put((job[0], job[1], 'Failed', None))
+            finally:
+                self.jobs.task_done()
+
+    def charge(self, payment_id, reference, amount, method):
+        attempts = get_setting('PAYMENT_MAX_ATTEMPTS')
+        for attempt in range(attempts):
+            try:
+                return payment_id, reference, 'Success', self.gateway.charge(reference, amount, method)
+            except PaymentDeclined:
+                return payment_id, reference, 'Failed', None
+            except GatewayError:
+                if attempt + 1 < attempts:
+                    time.sleep(get_setting('PAYMENT_RETRY_BACKOFF') * 2 ** attempt)
+        return payment_id, reference, 'Failed', None
+
+    def write(self):
+        batch_size = get_setting('PAYMENT_BATCH_SIZE')
+        interval = get_setting('PAYMENT_FLUSH_INTERVAL')
+        while True:
+            batch = [self.results.get()]
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self.results.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.flush(batch)
+            finally:
+                connection.close()
+                for _ in batch:
+                    self.results.task_done()
+
+    def flush(self, batch):
+        payments = [Payment(id=payment_id, status=status, transaction_id=transaction_id) for payment_id, _, status, transaction_id in batch]
+        attempts = get_setting('PAYMENT_MAX_ATTEMPTS')
+        try:
+            for attempt in range(attempts):
+                try:
+                    Payment.objects.bulk_update(payments, ['status', 'transaction_id'])
+                    break
+                except DatabaseError:
+                    if attempt + 1 == attempts:
+                        logger.exception('Could not record %d payment results', len(payments))
+                        return
+                    time.sleep(get_setting('PAYMENT_RETRY_BACKOFF') * 2 ** attempt)
+        finally:
+            with self.lock:
+                self.queued.difference_update(payment.id for payment in payments)
+        try:
+            # bulk_update skips the signals that keep the analytics in step.
+            sync_booking_rollups(Payment.objects.filter(id__in=[payment.id for payment in payments]).values_list('booking_id', flat=True))
+        except DatabaseError:
+            logger.exception('Could not update analytics for %d payments', len(payments))
+        for _, reference, _, _ in batch:
+            publish_booking_change(reference)
+
+
+payment_pipeline = PaymentPipeline()
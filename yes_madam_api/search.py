@@ -0,0 +1,320 @@
+import bisect
+import heapq
+import logging
+import random
+import re
+import threading
+from collections import defaultdict
+
+from django.core.signals import request_started
+from django.db import DatabaseError, connection, transaction
+
+from .catalog import shared_cache
+from .models import Service
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'yes_madam_api:search:version'
+WARM_UID = 'yes_madam_api.search.warm_on_first_request'
+TOKEN_RE = re.compile(r'\w+')
+
+# Field weights, and how much of that weight a looser match keeps.
+WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+EXACT, PREFIX, TYPO = 1.0, 0.6, 0.4
+MIN_TYPO_LENGTH = 4
+MAX_PREFIX_EXPANSIONS = 64
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def within_one_edit(a, b):
+    # Levenshtein distance <= 1, also counting one adjacent transposition.
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        return len(diffs) == 1 or (
+            len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+        )
+    shorter, longer = sorted((a, b), key=len)
+    for i in range(len(shorter)):
+        if shorter[i] != longer[i]:
+            return shorter[i:] == longer[i + 1:]
+    return True
+
+
+class ServiceSearchIndex:
+    """
+    In-process inverted index over service name, description and category
+    name. Lookups are exact, prefix (for autocomplete) or within one typo,
+    using a sorted vocabulary and a single-deletion neighbourhood map.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.postings = defaultdict(dict)
+            self.documents = {}
+            self.vocabulary = []
+            self.neighbours = defaultdict(set)
+            self.version = None
+            self.rebuilding = False
+            self.built.set()
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    def ensure_current(self):
+        # Another process changed the catalog: rebuild in the background and
+        # keep answering from the current index meanwhile. The very first
+        # build has nothing to fall back on: wait for the startup build if
+        # one is running, else build inline.
+        version = get_search_version()
+        if version == self.version:
+            return
+        if not self.ready:
+            self.built.wait()
+            if not self.ready:
+                self.rebuild(version)
+            return
+        self.start_rebuild(version)
+
+    def warm(self):
+        """Build the index in the background, ahead of the first search, so no search has to wait for it."""
+        if not self.ready:
+            self.start_rebuild(None)
+
+    def start_rebuild(self, version):
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+            self.built.clear()
+        threading.Thread(target=self.rebuild_in_background, args=(version,), daemon=True).start()
+
+    def rebuild_in_background(self, version):
+        try:
+            self.rebuild(version)
+        except DatabaseError:
+            # Searches fall back to building the index themselves.
+            logger.exception('Could not build the search index')
+        finally:
+            self.rebuilding = False
+            self.built.set()
+            connection.close()
+
+    def rebuild(self, version=None):
+        version = get_search_version() if version is None else version
+        fresh = ServiceSearchIndex()
+        rows = Service.objects.values_list('id', 'name', 'description', 'category__name')
+        for row in rows.iterator(chunk_size=2000):
+            fresh.add(*row)
+        with self.lock:
+            self.postings, self.documents = fresh.postings, fresh.documents
+            self.vocabulary, self.neighbours = fresh.vocabulary, fresh.neighbours
+            self.version = version
+            self.rebuilding = False
+
+    def add(self, service_id, name, description, category_name):
+        weights = {}
+        for field, text in (('name', name), ('description', description), ('category', category_name)):
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0.0), WEIGHTS[field])
+        with self.lock:
+            self.remove(service_id)
+            self.documents[service_id] = weights
+            for token, weight in weights.items():
+                if token not in self.postings:
+                    bisect.insort(self.vocabulary, token)
+                    if len(token) >= MIN_TYPO_LENGTH:
+                        for deleted in deletions(token):
+                            self.neighbours[deleted].add(token)
+                self.postings[token].setdefault(weight, set()).add(service_id)
+
+    def remove(self, service_id):
+        with self.lock:
+            weights = self.documents.pop(service_id, None)
+            if weights is None:
+                return
+            for token, weight in weights.items():
+                buckets = self.postings[token]
+                buckets[weight].discard(service_id)
+                if not buckets[weight]:
+                    del buckets[weight]
+                if not buckets:
+                    del self.postings[token]
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+                    for deleted in deletions(token) if len(token) >= MIN_TYPO_LENGTH else ():
+                        self.neighbours[deleted].discard(token)
+                        if not self.neighbours[deleted]:
+                            del self.neighbours[deleted]
+
+    def matches(self, term, prefix=True):
+        found = {}
+        if term in self.postings:
+            found[term] = EXACT
+        if prefix:
+            start = bisect.bisect_left(self.vocabulary, term)
+            for token in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+                if not token.startswith(term):
+                    break
+                found.setdefault(token, PREFIX)
+        if len(term) >= MIN_TYPO_LENGTH:
+            candidates = set(self.neighbours.get(term, ()))
+            for deleted in deletions(term):
+                if deleted in self.postings:
+                    candidates.add(deleted)
+                candidates |= self.neighbours.get(deleted, set())
+            for token in candidates:
+                if token not in found and within_one_edit(term, token):
+                    found[token] = TYPO
+        return found
+
+    def search(self, query, limit=10):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self.lock:
+            # Only the last term is still being typed, so only it is expanded
+            # to every word it is a prefix of.
+            matched = [self.matches(term, prefix=position == len(terms) - 1) for position, term in enumerate(terms)]
+            if len(matched) == 1:
+                return self.top_single(matched[0], limit)
+            return self.top_all(matched, limit)
+
+    def top_single(self, matched, limit):
+        # A service scores the best (field weight x match quality) of the words
+        # it matched, so walk the score levels from the top and stop as soon
+        # as enough services have been placed.
+        levels = defaultdict(list)
+        for token, factor in matched.items():
+            for weight, service_ids in self.postings[token].items():
+                levels[weight * factor].append(service_ids)
+        ranked, placed = [], set()
+        for score in sorted(levels, reverse=True):
+            group = set().union(*levels[score]) - placed
+            ranked.extend(heapq.nsmallest(limit - len(ranked), group))
+            if len(ranked) >= limit:
+                break
+            placed |= group
+        return ranked
+
+    def top_all(self, matched, limit):
+        # Every term has to match. Start from the most selective term and only
+        # ever look at services that are still candidates.
+        def size(term_matches):
+            return sum(len(ids) for token in term_matches for ids in self.postings[token].values())
+
+        scores = None
+        for term_matches in sorted(matched, key=size):
+            term_scores = {}
+            best = term_scores.get
+            for token, factor in term_matches.items():
+                for weight, service_ids in self.postings[token].items():
+                    score = weight * factor
+                    if scores is None:
+                        candidates = service_ids
+                    elif len(service_ids) < len(scores):
+                        candidates = [service_id for service_id in service_ids if service_id in scores]
+                    else:
+                        candidates = [service_id for service_id in scores if service_id in service_ids]
+                    for service_id in candidates:
+                        if score > best(service_id, 0.0):
+                            term_scores[service_id] = score
+            if scores is not None:
+                term_scores = {service_id: score + scores[service_id] for service_id, score in term_scores.items()}
+            scores = term_scores
+            if not scores:
+                return []
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [service_id for service_id, _ in ranked]
+
+
+search_index = ServiceSearchIndex()
+
+
+def get_search_version():
+    # A counter, so changes can be published with an atomic incr(). It starts
+    # at a random value: after an eviction no process's old version matches.
+    cache = shared_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, random.getrandbits(48), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def publish_local_change():
+    # Move the shared version on so the other processes rebuild. This one
+    # keeps its incrementally updated index only if nobody else published
+    # since it was current, i.e. the incr() took its version one step up;
+    # otherwise its version stays behind and the next search rebuilds.
+    cache = shared_cache()
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        get_search_version()
+        return
+    with search_index.lock:
+        if search_index.ready and search_index.version == version - 1:
+            search_index.version = version
+
+
+def warm_on_first_request(sender, **kwargs):
+    # Connected in apps.py when SEARCH_WARM_ON_STARTUP is set, so only
+    # processes that serve requests build the index, not migrate or other
+    # management commands.
+    request_started.disconnect(warm_on_first_request, dispatch_uid=WARM_UID)
+    search_index.warm()
+
+
+def index_service_on_commit(service, using=None):
+    def apply():
+        if search_index.ready:
+            search_index.add(service.id, service.name, service.description, service.category.name)
+        publish_local_change()
+
+    transaction.on_commit(apply, using=using)
+
+
+def unindex_service_on_commit(service_id, using=None):
+    def apply():
+        search_index.remove(service_id)
+        publish_local_change()
+
+    transaction.on_commit(apply, using=using)
+
+
+def reindex_category_on_commit(category_id, using=None):
+    def apply():
+        if search_index.ready:
+            rows = Service.objects.filter(category_id=category_id).values_list('id', 'name', 'description', 'category__name')
+            for row in rows:
+                search_index.add(*row)
+        publish_local_change()
+
+    transaction.on_commit(apply, using=using)
+
+
+def invalidate_search_index():
+    # For bulk writes that bypass model signals: every process, this one
+    # included, rebuilds on its next search.
+    try:
+        shared_cache().incr(VERSION_KEY)
+    except ValueError:
+        # Never set or evicted: the next search starts a fresh random
+        # version, which no process's index matches.
+        pass
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import User, City, Category, Service, Cart, Booking, Payment, Review, BookingService
+from .conf import get_setting
+from .models import User, City, Category, Service, ServiceRating, Cart, Booking, Payment, Review, BookingService
 from django.db.models import F
 
 class UserSerializer(serializers.ModelSerializer):
@@ -24,29 +25,56 @@ class LoginSerializer(serializers.Serializer):
 class CitySerializer(serializers.ModelSerializer):
     class Meta:
         model = City
-        fields = ['id', 'name']
+        fields = ['id', 'name', 'latitude', 'longitude', 'radius_km']
 
 class SetLocationSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
-    city = serializers.CharField(max_length=100)
-    latitude = serializers.CharField(max_length=50)
-    longitude = serializers.CharField(max_length=50)
+    city = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name']
 
+class ServiceRatingSerializer(serializers.ModelSerializer):
+    average = serializers.FloatField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = ServiceRating
+        fields = ['count', 'average', 'histogram']
+
 class ServiceSerializer(serializers.ModelSerializer):
+    rating = serializers.SerializerMethodField()
+
     class Meta:
         model = Service
-        fields = ['id', 'name', 'price', 'duration', 'description']
+        fields = ['id', 'name', 'price', 'duration', 'description', 'rating']
+
+    def get_rating(self, obj):
+        # Select the summary with select_related('rating'); services nobody has
+        # reviewed yet have no row and report an empty summary.
+        try:
+            rating = obj.rating
+        except ServiceRating.DoesNotExist:
+            rating = ServiceRating(service=obj)
+        return ServiceRatingSerializer(rating).data
 
 class AddToCartSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
     service_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
 
+class CartLineSerializer(serializers.Serializer):
+    service_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class BatchAddToCartSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    items = CartLineSerializer(many=True, allow_empty=False, max_length=200)
+
 class CartItemSerializer(serializers.ModelSerializer):
     service = ServiceSerializer(read_only=True)
     total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -61,7 +89,7 @@ class BookingServiceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = BookingService
-        fields = ['service_name', 'quantity', 'price_at_booking']
+        fields = ['service_name', 'service_price', 'quantity', 'price_at_booking']
 
 class BookingResponseSerializer(serializers.ModelSerializer):
     services = BookingServiceSerializer(source='bookingservice_set', many=True, read_only=True)
@@ -76,6 +104,7 @@ class ConfirmBookingSerializer(serializers.Serializer):
     date = serializers.DateField()
     timeslot = serializers.CharField(max_length=50)
     address = serializers.CharField()
+    city_id = serializers.IntegerField(required=False)
 
 class InitiatePaymentSerializer(serializers.Serializer):
     booking_id = serializers.CharField(max_length=20)
@@ -105,6 +134,21 @@ class AdminAddServiceSerializer(serializers.ModelSerializer):
         model = Service
         fields = ['id', 'category', 'name', 'price', 'duration', 'description']
 
+class BulkServiceSerializer(AdminAddServiceSerializer):
+    # Categories come from one lookup per request (context['categories'])
+    # and (category, name) picks insert or update, so the per-row queries of
+    # the relation field and the unique-together validator are dropped.
+    category = serializers.IntegerField()
+
+    class Meta(AdminAddServiceSerializer.Meta):
+        validators = []
+
+    def validate_category(self, value):
+        try:
+            return self.context['categories'][value]
+        except KeyError:
+            raise serializers.ValidationError(f'Invalid pk "{value}" - object does not exist.')
+
 class AdminUserListSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -116,4 +160,41 @@ class AdminBookingListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Booking
-        fields = ['id', 'booking_id', 'user_username', 'date', 'timeslot', 'address', 'total_amount', 'status', 'booked_at', 'services']
\ No newline at end of file
+        fields = ['id', 'booking_id', 'user_username', 'date', 'timeslot', 'address', 'total_amount', 'status', 'booked_at', 'services']
+
+class ExportFilterSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+class BookingExportFilterSerializer(ExportFilterSerializer):
+    status = serializers.ChoiceField(choices=Booking.STATUS_CHOICES, required=False)
+
+class UserExportFilterSerializer(ExportFilterSerializer):
+    is_active = serializers.BooleanField(required=False, allow_null=True, default=None)
+
+class AnalyticsFilterSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    top_services = serializers.IntegerField(min_value=0, max_value=100, default=0)
+
+    def validate(self, data):
+        if 'date_from' in data and 'date_to' in data and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError({'date_to': 'Must not be before date_from.'})
+        return data
+
+class BatchItemSerializer(serializers.Serializer):
+    id = serializers.CharField(max_length=100, required=False)
+    path = serializers.CharField(max_length=2000)
+    etag = serializers.CharField(max_length=200, required=False)
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+    concurrent = serializers.BooleanField(default=False)
+
+    def get_fields(self):
+        # Read per request, so the length is checked before any part is
+        # validated and BATCH_MAX_REQUESTS can be overridden at runtime.
+        fields = super().get_fields()
+        fields['requests'].max_length = get_setting('BATCH_MAX_REQUESTS')
+        return fields
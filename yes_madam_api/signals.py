@@ -0,0 +1,72 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .analytics import queue_booking_rollups, sync_booking_rollups
+from .archive import archiving
+from .authentication import forget_tokens
+from .catalog import bump_catalog_version_on_commit
+from .models import User, City, Category, Service, Booking, Payment
+from .notifications import publish_booking_change_on_commit
+from .search import index_service_on_commit, reindex_category_on_commit, unindex_service_on_commit
+
+
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Service)
+def catalog_changed(sender, using=None, **kwargs):
+    bump_catalog_version_on_commit(using=using)
+
+
+@receiver(post_save, sender=Service)
+def service_saved(sender, instance, using=None, **kwargs):
+    index_service_on_commit(instance, using=using)
+
+
+@receiver(post_delete, sender=Service)
+def service_deleted(sender, instance, using=None, **kwargs):
+    unindex_service_on_commit(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, using=None, **kwargs):
+    if not created:
+        reindex_category_on_commit(instance.pk, using=using)
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, using=None, **kwargs):
+    publish_booking_change_on_commit(instance.booking_id, using=using)
+    queue_booking_rollups([instance.pk], using=using)
+
+
+@receiver(pre_delete, sender=Booking)
+def booking_deleted(sender, instance, using=None, **kwargs):
+    # Before the cascade, while the line items can still be read. Archived
+    # bookings stay counted: they are moving, not going away.
+    if not archiving.get():
+        sync_booking_rollups([instance.pk], removed=True, using=using)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, using=None, **kwargs):
+    publish_booking_change_on_commit(instance.booking.booking_id, using=using)
+    queue_booking_rollups([instance.booking_id], using=using)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, using=None, **kwargs):
+    if not archiving.get():
+        queue_booking_rollups([instance.booking_id], using=using)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, using=None, **kwargs):
+    forget_tokens([instance.key], using=using)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, using=None, **kwargs):
+    # Cached tokens carry a copy of the user's flags, so any change
+    # (password, is_active, profile) must evict them.
+    if not created:
+        forget_tokens(Token.objects.using(using).filter(user_id=instance.pk).values_list('key', flat=True), using=using)
@@ -1,3 +1,2156 @@
-from django.test import TestCase
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as clock, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_started
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import LiveServerTestCase, SimpleTestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from . import async_views, batch, views
+from .authentication import CachedTokenAuthentication, local_tokens, token_cache_key
+from .catalog import clear_catalog_cache, get_catalog_version, local_cache
+from .analytics import sync_booking_rollups, sync_pending_rollups
+from .lifecycle import advance_bookings
+from .geo import ServiceAreaIndex
+from .instrumentation import Metrics, metrics, slow_requests
+from .notifications import NotificationHub, publish_booking_change
+from .payments import GatewayError, PaymentDeclined, PaymentPipeline, SimulatedGateway, payment_pipeline
+from .models import (
+    User, City, Category, Service, ServiceRating, Cart, Booking, Payment, Review, BookingService, TimeslotCapacity,
+    BookingRollup, ServiceRollup, PendingRollup, ArchivedBooking, ArchivedBookingService, ArchivedPayment, ArchivedReview,
+)
+from .search import WARM_UID, ServiceSearchIndex, invalidate_search_index, search_index, warm_on_first_request
+from .throttling import Throttle
+from .urls import urlpatterns
+
+# Upper bound of SQL queries per request for every named route, measured
+# against the seeded dataset below. List endpoints must stay constant no
+# matter how many rows they return.
+QUERY_BUDGETS = {
+    'register': 3,
+    'login': 5,
+    'logout': 2,
+    'city-list': 1,
+    'set-location': 5,
+    'category-list': 1,
+    'services-by-category': 1,
+    'service-search': 2,
+    'add-to-cart': 7,
+    'add-to-cart-batch': 6,
+    'view-cart': 1,
+    'choose-timeslot': 2,
+    'confirm-booking': 13,
+    'initiate-payment': 6,
+    'payment-status': 1,
+    'booking-events': 1,
+    'booking-event-stream': 1,
+    'booking-history': 3,
+    'submit-rating': 12,
+    'admin-add-service': 3,
+    'admin-bulk-services': 5,
+    'admin-user-list': 1,
+    'admin-booking-list': 3,
+    'admin-user-export': 1,
+    'admin-booking-export': 3,
+    'admin-analytics': 1,
+    'metrics': 0,
+    'slow-requests': 0,
+    'batch': 7,
+}
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def consume(response):
+    if not response.is_async:
+        return list(response.streaming_content)
+
+    async def collect():
+        return [chunk async for chunk in response.streaming_content]
+
+    return async_to_sync(collect)()
+
+
+def seed_catalog(cities=5, categories=4, services_per_category=5):
+    City.objects.bulk_create([City(name=f'City {i}') for i in range(cities)])
+    category_objs = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(categories)])
+    Service.objects.bulk_create([
+        Service(
+            category=category,
+            name=f'{category.name} service {i}',
+            price=Decimal('199.00') + i * 100,
+            duration='45 mins',
+            description=f'Description of {category.name} service {i}',
+        )
+        for category in category_objs
+        for i in range(services_per_category)
+    ])
+    return category_objs
+
+
+def seed_bookings(user, services, count, lines_per_booking=3, start=0):
+    bookings = Booking.objects.bulk_create([
+        Booking(
+            user=user,
+            booking_id=f'YM{user.id:02d}{start + i:04d}',
+            date=date.today() - timedelta(days=i),
+            timeslot='10:00 AM',
+            address='221B Baker Street',
+            total_amount=Decimal('0.00'),
+            status='Completed' if i % 2 else 'Confirmed',
+        )
+        for i in range(count)
+    ])
+    BookingService.objects.bulk_create([
+        BookingService(booking=booking, service=service, quantity=1, price_at_booking=service.price)
+        for booking in bookings
+        for service in services[:lines_per_booking]
+    ])
+    return bookings
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class EndpointQueryBudgetTests(APITestCase):
+    timings = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = seed_catalog()
+        cls.services = list(Service.objects.order_by('id'))
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.other = User.objects.create_user(username='ravi', email='ravi@example.com', phone='9000000002', password='secret')
+        cls.bookings = seed_bookings(cls.user, cls.services, 20)
+        seed_bookings(cls.other, cls.services, 20)
+        cls.city = City.objects.get(name='City 0')
+        call_command('open_timeslots', city=cls.city.name, days=1, stdout=StringIO())
+        Payment.objects.create(booking=cls.bookings[0], payment_method='UPI', transaction_id='TXN0000001', status='Success')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if os.environ.get('YES_MADAM_PERF_REPORT'):
+            for name, (queries, elapsed) in sorted(cls.timings.items()):
+                sys.stderr.write(f'{name:24} {queries:3d} queries {elapsed * 1000:8.2f} ms\n')
+
+    def setUp(self):
+        clear_catalog_cache()
+        search_index.reset()
+        self.client.force_authenticate(self.user)
+
+    def measure(self, name, method, url, data=None, **kwargs):
+        # Work deferred to on_commit still runs in the request, so it counts.
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data, format='json', **kwargs)
+            if response.streaming:
+                response.content_bytes = b''.join(consume(response))
+            elapsed = time.perf_counter() - started
+        self.timings[name] = (len(ctx), elapsed)
+        self.assertLess(response.status_code, 500, getattr(response, 'content_bytes', None) or response.content)
+        budget = QUERY_BUDGETS[name]
+        self.assertLessEqual(
+            len(ctx), budget,
+            f'{name} ran {len(ctx)} queries (budget {budget}):\n' + '\n'.join(q['sql'] for q in ctx.captured_queries),
+        )
+        return response
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual({pattern.name for pattern in urlpatterns}, set(QUERY_BUDGETS))
+
+    def test_register(self):
+        self.client.force_authenticate(None)
+        response = self.measure('register', 'post', reverse('register'), {
+            'username': 'meera', 'email': 'meera@example.com', 'phone': '9000000003', 'password': 'secret',
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        self.client.force_authenticate(None)
+        response = self.measure('login', 'post', reverse('login'), {'phone': '9000000001', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(self.user, token)
+        self.measure('logout', 'post', reverse('logout'))
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    def test_city_list(self):
+        response = self.measure('city-list', 'get', reverse('city-list'))
+        self.assertEqual(len(response.data), 5)
+
+    def test_set_location(self):
+        response = self.measure('set-location', 'post', reverse('set-location'), {
+            'user_id': self.user.id, 'city': 'City 0', 'latitude': '12.97', 'longitude': '77.59',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['city'], 'City 0')
+
+    def test_category_list(self):
+        response = self.measure('category-list', 'get', reverse('category-list'))
+        self.assertEqual(len(response.data), 4)
+
+    def test_services_by_category(self):
+        url = reverse('services-by-category', args=[self.categories[0].id])
+        response = self.measure('services-by-category', 'get', url)
+        self.assertEqual(len(response.data), 5)
+
+    def test_service_search(self):
+        response = self.measure('service-search', 'get', reverse('service-search'), {'q': 'category servic'})
+        self.assertEqual(len(response.data), 10)
+
+    def test_add_to_cart(self):
+        url = reverse('add-to-cart')
+        payload = {'user_id': self.user.id, 'service_id': self.services[0].id, 'quantity': 1}
+        self.measure('add-to-cart', 'post', url, payload)
+        self.measure('add-to-cart', 'post', url, payload)
+        self.assertEqual(Cart.objects.get(user=self.user, service=self.services[0]).quantity, 2)
+
+    def test_add_to_cart_increments_in_one_query(self):
+        Cart.objects.create(user=self.user, service=self.services[0], quantity=1)
+        with self.assertNumQueries(1):
+            self.client.post(reverse('add-to-cart'), {
+                'user_id': self.user.id, 'service_id': self.services[0].id, 'quantity': 3,
+            }, format='json')
+        self.assertEqual(Cart.objects.get(user=self.user, service=self.services[0]).quantity, 4)
+
+    def test_add_to_cart_unknown_service(self):
+        response = self.client.post(reverse('add-to-cart'), {
+            'user_id': self.user.id, 'service_id': 0, 'quantity': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_add_to_cart_batch(self):
+        Cart.objects.create(user=self.user, service=self.services[0], quantity=1)
+        items = [{'service_id': service.id, 'quantity': 2} for service in self.services[:12]]
+        items.append({'service_id': self.services[0].id, 'quantity': 1})
+        response = self.measure('add-to-cart-batch', 'post', reverse('add-to-cart-batch'), {
+            'user_id': self.user.id, 'items': items,
+        })
+        self.assertEqual(response.data['items'], 12)
+        quantities = dict(Cart.objects.filter(user=self.user).values_list('service_id', 'quantity'))
+        self.assertEqual(quantities.pop(self.services[0].id), 4)
+        self.assertEqual(set(quantities.values()), {2})
+        self.assertEqual(len(quantities), 11)
+
+    def test_add_to_cart_batch_rejects_unknown_services(self):
+        response = self.client.post(reverse('add-to-cart-batch'), {
+            'user_id': self.user.id, 'items': [{'service_id': self.services[0].id, 'quantity': 1}, {'service_id': 0, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['service_ids'], [0])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_view_cart(self):
+        for service in self.services[:6]:
+            Cart.objects.create(user=self.user, service=service, quantity=2)
+        response = self.measure('view-cart', 'get', reverse('view-cart'), {'user_id': self.user.id})
+        self.assertEqual(len(response.data), 6)
+
+    def test_choose_timeslot(self):
+        response = self.measure('choose-timeslot', 'get', reverse('choose-timeslot'), {
+            'service_id': self.services[0].id, 'date': date.today().isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_confirm_booking(self):
+        cart = [Cart.objects.create(user=self.user, service=service, quantity=1) for service in self.services[:3]]
+        response = self.measure('confirm-booking', 'post', reverse('confirm-booking'), {
+            'user_id': self.user.id, 'cart_ids': [item.id for item in cart], 'city_id': self.city.id,
+            'date': date.today().isoformat(), 'timeslot': '10:00 AM', 'address': '221B Baker Street',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'Pending')
+        self.assertEqual(len(response.data['services']), 3)
+        self.assertEqual(response.data['total_amount'], '897.00')
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_confirm_booking_is_constant_in_cart_size(self):
+        counts = []
+        for services in (self.services[:2], self.services[2:12]):
+            cart = [Cart.objects.create(user=self.user, service=service, quantity=2) for service in services]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(reverse('confirm-booking'), {
+                    'user_id': self.user.id, 'cart_ids': [item.id for item in cart], 'city_id': self.city.id,
+                    'date': date.today().isoformat(), 'timeslot': '10:00 AM', 'address': '221B Baker Street',
+                }, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['services']), len(services))
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_initiate_payment(self):
+        response = self.measure('initiate-payment', 'post', reverse('initiate-payment'), {
+            'booking_id': self.bookings[1].booking_id, 'payment_method': 'UPI',
+        })
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'Pending')
+
+    def test_payment_status(self):
+        url = reverse('payment-status', args=[self.bookings[0].booking_id])
+        response = self.measure('payment-status', 'get', url)
+        self.assertEqual(response.data['status'], 'Success')
+
+    def test_booking_events(self):
+        url = reverse('booking-events', args=[self.bookings[0].booking_id])
+        response = self.measure('booking-events', 'get', url)
+        self.assertEqual((response.data['status'], response.data['payment_status']), ('Confirmed', 'Success'))
+
+    @override_settings(YES_MADAM_API={'NOTIFICATION_STREAM_MAX_AGE': 0})
+    def test_booking_event_stream(self):
+        url = reverse('booking-event-stream', args=[self.bookings[0].booking_id])
+        response = self.measure('booking-event-stream', 'get', url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.content_bytes.startswith(b'event: booking\ndata: {"booking_id": '))
+
+    def test_booking_history(self):
+        response = self.measure('booking-history', 'get', reverse('booking-history'), {'user_id': self.user.id})
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(len(response.data['results'][0]['services']), 3)
+
+    def test_submit_rating(self):
+        response = self.measure('submit-rating', 'post', reverse('submit-rating'), {
+            'booking_id': self.bookings[1].booking_id, 'rating': 5, 'review': 'Lovely',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Review.objects.filter(booking=self.bookings[1]).exists())
+
+    def test_admin_add_service(self):
+        response = self.measure('admin-add-service', 'post', reverse('admin-add-service'), {
+            'category': self.categories[0].id, 'name': 'Head massage', 'price': '499.00',
+            'duration': '30 mins', 'description': 'Relaxing head massage',
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def test_admin_bulk_services(self):
+        self.client.force_authenticate(User(is_staff=True))
+        existing = Service.objects.filter(category=self.categories[0]).first()
+        response = self.measure('admin-bulk-services', 'post', reverse('admin-bulk-services'), [
+            {'category': self.categories[0].id, 'name': existing.name, 'price': '1.00', 'duration': '30 mins', 'description': 'Cheaper'},
+            {'category': self.categories[1].id, 'name': 'Head massage', 'price': '499.00', 'duration': '30 mins', 'description': 'New'},
+            {'category': 0, 'name': 'Nowhere', 'price': '1.00', 'duration': '30 mins', 'description': 'Bad category'},
+        ])
+        self.assertEqual([row['status'] for row in response.data['results']], ['updated', 'created', 'invalid'])
+
+    def test_admin_user_list(self):
+        response = self.measure('admin-user-list', 'get', reverse('admin-user-list'))
+        self.assertEqual([row['username'] for row in response.data['results']], ['ravi', 'asha'])
+
+    def test_admin_booking_list(self):
+        response = self.measure('admin-booking-list', 'get', reverse('admin-booking-list'), {'page_size': 40})
+        self.assertEqual(len(response.data['results']), 40)
+        self.assertEqual({row['user_username'] for row in response.data['results']}, {'asha', 'ravi'})
+
+    def test_admin_user_export(self):
+        self.assertEqual(self.client.get(reverse('admin-user-export')).status_code, 403)
+        self.client.force_authenticate(User(is_staff=True))
+        User.objects.filter(id=self.other.id).update(username='=HYPERLINK("http://evil")')
+        response = self.measure('admin-user-export', 'get', reverse('admin-user-export'), {'output': 'csv'})
+        lines = response.content_bytes.decode().splitlines()
+        self.assertEqual(lines[0], 'id,username,email,phone,is_active,date_joined')
+        self.assertEqual(len(lines), 3)
+        self.assertIn(',"\'=HYPERLINK(""http://evil"")",', lines[2])
+
+    def test_admin_analytics(self):
+        call_command('rebuild_analytics', stdout=StringIO())
+        self.client.force_authenticate(User(is_staff=True))
+        response = self.measure('admin-analytics', 'get', reverse('admin-analytics'), {
+            'date_from': (date.today() - timedelta(days=9)).isoformat(), 'date_to': date.today().isoformat(),
+        })
+        self.assertEqual(response.data['bookings'], 20)
+        self.assertEqual(response.data['payments']['UPI'], {'payments': 1, 'succeeded': 1, 'failed': 0, 'pending': 0, 'success_rate': 1.0})
+
+    def test_admin_booking_export(self):
+        self.assertEqual(self.client.get(reverse('admin-booking-export')).status_code, 403)
+        self.client.force_authenticate(User(is_staff=True))
+        response = self.measure('admin-booking-export', 'get', reverse('admin-booking-export'), {'status': 'Completed'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in response.content_bytes.decode().splitlines()]
+        self.assertEqual(len(rows), 20)
+        self.assertEqual({row['status'] for row in rows}, {'Completed'})
+        self.assertEqual(len(rows[0]['services']), 3)
+
+    def test_admin_booking_export_filters_and_chunks(self):
+        today = date.today()
+        params = {'output': 'csv', 'date_from': (today - timedelta(days=9)).isoformat(), 'date_to': today.isoformat()}
+        self.client.force_authenticate(User(is_staff=True))
+        with patch.object(views.AdminBookingExportView, 'chunk_size', 4):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('admin-booking-export'), params)
+                lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + 20)
+        self.assertIn('1 x Category 0 service 0 @ 199.00', lines[1])
+        # Per chunk of four, one booking query per table plus the line-item
+        # prefetch of the hot one; the last, empty chunk ends the stream.
+        self.assertEqual(len(ctx), 5 * 3 + 2)
+
+        # Archived bookings keep their place in the export.
+        call_command('archive_bookings', older_than_days=0, sleep=0, stdout=StringIO())
+        self.assertTrue(ArchivedBooking.objects.filter(date__gte=today - timedelta(days=9)).exists())
+        with patch.object(views.AdminBookingExportView, 'chunk_size', 4):
+            response = self.client.get(reverse('admin-booking-export'), params)
+            archived = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(archived, lines)
+
+    def test_metrics(self):
+        self.client.force_authenticate(User(is_staff=True))
+        response = self.measure('metrics', 'get', reverse('metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_slow_requests(self):
+        self.client.force_authenticate(User(is_staff=True))
+        response = self.measure('slow-requests', 'get', reverse('slow-requests'))
+        self.assertIsInstance(response.data, list)
+
+    def test_batch(self):
+        response = self.measure('batch', 'post', reverse('batch'), {'requests': [
+            {'path': reverse('city-list')},
+            {'path': reverse('category-list')},
+            {'path': reverse('services-by-category', args=[self.categories[0].id])},
+            {'path': f"{reverse('view-cart')}?user_id={self.user.id}"},
+            {'path': f"{reverse('booking-history')}?user_id={self.user.id}"},
+        ]})
+        self.assertEqual([part['status'] for part in response.json()['responses']], [200] * 5)
+
+    def test_export_rejects_bad_filters(self):
+        self.client.force_authenticate(User(is_staff=True))
+        response = self.client.get(reverse('admin-booking-export'), {'status': 'Lost', 'output': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'status', 'output'})
+
+    def test_list_endpoints_are_constant_in_row_count(self):
+        url = reverse('admin-booking-list')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        seed_bookings(self.user, self.services, 30, lines_per_booking=5, start=100)
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(before), len(after))
+
+        url = reverse('booking-history')
+        with CaptureQueriesContext(connection) as history:
+            response = self.client.get(url, {'user_id': self.user.id, 'page_size': 50})
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertEqual(len(history), QUERY_BUDGETS['booking-history'])
+
+
+class KeysetPaginationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(categories=1)
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.bookings = seed_bookings(cls.user, list(Service.objects.all()), 45, lines_per_booking=2)
+        # Several bookings share a timestamp so the id tie-breaker is exercised.
+        Booking.objects.filter(id__in=[b.id for b in cls.bookings[10:20]]).update(booked_at=cls.bookings[10].booked_at)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, params):
+        seen, pages = [], []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['booking_id'] for row in response.data['results'])
+            pages.append(response)
+            if not response.data['next']:
+                return seen, pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_booking_once_in_order(self):
+        seen, pages = self.walk(reverse('booking-history'), {'user_id': self.user.id, 'page_size': 7})
+        expected = list(Booking.objects.order_by('-booked_at', '-id').values_list('booking_id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 7)
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        url = reverse('admin-booking-list')
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url, {'page_size': 5})
+        for _ in range(6):
+            response = self.client.get(response.data['next'])
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(response.data['next'])
+        self.assertEqual(len(first), len(deep))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('admin-booking-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = seed_catalog()
+
+    def setUp(self):
+        clear_catalog_cache()
+
+    def test_warm_reads_skip_the_database(self):
+        url = reverse('services-by-category', args=[self.categories[1].id])
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_matching_etag_returns_304_without_queries(self):
+        for name in ['city-list', 'category-list']:
+            etag = self.client.get(reverse(name))['ETag']
+            local_cache.clear()
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_catalog_writes_change_the_etag(self):
+        url = reverse('services-by-category', args=[self.categories[0].id])
+        etag = self.client.get(url)['ETag']
+        user = User.objects.create_user(username='admin', email='a@example.com', phone='9000000009', password='x')
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin-add-service'), {
+                'category': self.categories[0].id, 'name': 'Head massage', 'price': '499.00',
+                'duration': '30 mins', 'description': 'Relaxing head massage',
+            }, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Head massage', [row['name'] for row in response.data])
+
+    def test_city_delete_invalidates_city_list(self):
+        self.client.get(reverse('city-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            City.objects.filter(name='City 0').get().delete()
+        self.assertEqual(len(self.client.get(reverse('city-list')).data), 4)
+
+
+def run_threads(target, arguments, timeout=30):
+    """
+    Run ``target`` once per tuple in ``arguments``, each on its own thread,
+    and return whatever the workers raised, so a dead or stuck worker fails
+    the test instead of leaving fewer results behind.
+    """
+    errors = []
+
+    def work(*args):
+        try:
+            target(*args)
+        except BaseException as exc:
+            errors.append(exc)
+
+    workers = [threading.Thread(target=work, args=args) for args in arguments]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout)
+        if worker.is_alive():
+            errors.append(TimeoutError(f'{worker.name} still running after {timeout}s'))
+    return errors
+
+
+# SQLite ignores select_for_update, so these prove nothing there.
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ConcurrentCheckoutTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        seed_catalog(cities=1, categories=1)
+        self.city = City.objects.get()
+        call_command('open_timeslots', city=self.city.name, days=1, capacity=self.threads, stdout=StringIO())
+        self.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        self.cart = [Cart.objects.create(user=self.user, service=service, quantity=1) for service in Service.objects.all()[:3]]
+
+    def checkout(self, barrier, statuses):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        barrier.wait()
+        try:
+            response = client.post(reverse('confirm-booking'), {
+                'user_id': self.user.id, 'cart_ids': [item.id for item in self.cart], 'city_id': self.city.id,
+                'date': date.today().isoformat(), 'timeslot': '10:00 AM', 'address': '221B Baker Street',
+            }, format='json')
+            statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_same_cart_is_booked_exactly_once(self):
+        barrier = threading.Barrier(self.threads, timeout=10)
+        statuses = []
+        self.assertEqual(run_threads(self.checkout, [(barrier, statuses)] * self.threads), [])
+
+        self.assertEqual(len(statuses), self.threads)
+        self.assertEqual(statuses.count(201), 1)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(BookingService.objects.count(), 3)
+        self.assertFalse(Cart.objects.exists())
+
+
+class TimeslotInventoryTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(cities=2, categories=1)
+        cls.city, cls.other_city = City.objects.order_by('id')
+        cls.services = list(Service.objects.order_by('id')[:2])
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.start = date.today() + timedelta(days=1)
+        call_command('open_timeslots', city=cls.city.name, start=cls.start, days=7, capacity=2, stdout=StringIO())
+        call_command('open_timeslots', city=cls.other_city.name, start=cls.start, days=1, times='8:00 AM', capacity=1, stdout=StringIO())
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def book(self, timeslot='10:00 AM', services=None, city=None):
+        cart = [Cart.objects.get_or_create(user=self.user, service=service)[0] for service in services or self.services]
+        return self.client.post(reverse('confirm-booking'), {
+            'user_id': self.user.id, 'cart_ids': [item.id for item in cart], 'city_id': (city or self.city).id,
+            'date': self.start.isoformat(), 'timeslot': timeslot, 'address': '221B Baker Street',
+        }, format='json')
+
+    def slots(self, **params):
+        params = {'service_id': self.services[0].id, 'date': self.start.isoformat(), **params}
+        return self.client.get(reverse('choose-timeslot'), params)
+
+    def test_single_day_lists_open_slots_in_time_order(self):
+        response = self.slots(city_id=self.city.id)
+        self.assertEqual(response.data, ['10:00 AM', '12:00 PM', '3:00 PM', '5:00 PM'])
+        self.assertEqual(self.slots().data, ['8:00 AM', '10:00 AM', '12:00 PM', '3:00 PM', '5:00 PM'])
+
+    def test_week_of_availability_is_one_range_query(self):
+        with self.assertNumQueries(2):
+            response = self.slots(city_id=self.city.id, days=7)
+        self.assertEqual(len(response.data), 7)
+        self.assertTrue(all(len(slots) == 4 for slots in response.data.values()))
+
+    def test_booking_takes_a_seat_on_every_service(self):
+        self.assertEqual(self.book().status_code, 201)
+        seats = dict(TimeslotCapacity.objects.filter(
+            city=self.city, date=self.start, start_time='10:00'
+        ).values_list('service_id', 'booked'))
+        self.assertEqual([seats[service.id] for service in self.services], [1, 1])
+        self.assertEqual(sum(seats.values()), 2)
+        self.assertEqual(Booking.objects.get().city, self.city)
+
+    def test_full_slot_is_hidden_and_rejected(self):
+        self.assertEqual(self.book().status_code, 201)
+        self.assertEqual(self.book().status_code, 201)
+        self.assertNotIn('10:00 AM', self.slots(city_id=self.city.id).data)
+
+        response = self.book()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_partial_availability_rolls_back_every_seat(self):
+        TimeslotCapacity.objects.filter(service=self.services[1], date=self.start).update(booked=F('capacity'))
+        self.assertEqual(self.book().status_code, 409)
+        seat = TimeslotCapacity.objects.get(service=self.services[0], city=self.city, date=self.start, start_time='10:00')
+        self.assertEqual(seat.booked, 0)
+
+    def test_booking_needs_a_city(self):
+        cart = Cart.objects.create(user=self.user, service=self.services[0])
+        response = self.client.post(reverse('confirm-booking'), {
+            'user_id': self.user.id, 'cart_ids': [cart.id],
+            'date': self.start.isoformat(), 'timeslot': '10:00 AM', 'address': '221B Baker Street',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.exists())
+        self.assertTrue(Cart.objects.filter(id=cart.id).exists())
+
+        User.objects.filter(id=self.user.id).update(city=self.city)
+        response = self.client.post(reverse('confirm-booking'), {
+            'user_id': self.user.id, 'cart_ids': [cart.id],
+            'date': self.start.isoformat(), 'timeslot': '10:00 AM', 'address': '221B Baker Street',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(TimeslotCapacity.objects.get(service=self.services[0], city=self.city, date=self.start, start_time='10:00').booked, 1)
+
+    def test_unknown_slot_is_unavailable(self):
+        self.assertEqual(self.book(timeslot='11:00 PM').status_code, 409)
+        self.assertEqual(self.book(timeslot='soon').status_code, 400)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentReservationTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        seed_catalog(cities=1, categories=1)
+        self.city = City.objects.get()
+        self.service = Service.objects.order_by('id').first()
+        self.day = date.today() + timedelta(days=1)
+        TimeslotCapacity.objects.create(city=self.city, service=self.service, date=self.day, start_time='10:00', capacity=3)
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com', phone=f'90000001{i:02d}')
+            for i in range(self.threads)
+        ]
+
+    def checkout(self, user, barrier, statuses):
+        cart = Cart.objects.create(user=user, service=self.service)
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        try:
+            response = client.post(reverse('confirm-booking'), {
+                'user_id': user.id, 'cart_ids': [cart.id], 'city_id': self.city.id,
+                'date': self.day.isoformat(), 'timeslot': '10:00 AM', 'address': '221B Baker Street',
+            }, format='json')
+            statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_slot_is_never_overbooked(self):
+        barrier = threading.Barrier(self.threads, timeout=10)
+        statuses = []
+        self.assertEqual(run_threads(self.checkout, [(user, barrier, statuses) for user in self.users]), [])
+
+        seat = TimeslotCapacity.objects.get()
+        self.assertEqual(len(statuses), self.threads)
+        self.assertLessEqual(seat.booked, seat.capacity)
+        self.assertEqual(seat.booked, Booking.objects.count())
+        self.assertEqual(statuses.count(201), seat.booked)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCartTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        seed_catalog(cities=1, categories=1)
+        self.service = Service.objects.order_by('id').first()
+        self.user = User.objects.create(username='asha', email='asha@example.com', phone='9000000001')
+        Cart.objects.create(user=self.user, service=self.service, quantity=1)
+
+    def add(self, barrier):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        barrier.wait()
+        try:
+            client.post(reverse('add-to-cart'), {
+                'user_id': self.user.id, 'service_id': self.service.id, 'quantity': 1,
+            }, format='json')
+        finally:
+            connection.close()
+
+    def test_concurrent_adds_are_not_lost(self):
+        barrier = threading.Barrier(self.threads, timeout=10)
+        self.assertEqual(run_threads(self.add, [(barrier,)] * self.threads), [])
+        self.assertEqual(Cart.objects.get().quantity, self.threads + 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentRatingTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        seed_catalog(cities=1, categories=1)
+        self.user = User.objects.create(username='asha', email='asha@example.com', phone='9000000001')
+        self.booking = seed_bookings(self.user, list(Service.objects.order_by('id')), 2, lines_per_booking=1)[1]
+
+    def rate(self, barrier, rating, statuses):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        barrier.wait()
+        try:
+            response = client.post(reverse('submit-rating'), {'booking_id': self.booking.booking_id, 'rating': rating}, format='json')
+            statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_first_ratings_racing_count_once(self):
+        barrier = threading.Barrier(self.threads, timeout=10)
+        statuses = []
+        self.assertEqual(run_threads(self.rate, [(barrier, 4 + i % 2, statuses) for i in range(self.threads)]), [])
+
+        self.assertEqual(statuses, [201] * self.threads)
+        review = Review.objects.get()
+        summary = ServiceRating.objects.get()
+        self.assertEqual((summary.count, summary.total), (1, review.rating))
+        self.assertEqual(sum(summary.histogram.values()), 1)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+
+    def setUp(self):
+        local_tokens.clear()
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.factory = APIRequestFactory()
+
+    def authenticate(self):
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_steady_state_costs_no_queries(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_shared_cache_serves_other_processes(self):
+        self.authenticate()
+        local_tokens.clear()
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_logout_revokes_immediately(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.user, self.token)
+            self.client.post(reverse('logout'))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deactivation_revokes_immediately(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_caches_no_credentials(self):
+        self.authenticate()
+        cached = dict(cache.get(token_cache_key(self.token.key)))
+        self.assertEqual(cached['id'], self.user.id)
+        self.assertNotIn('password', cached)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertTrue(user.is_active and user.is_authenticated)
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_password_change_refreshes_cached_user(self):
+        self.authenticate()
+        self.user.set_password('changed')
+        self.user.save()
+        user, _ = self.authenticate()
+        self.assertTrue(user.check_password('changed'))
+
+
+class ImportCatalogTests(APITestCase):
+
+    def write(self, suffix, text):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with handle:
+            handle.write(text)
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def run_import(self, *args, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_catalog', *args, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_cities_and_categories_are_upserted_by_name(self):
+        City.objects.create(name='Delhi')
+        path = self.write('.csv', 'name\nDelhi\nMumbai\nPune\nMumbai\n')
+        out, _ = self.run_import('city', path)
+        self.assertEqual(sorted(City.objects.values_list('name', flat=True)), ['Delhi', 'Mumbai', 'Pune'])
+        self.assertIn('Imported 3 of 4 rows (0 invalid)', out)
+
+        path = self.write('.jsonl', '{"name": "Facial"}\n\n{"name": "Waxing"}\n')
+        self.run_import('category', path)
+        self.assertEqual(Category.objects.count(), 2)
+
+    def test_services_stream_in_batches_and_update_on_reimport(self):
+        Category.objects.create(name='Facial')
+        Category.objects.create(name='Waxing')
+        rows = ''.join(
+            json.dumps({'category': ['Facial', 'Waxing'][i % 2], 'name': f'Service {i}', 'price': '199.00',
+                        'duration': '30 mins', 'description': 'Imported'}) + '\n'
+            for i in range(250)
+        )
+        path = self.write('.jsonl', rows)
+        with CaptureQueriesContext(connection) as ctx:
+            out, _ = self.run_import('service', path, batch_size=100)
+        self.assertEqual(Service.objects.count(), 250)
+        self.assertEqual(out.count('rows processed'), 3)
+        # One category lookup and one upsert per chunk, plus savepoints.
+        self.assertLessEqual(len(ctx), 3 * 4)
+
+        path = self.write('.jsonl', rows.replace('199.00', '249.00'))
+        self.run_import('service', path, batch_size=100)
+        self.assertEqual(Service.objects.count(), 250)
+        self.assertEqual(set(Service.objects.values_list('price', flat=True)), {Decimal('249.00')})
+
+    def test_failed_import_still_bumps_the_catalog_version(self):
+        version = get_catalog_version()
+        path = self.write('.jsonl', '{"name": "Delhi"}\n{"name": \n')
+        with self.assertRaises(CommandError):
+            self.run_import('city', path, batch_size=1)
+        self.assertTrue(City.objects.filter(name='Delhi').exists())
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        Category.objects.create(name='Facial')
+        path = self.write('.csv', (
+            'category,name,price,duration,description\n'
+            'Facial,Gold facial,999.00,60 mins,Glow\n'
+            'Nails,Manicure,499.00,45 mins,Unknown category\n'
+            'Facial,Fruit facial,cheap,45 mins,Bad price\n'
+        ))
+        out, err = self.run_import('service', path)
+        self.assertEqual(list(Service.objects.values_list('name', flat=True)), ['Gold facial'])
+        self.assertIn('row 2:', err)
+        self.assertIn('row 3:', err)
+        self.assertIn('(2 invalid)', out)
+
+
+class ServiceRatingTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = seed_catalog(categories=1)[0]
+        cls.services = list(Service.objects.order_by('id'))
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.bookings = [booking for booking in seed_bookings(cls.user, cls.services, 6, lines_per_booking=2) if booking.status == 'Completed']
+
+    def setUp(self):
+        clear_catalog_cache()
+        self.client.force_authenticate(self.user)
+
+    def rate(self, booking, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('submit-rating'), {'booking_id': booking.booking_id, 'rating': rating}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def catalog_ratings(self):
+        response = self.client.get(reverse('services-by-category', args=[self.category.id]))
+        return {row['id']: row['rating'] for row in response.data}
+
+    def test_reviews_update_every_service_in_the_booking(self):
+        self.rate(self.bookings[0], 5)
+        self.rate(self.bookings[1], 3)
+        ratings = self.catalog_ratings()
+        self.assertEqual(ratings[self.services[0].id], {
+            'count': 2, 'average': 4.0, 'histogram': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1},
+        })
+        self.assertEqual(ratings[self.services[4].id], {
+            'count': 0, 'average': None, 'histogram': {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0},
+        })
+
+    def test_rating_only_invalidates_its_categories_listing(self):
+        other = Category.objects.create(name='Other')
+        urls = [reverse('services-by-category', args=[self.category.id]), reverse('services-by-category', args=[other.id]), reverse('category-list')]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.rate(self.bookings[0], 5)
+        self.assertNotEqual(self.client.get(urls[0], HTTP_IF_NONE_MATCH=etags[0]).status_code, 304)
+        self.assertEqual([self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code for url, etag in zip(urls[1:], etags[1:])], [304, 304])
+
+    def test_editing_a_review_moves_it_between_buckets(self):
+        self.rate(self.bookings[0], 2)
+        self.rate(self.bookings[0], 4)
+        summary = ServiceRating.objects.get(service=self.services[1])
+        self.assertEqual((summary.count, summary.total, summary.stars_2, summary.stars_4), (1, 4, 0, 1))
+
+    def test_rebuild_matches_incremental_summaries(self):
+        for booking, rating in zip(self.bookings, [5, 1, 4]):
+            self.rate(booking, rating)
+        incremental = list(ServiceRating.objects.order_by('service_id').values())
+        ServiceRating.objects.update(count=0, total=0, stars_5=0)
+        call_command('rebuild_service_ratings', batch_size=2, stdout=StringIO())
+        rebuilt = [row for row in ServiceRating.objects.order_by('service_id').values() if row['count']]
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(ServiceRating.objects.count(), len(self.services))
+
+
+class ServiceSearchIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = ServiceSearchIndex()
+        self.index.add(1, 'Gold Facial', 'Brightening facial with gold foil', 'Facial')
+        self.index.add(2, 'Fruit Cleanup', 'Quick cleanup for oily skin', 'Facial')
+        self.index.add(3, 'Full Arms Waxing', 'Rica waxing for arms', 'Waxing')
+        self.index.add(4, 'Manicure', 'Classic manicure with gold polish', 'Hands & Feet')
+
+    def test_name_matches_outrank_description_matches(self):
+        self.assertEqual(self.index.search('gold'), [1, 4])
+
+    def test_last_term_autocompletes(self):
+        self.assertEqual(self.index.search('wax'), [3])
+        self.assertEqual(self.index.search('gold fac'), [1])
+
+    def test_single_typo_is_tolerated(self):
+        self.assertEqual(self.index.search('manicrue'), [4])
+        self.assertEqual(self.index.search('wxing'), [3])
+        self.assertEqual(self.index.search('clenup'), [2])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.index.search('gold waxing'), [])
+        self.assertEqual(self.index.search('facial skin'), [2])
+
+    def test_updates_and_removals(self):
+        self.index.add(3, 'Half Legs Waxing', 'Rica waxing', 'Waxing')
+        self.assertEqual(self.index.search('arms'), [])
+        self.assertEqual(self.index.search('legs'), [3])
+        self.index.remove(3)
+        self.assertEqual(self.index.search('waxing'), [])
+        self.assertNotIn('rica', self.index.vocabulary)
+
+
+class ServiceSearchViewTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.facial = Category.objects.create(name='Facial')
+        Service.objects.create(category=cls.facial, name='Gold Facial', price='999.00', duration='60 mins', description='Glow')
+        Service.objects.create(category=cls.facial, name='Fruit Cleanup', price='499.00', duration='30 mins', description='Fresh')
+
+    def setUp(self):
+        clear_catalog_cache()
+        search_index.reset()
+
+    def search(self, query):
+        return [row['name'] for row in self.client.get(reverse('service-search'), {'q': query}).data]
+
+    def test_results_are_ranked_services(self):
+        response = self.client.get(reverse('service-search'), {'q': 'gold'})
+        self.assertEqual(response.data[0]['name'], 'Gold Facial')
+        self.assertEqual(response.data[0]['rating']['count'], 0)
+        self.assertEqual(self.client.get(reverse('service-search')).status_code, 400)
+
+    def test_index_follows_service_and_category_writes(self):
+        self.assertEqual(self.search('facial'), ['Gold Facial', 'Fruit Cleanup'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(category=self.facial, name='Diamond Facial', price='1299.00', duration='60 mins', description='Shine')
+        self.assertEqual(self.search('diamnd'), ['Diamond Facial'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.facial.name = 'Skin Care'
+            self.facial.save()
+        self.assertEqual(self.search('skin'), ['Gold Facial', 'Fruit Cleanup', 'Diamond Facial'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.filter(name='Gold Facial').get().delete()
+        self.assertEqual(self.search('gold'), [])
+
+    def test_writes_elsewhere_trigger_a_rebuild(self):
+        self.assertEqual(self.search('cleanup'), ['Fruit Cleanup'])
+        Service.objects.filter(name='Fruit Cleanup').update(name='Fruit Detan')
+        invalidate_search_index()
+        with patch('yes_madam_api.search.threading.Thread') as thread:
+            self.client.get(reverse('service-search'), {'q': 'detan'})
+        thread.return_value.start.assert_called_once()
+        search_index.rebuild(*thread.call_args.kwargs['args'])
+        self.assertEqual(self.search('detan'), ['Fruit Detan'])
+
+    def test_local_change_keeps_the_index_only_if_it_was_current(self):
+        self.assertEqual(self.search('facial'), ['Gold Facial', 'Fruit Cleanup'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(category=self.facial, name='Diamond Facial', price='1299.00', duration='60 mins', description='Shine')
+        with patch('yes_madam_api.search.threading.Thread') as thread:
+            self.assertEqual(self.search('diamond'), ['Diamond Facial'])
+        thread.assert_not_called()
+
+        # Another process changes the catalog before this one does.
+        Service.objects.filter(name='Fruit Cleanup').update(name='Fruit Detan')
+        invalidate_search_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(category=self.facial, name='Pearl Facial', price='899.00', duration='45 mins', description='Glow')
+        with patch('yes_madam_api.search.threading.Thread') as thread:
+            self.client.get(reverse('service-search'), {'q': 'detan'})
+        thread.return_value.start.assert_called_once()
+        search_index.rebuild(*thread.call_args.kwargs['args'])
+        self.assertEqual(self.search('detan'), ['Fruit Detan'])
+
+    def test_warm_up_starts_with_the_first_request(self):
+        request_started.connect(warm_on_first_request, dispatch_uid=WARM_UID)
+        self.addCleanup(request_started.disconnect, dispatch_uid=WARM_UID)
+        with patch.object(search_index, 'warm') as warm:
+            self.client.get(reverse('city-list'))
+            self.client.get(reverse('city-list'))
+        warm.assert_called_once()
+
+    def test_startup_warm_up_spares_the_first_search(self):
+        with patch('yes_madam_api.search.threading.Thread') as thread:
+            search_index.warm()
+        thread.return_value.start.assert_called_once()
+        self.assertFalse(search_index.built.is_set())
+        with patch('yes_madam_api.search.connection'):
+            search_index.rebuild_in_background(*thread.call_args.kwargs['args'])
+        with patch.object(search_index, 'rebuild') as rebuild:
+            self.assertEqual(self.search('gold'), ['Gold Facial'])
+        rebuild.assert_not_called()
+
+
+class ServiceAreaTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bengaluru = City.objects.create(name='Bengaluru', latitude=12.9716, longitude=77.5946, radius_km=30)
+        cls.mysuru = City.objects.create(name='Mysuru', latitude=12.2958, longitude=76.6394, radius_km=15)
+        cls.pune = City.objects.create(name='Pune')
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+
+    def setUp(self):
+        clear_catalog_cache()
+        self.client.force_authenticate(self.user)
+
+    def set_location(self, latitude, longitude, city=''):
+        return self.client.post(reverse('set-location'), {
+            'user_id': self.user.id, 'city': city, 'latitude': latitude, 'longitude': longitude,
+        }, format='json')
+
+    def test_index_picks_the_nearest_covering_city(self):
+        index = ServiceAreaIndex([(1, 'A', 10.0, 10.0, 50), (2, 'B', 10.0, 10.6, 50)])
+        self.assertEqual(index.locate(10.0, 10.1), 1)
+        self.assertEqual(index.locate(10.0, 10.5), 2)
+        self.assertIsNone(index.locate(10.0, 11.5))
+        self.assertIsNone(index.locate(-10.0, 10.0))
+
+    def test_coordinates_resolve_and_persist_the_city(self):
+        response = self.set_location(12.93, 77.62, city='Mysuru')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['city_id'], self.bengaluru.id)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.city, self.user.latitude, self.user.longitude), (self.bengaluru, 12.93, 77.62))
+
+    def test_city_name_is_a_fallback_and_unknown_areas_are_rejected(self):
+        self.assertEqual(self.set_location(18.52, 73.85, city='pune').data['city_id'], self.pune.id)
+        self.assertEqual(self.set_location(18.52, 73.85, city='Atlantis').status_code, 400)
+        self.assertEqual(self.set_location(18.52, 73.85).status_code, 400)
+        self.assertEqual(self.set_location(95, 73.85, city='Pune').status_code, 400)
+
+    def test_city_changes_rebuild_the_index(self):
+        self.assertEqual(self.set_location(12.30, 76.64).data['city_id'], self.mysuru.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            City.objects.filter(pk=self.mysuru.pk).get().delete()
+        self.assertEqual(self.set_location(12.30, 76.64).status_code, 400)
+
+    def test_stored_city_scopes_timeslots(self):
+        category = Category.objects.create(name='Facial')
+        service = Service.objects.create(category=category, name='Gold Facial', price='999.00', duration='60 mins', description='Glow')
+        start = date.today() + timedelta(days=1)
+        call_command('open_timeslots', city='Mysuru', start=start, days=1, times='8:00 AM', capacity=1, stdout=StringIO())
+        call_command('open_timeslots', city='Bengaluru', start=start, days=1, times='9:00 AM', capacity=1, stdout=StringIO())
+        self.set_location(12.97, 77.59)
+        self.user.refresh_from_db()
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('choose-timeslot'), {'service_id': service.id, 'date': start.isoformat()})
+        self.assertEqual(response.data, ['9:00 AM'])
+
+
+class IdempotencyKeyTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(cities=1, categories=1)
+        cls.services = list(Service.objects.order_by('id')[:2])
+        cls.city = City.objects.get()
+        call_command('open_timeslots', city=cls.city.name, days=1, stdout=StringIO())
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def add(self, key, quantity=1):
+        return self.client.post(reverse('add-to-cart'), {
+            'user_id': self.user.id, 'service_id': self.services[0].id, 'quantity': quantity,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def book(self, key):
+        cart = [Cart.objects.get_or_create(user=self.user, service=service)[0] for service in self.services]
+        return self.client.post(reverse('confirm-booking'), {
+            'user_id': self.user.id, 'cart_ids': [item.id for item in cart], 'city_id': self.city.id,
+            'date': date.today().isoformat(), 'timeslot': '10:00 AM', 'address': '221B Baker Street',
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_the_first_response_without_queries(self):
+        first = self.book('checkout-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.client.post(reverse('confirm-booking'), json.loads(first.wsgi_request.body), format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_cart_is_incremented_once_per_key(self):
+        self.add('a')
+        self.add('a')
+        self.add('b')
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 2)
+
+    def test_reused_key_with_another_body_is_rejected(self):
+        self.add('a')
+        self.assertEqual(self.add('a', quantity=3).status_code, 422)
+        self.assertEqual(self.add('x' * 256).status_code, 400)
+
+    def test_duplicate_in_flight_is_told_to_retry(self):
+        duplicates = []
+        add_items = Cart.objects.add_items
+
+        def slow_add_items(*args):
+            duplicates.append(self.add('a'))
+            return add_items(*args)
+
+        with patch.object(Cart.objects, 'add_items', side_effect=slow_add_items):
+            self.assertEqual(self.add('a').status_code, 200)
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(duplicates[0]['Retry-After'], '1')
+        self.assertEqual(self.add('a')['Idempotent-Replayed'], 'true')
+
+    def test_server_errors_release_the_key(self):
+        with patch.object(BookingService.objects, 'bulk_create', side_effect=RuntimeError('down')):
+            self.assertEqual(self.book('checkout-1').status_code, 500)
+        self.assertEqual(self.book('checkout-1').status_code, 201)
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+    def test_every_creating_post_accepts_a_key(self):
+        # Logging in and out and setting a location are safe to repeat;
+        # registration has no user to scope keys to; batch only reads.
+        excluded = {'register', 'login', 'logout', 'set-location', 'batch'}
+        for pattern in urlpatterns:
+            post = getattr(pattern.callback.view_class, 'post', None)
+            if post is not None and pattern.name not in excluded:
+                self.assertTrue(hasattr(post, '__wrapped__'), f'{pattern.name} is not idempotent')
+
+
+class FlakyGateway(SimulatedGateway):
+    def __init__(self, failures):
+        super().__init__(latency=0)
+        self.failures = failures
+        self.calls = 0
+
+    def charge(self, reference, amount, method):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise GatewayError('timeout')
+        return super().charge(reference, amount, method)
+
+
+@override_settings(YES_MADAM_API={'PAYMENT_RETRY_BACKOFF': 0, 'PAYMENT_MAX_ATTEMPTS': 3, 'PAYMENT_FLUSH_INTERVAL': 0.01})
+class PaymentPipelineTests(TransactionTestCase):
+
+    def setUp(self):
+        seed_catalog(cities=1, categories=1)
+        self.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        self.bookings = seed_bookings(self.user, list(Service.objects.all()), 6)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def initiate(self, booking):
+        return self.client.post(reverse('initiate-payment'), {
+            'booking_id': booking.booking_id, 'payment_method': 'UPI',
+        }, format='json')
+
+    def test_initiation_returns_at_once_and_workers_settle_the_payment(self):
+        pipeline = PaymentPipeline(SimulatedGateway(latency=0.05))
+        with patch('yes_madam_api.views.payment_pipeline', pipeline):
+            started = time.perf_counter()
+            responses = [self.initiate(booking) for booking in self.bookings]
+            elapsed = time.perf_counter() - started
+            self.assertEqual({response.status_code for response in responses}, {202})
+            self.assertLess(elapsed, 0.05 * len(self.bookings))
+            pipeline.wait()
+
+            payments = Payment.objects.all()
+            self.assertEqual({payment.status for payment in payments}, {'Success'})
+            self.assertEqual(len({payment.transaction_id for payment in payments}), len(self.bookings))
+            response = self.initiate(self.bookings[0])
+            self.assertEqual((response.status_code, response.data['status']), (200, 'Success'))
+
+    def test_transient_errors_are_retried_and_declines_are_final(self):
+        pipeline = PaymentPipeline(FlakyGateway(failures=2))
+        self.assertEqual(pipeline.charge(1, 'YM1', Decimal('10.00'), 'UPI')[2], 'Success')
+        pipeline.gateway = FlakyGateway(failures=3)
+        self.assertEqual(pipeline.charge(1, 'YM1', Decimal('10.00'), 'UPI'), (1, 'YM1', 'Failed', None))
+        pipeline.gateway = SimulatedGateway(latency=0, decline_rate=1)
+        with patch.object(pipeline.gateway, 'charge', side_effect=PaymentDeclined) as charge:
+            self.assertEqual(pipeline.charge(1, 'YM1', Decimal('10.00'), 'UPI')[2], 'Failed')
+        self.assertEqual(charge.call_count, 1)
+
+    def test_stale_pending_payments_are_resumed(self):
+        payments = Payment.objects.bulk_create([Payment(booking=booking, payment_method='UPI') for booking in self.bookings[:5]])
+        ten_minutes_ago = timezone.now() - timedelta(minutes=10)
+        Payment.objects.filter(id__in=[payment.id for payment in payments[:2]]).update(pending_since=ten_minutes_ago)
+        Payment.objects.filter(id=payments[1].id).update(status='Failed')
+        # Created long ago but initiated again just now: not stale.
+        Payment.objects.filter(id=payments[3].id).update(paid_at=ten_minutes_ago)
+        # Its booking timed out unpaid: failed, never charged.
+        Payment.objects.filter(id=payments[4].id).update(pending_since=ten_minutes_ago)
+        Booking.objects.filter(id=payments[4].booking_id).update(status='Cancelled')
+        pipeline = PaymentPipeline(SimulatedGateway(latency=0))
+        self.assertEqual(pipeline.resume_pending(), 1)
+        pipeline.wait()
+        self.assertEqual(
+            list(Payment.objects.order_by('id').values_list('status', flat=True)), ['Success', 'Failed', 'Pending', 'Pending', 'Failed'],
+        )
+        self.assertTrue(PendingRollup.objects.filter(booking_id=payments[4].booking_id).exists())
+
+        out = StringIO()
+        with patch('yes_madam_api.management.commands.resume_payments.payment_pipeline', pipeline):
+            call_command('resume_payments', older_than=0, stdout=out)
+        self.assertIn('resumed 2 payments', out.getvalue())
+        self.assertEqual(Payment.objects.filter(status='Pending').count(), 0)
+
+    def test_resume_on_start_is_opt_in(self):
+        for enabled in (False, True):
+            pipeline = PaymentPipeline(SimulatedGateway(latency=0))
+            resumed = threading.Event()
+            with patch.object(pipeline, 'resume_on_start', side_effect=resumed.set):
+                with override_settings(YES_MADAM_API={'PAYMENT_RESUME_ON_START': enabled}):
+                    pipeline.start()
+                self.assertEqual(resumed.wait(1 if enabled else 0.1), enabled)
+
+    def test_results_land_in_one_update_per_batch(self):
+        payments = Payment.objects.bulk_create([Payment(booking=booking, payment_method='UPI') for booking in self.bookings])
+        pipeline = PaymentPipeline()
+        with CaptureQueriesContext(connection) as ctx:
+            pipeline.flush([(payment.id, payment.booking.booking_id, 'Success', f'TXN{payment.id}') for payment in payments])
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "yes_madam_api_payment"') for query in ctx.captured_queries), 1)
+        self.assertEqual(Payment.objects.filter(status='Success').count(), len(payments))
+
+
+class NotificationHubTests(SimpleTestCase):
+
+    def test_waiters_wake_on_their_own_topic_only(self):
+        hub = NotificationHub(100)
+        woken = []
+        waiters = [
+            threading.Thread(target=lambda topic=topic: woken.append((topic, hub.wait(topic, 0, 2))))
+            for topic in ('a', 'b')
+        ]
+        for thread in waiters:
+            thread.start()
+        while len(hub) < 2:
+            time.sleep(0.001)
+        hub.publish('a')
+        waiters[0].join()
+        self.assertEqual(woken, [('a', True)])
+        self.assertEqual(len(hub), 1)
+        hub.publish('b')
+        waiters[1].join()
+        self.assertEqual(len(hub), 0)
+
+    def test_changes_before_waiting_are_not_missed(self):
+        hub = NotificationHub(100)
+        seen = hub.current('a')
+        hub.publish('a')
+        self.assertTrue(hub.wait('a', seen, 0))
+        self.assertFalse(hub.wait('a', hub.current('a'), 0.01))
+
+
+@override_settings(YES_MADAM_API={'NOTIFICATION_STREAM_MAX_AGE': 0.5, 'NOTIFICATION_KEEPALIVE': 0.05})
+class BookingEventTests(TransactionTestCase):
+
+    def setUp(self):
+        seed_catalog(cities=1, categories=1)
+        self.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        self.booking = seed_bookings(self.user, list(Service.objects.all()), 1)[0]
+        self.payment = Payment.objects.create(booking=self.booking, payment_method='UPI', status='Pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def settle_later(self, delay=0.1):
+        def settle():
+            time.sleep(delay)
+            Payment.objects.filter(pk=self.payment.pk).update(status='Success', transaction_id='TXN0000001')
+            publish_booking_change(self.booking.booking_id)
+            connection.close()
+
+        thread = threading.Thread(target=settle)
+        thread.start()
+        return thread
+
+    def test_long_poll_returns_as_soon_as_the_payment_settles(self):
+        url = reverse('booking-events', args=[self.booking.booking_id])
+        version = self.client.get(url).data['version']
+        thread = self.settle_later()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'since': version, 'timeout': 5})
+        thread.join()
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual((response.data['payment_status'], response.data['transaction_id']), ('Success', 'TXN0000001'))
+        self.assertEqual(len(ctx), 2)
+
+    def test_long_poll_times_out_with_the_same_version(self):
+        url = reverse('booking-events', args=[self.booking.booking_id])
+        version = self.client.get(url).data['version']
+        self.assertEqual(self.client.get(url, {'since': version, 'timeout': 0.01}).data['version'], version)
+        self.assertEqual(self.client.get(url, {'timeout': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('booking-events', args=['YM000000'])).status_code, 404)
+
+    def test_stream_pushes_each_change(self):
+        thread = self.settle_later()
+        response = self.client.get(reverse('booking-event-stream', args=[self.booking.booking_id]))
+        events = [json.loads(chunk.split(b'data: ')[1]) for chunk in consume(response) if chunk.startswith(b'event:')]
+        thread.join()
+        self.assertEqual([event['payment_status'] for event in events], ['Pending', 'Success'])
+
+
+class AsyncViewParityTests(APITestCase):
+    factory = APIRequestFactory()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = seed_catalog()
+        cls.services = list(Service.objects.order_by('id'))
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.bookings = seed_bookings(cls.user, cls.services, 25)
+        Payment.objects.create(booking=cls.bookings[0], payment_method='UPI', transaction_id='TXN0000001', status='Success')
+        Cart.objects.add_items(cls.user.id, {service.id: 2 for service in cls.services[:3]})
+        ServiceRating.objects.record([cls.services[0].id], 4)
+
+    def setUp(self):
+        clear_catalog_cache()
+        local_tokens.clear()
+        cache.clear()
+
+    def both(self, name, path, params=None, token=True, **kwargs):
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'} if token else {}
+        sync_response = getattr(views, name).as_view()(self.factory.get(path, params, **headers), **kwargs)
+        sync_response.render()
+        async_response = async_to_sync(getattr(async_views, name).as_view())(self.factory.get(path, params, **headers), **kwargs)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        return async_response
+
+    def test_catalog_views_match(self):
+        self.both('CityListView', '/cities/')
+        self.both('CategoryListView', '/categories/', token=False)
+        response = self.both('ServiceByCategoryView', '/services/', category_id=self.categories[0].id)
+        self.assertEqual(json.loads(response.content)[0]['rating']['count'], 1)
+        etag = response['ETag']
+        revalidated = async_to_sync(async_views.ServiceByCategoryView.as_view())(
+            self.factory.get('/services/', HTTP_IF_NONE_MATCH=etag), category_id=self.categories[0].id,
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_user_views_match(self):
+        self.assertEqual(len(json.loads(self.both('ViewCartView', '/cart/', {'user_id': self.user.id}).content)), 3)
+        self.both('PaymentStatusView', '/payment/', booking_id=self.bookings[0].booking_id)
+        self.both('PaymentStatusView', '/payment/', booking_id='YM000000')
+
+    def test_booking_history_pages_match(self):
+        page = json.loads(self.both('BookingHistoryView', '/bookings/', {'user_id': self.user.id}).content)
+        self.assertEqual(len(page['results']), 20)
+        cursor = page['next'].split('cursor=')[1]
+        self.both('BookingHistoryView', '/bookings/', {'user_id': self.user.id, 'cursor': cursor})
+        self.both('BookingHistoryView', '/bookings/', {'user_id': self.user.id, 'cursor': 'bogus'})
+
+    def test_views_use_the_configured_authenticators(self):
+        self.assertEqual(async_views.ViewCartView.authentication_classes, views.ViewCartView().authentication_classes)
+        view = async_views.ViewCartView.as_view(authentication_classes=[CachedTokenAuthentication])
+        request = self.factory.get('/cart/', {'user_id': self.user.id}, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        async_to_sync(view)(request)
+        with self.assertNumQueries(1):
+            request = self.factory.get('/cart/', {'user_id': self.user.id}, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            self.assertEqual(async_to_sync(view)(request).status_code, 200)
+
+    def test_authentication_errors_match(self):
+        self.both('ViewCartView', '/cart/', {'user_id': self.user.id}, token=False)
+        request = self.factory.get('/cart/', HTTP_AUTHORIZATION='Token nope')
+        response = async_to_sync(async_views.ViewCartView.as_view())(request)
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Token'))
+
+
+class FastSerializationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+        cls.services = list(Service.objects.order_by('id'))
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.bookings = seed_bookings(cls.user, cls.services, 25)
+        Booking.objects.filter(pk=cls.bookings[3].pk).update(address='Flat 4\u2028Ch\u00e2teau Road', total_amount=Decimal('1234.50'))
+        Cart.objects.add_items(cls.user.id, {service.id: 2 for service in cls.services[:3]})
+        ServiceRating.objects.record([cls.services[0].id], 4)
+        ServiceRating.objects.record([cls.services[0].id, cls.services[1].id], 5)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def both(self, url, params):
+        with CaptureQueriesContext(connection) as serializer_queries:
+            expected = self.client.get(url, params)
+        with override_settings(YES_MADAM_API={'FAST_SERIALIZATION': True}):
+            with CaptureQueriesContext(connection) as fast_queries:
+                fast = self.client.get(url, params)
+        self.assertEqual(fast.status_code, expected.status_code)
+        self.assertEqual(hasattr(fast, 'data'), fast.status_code != 200)
+        self.assertEqual(fast['Content-Type'], expected['Content-Type'])
+        self.assertEqual(fast.content, expected.content)
+        self.assertLessEqual(len(fast_queries), len(serializer_queries))
+        return fast
+
+    def test_booking_history_is_byte_identical(self):
+        page = json.loads(self.both(reverse('booking-history'), {'user_id': self.user.id}).content)
+        cursor = parse_qs(urlsplit(page['next']).query)['cursor'][0]
+        self.assertEqual(len(json.loads(self.both(reverse('booking-history'), {'user_id': self.user.id, 'cursor': cursor}).content)['results']), 5)
+        self.both(reverse('booking-history'), {'user_id': self.user.id, 'cursor': 'bogus'})
+        self.both(reverse('booking-history'), {'user_id': 0})
+
+    def test_admin_booking_list_is_byte_identical(self):
+        page = json.loads(self.both(reverse('admin-booking-list'), {'page_size': 7}).content)
+        self.assertEqual(len(page['results']), 7)
+        self.assertEqual(page['results'][0]['user_username'], 'asha')
+        response = self.both(reverse('admin-booking-list'), {'page_size': 30})
+        self.assertIn('Flat 4\\u2028Ch\u00e2teau Road'.encode(), response.content)
+
+    def test_cart_is_byte_identical(self):
+        cart = json.loads(self.both(reverse('view-cart'), {'user_id': self.user.id}).content)
+        self.assertEqual([line['service']['rating']['count'] for line in cart], [2, 1, 0])
+        self.assertEqual(cart[0]['service']['rating']['average'], 4.5)
+
+    def test_browsable_api_keeps_the_serializer(self):
+        with override_settings(YES_MADAM_API={'FAST_SERIALIZATION': True}):
+            response = self.client.get(reverse('view-cart'), {'user_id': self.user.id}, HTTP_ACCEPT='application/json; indent=2')
+        self.assertEqual(len(response.data), 3)
+
+
+def rollup_tables():
+    # As they stand once the background sync has caught up.
+    sync_pending_rollups(100)
+    bookings = BookingRollup.objects.filter(bookings__gt=0).values_list('date', 'status', 'payment_method', 'payment_status', 'bookings', 'revenue')
+    services = ServiceRollup.objects.filter(lines__gt=0).values_list('date', 'status', 'service_id', 'lines', 'quantity', 'revenue')
+    return set(bookings), set(services)
+
+
+class AnalyticsRollupTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+        cls.services = list(Service.objects.order_by('id'))
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.staff = User.objects.create_user(username='nila', email='nila@example.com', phone='9000000009', password='secret', is_staff=True)
+
+    def book(self, day, amount='500.00', lines=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                user=self.user, booking_id=f'YA{Booking.objects.count():06d}', date=day, timeslot='10:00 AM',
+                address='221B Baker Street', total_amount=Decimal(amount), status='Confirmed',
+            )
+            BookingService.objects.bulk_create([
+                BookingService(booking=booking, service=service, quantity=2, price_at_booking=service.price)
+                for service in self.services[:lines]
+            ])
+        return booking
+
+    def test_rollups_follow_booking_and_payment_changes(self):
+        today = date.today()
+        booking = self.book(today)
+        self.book(today, '250.00', lines=1)
+        self.assertEqual(rollup_tables()[0], {(today, 'Confirmed', '', '', 2, Decimal('750.00'))})
+        self.assertEqual(ServiceRollup.objects.get(service=self.services[0]).quantity, 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.create(booking=booking, payment_method='Card', status='Pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.status = 'Success'
+            payment.save()
+            booking.status = 'Completed'
+            booking.save()
+        self.assertEqual(rollup_tables()[0], {
+            (today, 'Confirmed', '', '', 1, Decimal('250.00')),
+            (today, 'Completed', 'Card', 'Success', 1, Decimal('500.00')),
+        })
+        self.assertEqual(ServiceRollup.objects.get(service=self.services[1], status='Completed').quantity, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertEqual(rollup_tables()[0], {(today, 'Confirmed', '', '', 1, Decimal('250.00'))})
+        self.assertEqual(len(rollup_tables()[1]), 1)
+
+    def test_changes_are_queued_for_the_background_sync(self):
+        booking = self.book(date.today())
+        self.assertFalse(BookingRollup.objects.exists())
+        self.assertEqual(list(PendingRollup.objects.values_list('booking_id', flat=True)), [booking.id])
+        out = StringIO()
+        call_command('sync_analytics', batch_size=1, stdout=out)
+        self.assertIn('1 bookings synced', out.getvalue())
+        self.assertFalse(PendingRollup.objects.exists())
+        self.assertEqual(rollup_tables()[0], {(date.today(), 'Confirmed', '', '', 1, Decimal('500.00'))})
+
+    def test_sync_only_applies_changes(self):
+        booking = self.book(date.today())
+        before = rollup_tables()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(sync_booking_rollups([booking.id]), 0)
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in ctx.captured_queries))
+        self.assertEqual(rollup_tables(), before)
+
+    def test_backfill_matches_incremental_updates(self):
+        for offset in range(6):
+            self.book(date.today() - timedelta(days=offset), f'{100 * (offset + 1)}.00', lines=offset % 3 + 1)
+        incremental = rollup_tables()
+        call_command('rebuild_analytics', batch_size=4, stdout=StringIO())
+        self.assertEqual(rollup_tables(), incremental)
+
+        # Bulk inserts skip the signals; the backfill picks them up.
+        bulk = seed_bookings(self.user, self.services, 8, start=500)
+        Payment.objects.bulk_create([Payment(booking=booking, payment_method='UPI', status='Failed') for booking in bulk[:3]])
+        call_command('rebuild_analytics', batch_size=4, stdout=StringIO())
+        rebuilt = rollup_tables()
+        self.assertEqual(sum(row[4] for row in rebuilt[0]), 14)
+        self.assertIn((date.today(), 'Confirmed', 'UPI', 'Failed', 1, Decimal('0.00')), rebuilt[0])
+
+        BookingRollup.objects.update(bookings=0)
+        call_command('rebuild_analytics', date_from=date.today() - timedelta(days=2), date_to=date.today(), stdout=StringIO())
+        self.assertEqual(rollup_tables()[0], {row for row in rebuilt[0] if row[0] >= date.today() - timedelta(days=2)})
+        call_command('rebuild_analytics', stdout=StringIO())
+        self.assertEqual(rollup_tables(), rebuilt)
+
+    def test_summary_endpoint(self):
+        today = date.today()
+        first = self.book(today, '500.00')
+        second = self.book(today - timedelta(days=40), '300.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(booking=first, payment_method='UPI', status='Success')
+            Payment.objects.create(booking=second, payment_method='UPI', status='Failed')
+            second.status = 'Cancelled'
+            second.save()
+        sync_pending_rollups(100)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('admin-analytics')).status_code, 403)
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(reverse('admin-analytics'))
+        self.assertEqual((response.data['bookings'], response.data['revenue']), (1, '500.00'))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('admin-analytics'), {
+                'date_from': (today - timedelta(days=60)).isoformat(), 'top_services': 1,
+            })
+        self.assertEqual(response.data['by_status'], {
+            'Confirmed': {'bookings': 1, 'revenue': '500.00'}, 'Cancelled': {'bookings': 1, 'revenue': '300.00'},
+        })
+        self.assertEqual(response.data['payments']['UPI']['success_rate'], 0.5)
+        self.assertEqual(response.data['services'], [{
+            'service_id': self.services[1].id, 'service_name': self.services[1].name, 'bookings': 1, 'quantity': 2, 'revenue': '598.00',
+        }])
+        response = self.client.get(reverse('admin-analytics'), {'date_from': today.isoformat(), 'date_to': (today - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingArchiveTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+        cls.services = list(Service.objects.order_by('id'))
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        # Odd offsets are Completed, even ones Confirmed; a day apart each.
+        cls.bookings = seed_bookings(cls.user, cls.services, 30)
+        Payment.objects.bulk_create([Payment(booking=booking, payment_method='UPI', status='Success') for booking in cls.bookings])
+        Review.objects.bulk_create([Review(booking=booking, user=cls.user, rating=4) for booking in cls.bookings[11::2]])
+        call_command('rebuild_analytics', stdout=StringIO())
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def archive(self, **options):
+        call_command('archive_bookings', older_than_days=10, batch_size=4, sleep=0, stdout=StringIO(), **options)
+
+    def history(self, url, params):
+        ids, cursor = [], None
+        while True:
+            page = self.client.get(url, {**params, 'page_size': 7, **({'cursor': cursor} if cursor else {})}).data
+            ids.extend(row['id'] if 'id' in row else row['booking_id'] for row in page['results'])
+            if not page['next']:
+                return ids
+            cursor = parse_qs(urlsplit(page['next']).query)['cursor'][0]
+
+    def test_moves_old_finished_bookings_in_resumable_batches(self):
+        rollups = rollup_tables()
+        self.archive(max_batches=1)
+        self.assertEqual(ArchivedBooking.objects.count(), 4)
+        self.archive()
+
+        archived = {booking.id for booking in self.bookings[11::2]}
+        self.assertEqual(set(ArchivedBooking.objects.values_list('id', flat=True)), archived)
+        self.assertFalse(Booking.objects.filter(id__in=archived).exists())
+        self.assertEqual(Booking.objects.count(), 20)
+        self.assertEqual(ArchivedBookingService.objects.count(), 30)
+        self.assertEqual(ArchivedPayment.objects.count(), 10)
+        self.assertEqual(ArchivedReview.objects.count(), 10)
+        self.assertEqual(ArchivedBooking.objects.get(id=self.bookings[11].id).booking_id, self.bookings[11].booking_id)
+
+        # Moving bookings leaves the analytics and ratings as they were.
+        self.assertEqual(rollup_tables(), rollups)
+        call_command('rebuild_analytics', stdout=StringIO())
+        self.assertEqual(rollup_tables(), rollups)
+        call_command('rebuild_service_ratings', stdout=StringIO())
+        self.assertEqual(ServiceRating.objects.get(service=self.services[0]).count, 10)
+
+    def test_history_pages_through_hot_and_archived_bookings(self):
+        history = reverse('booking-history')
+        admin = reverse('admin-booking-list')
+        before = self.history(history, {'user_id': self.user.id}), self.history(admin, {})
+        expected = self.client.get(history, {'user_id': self.user.id, 'page_size': 30}).content
+        self.archive()
+
+        self.assertEqual((self.history(history, {'user_id': self.user.id}), self.history(admin, {})), before)
+        self.assertEqual(self.client.get(history, {'user_id': self.user.id, 'page_size': 30}).content, expected)
+        with override_settings(YES_MADAM_API={'FAST_SERIALIZATION': True}):
+            self.assertEqual(self.client.get(history, {'user_id': self.user.id, 'page_size': 30}).content, expected)
+
+        token = Token.objects.create(user=self.user)
+        request = APIRequestFactory().get(history, {'user_id': self.user.id, 'page_size': 30}, HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = async_to_sync(async_views.BookingHistoryView.as_view())(request)
+        self.assertEqual(json.loads(response.content), json.loads(expected))
+
+
+class BookingLifecycleTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(cities=1, categories=1)
+        cls.city = City.objects.get()
+        cls.services = list(Service.objects.order_by('id')[:2])
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.today = timezone.localdate()
+        # 11 PM: with the default two hours, slots up to 9 PM today have ended.
+        cls.now = timezone.make_aware(datetime.combine(cls.today, clock(23)))
+
+    def book(self, status, day, timeslot='10:00 AM', paid=None, booked_hours_ago=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                user=self.user, booking_id=f'YL{Booking.objects.count():06d}', date=day, timeslot=timeslot,
+                address='221B Baker Street', total_amount=Decimal('500.00'), status=status, city=self.city,
+            )
+            BookingService.objects.bulk_create([
+                BookingService(booking=booking, service=service, quantity=1, price_at_booking=service.price)
+                for service in self.services
+            ])
+            if paid is not None:
+                Payment.objects.create(booking=booking, payment_method='UPI', status=paid)
+        Booking.objects.filter(pk=booking.pk).update(booked_at=self.now - timedelta(hours=booked_hours_ago))
+        return booking
+
+    def status(self, booking):
+        return Booking.objects.values_list('status', flat=True).get(pk=booking.pk)
+
+    def test_booking_flow_is_confirmed_by_payment_or_cancelled_unpaid(self):
+        tomorrow = self.today + timedelta(days=1)
+        for start_time in ('10:00', '15:00'):
+            for service in self.services:
+                TimeslotCapacity.objects.create(city=self.city, service=service, date=tomorrow, start_time=start_time, capacity=1)
+        self.client.force_authenticate(self.user)
+        references = []
+        for timeslot in ('10:00 AM', '3:00 PM'):
+            cart = [Cart.objects.create(user=self.user, service=service, quantity=1) for service in self.services]
+            response = self.client.post(reverse('confirm-booking'), {
+                'user_id': self.user.id, 'cart_ids': [item.id for item in cart], 'city_id': self.city.id,
+                'date': tomorrow.isoformat(), 'timeslot': timeslot, 'address': '221B Baker Street',
+            }, format='json')
+            self.assertEqual((response.status_code, response.data['status']), (201, 'Pending'))
+            references.append(response.data['booking_id'])
+        paid, unpaid = (Booking.objects.get(booking_id=reference) for reference in references)
+
+        with patch.object(payment_pipeline, 'submit_on_commit'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('initiate-payment'), {'booking_id': paid.booking_id, 'payment_method': 'UPI'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(advance_bookings(), {'paid': 0, 'unpaid_timeout': 0, 'slot_ended': 0})
+        payment = Payment.objects.get(booking=paid)
+        # What the pipeline writes once the gateway accepts the charge.
+        PaymentPipeline().flush([(payment.id, paid.booking_id, 'Success', 'TXN0001')])
+
+        self.assertEqual(advance_bookings(), {'paid': 1, 'unpaid_timeout': 0, 'slot_ended': 0})
+        self.assertEqual((self.status(paid), self.status(unpaid)), ('Confirmed', 'Pending'))
+        # Past the default 30 minute LIFECYCLE_UNPAID_TIMEOUT.
+        self.assertEqual(advance_bookings(now=timezone.now() + timedelta(hours=1)), {'paid': 0, 'unpaid_timeout': 1, 'slot_ended': 0})
+        self.assertEqual((self.status(paid), self.status(unpaid)), ('Confirmed', 'Cancelled'))
+        seats = TimeslotCapacity.objects.filter(date=tomorrow).values_list('start_time', 'booked')
+        self.assertEqual({(start.hour, booked) for start, booked in seats}, {(10, 1), (15, 0)})
+
+        response = self.client.post(reverse('initiate-payment'), {'booking_id': unpaid.booking_id, 'payment_method': 'UPI'}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_rules_move_bookings_in_chunks(self):
+        yesterday, tomorrow = self.today - timedelta(days=1), self.today + timedelta(days=1)
+        ended = [self.book('Confirmed', yesterday, '7:00 PM'), self.book('Confirmed', self.today, '8:00 AM')]
+        upcoming = [self.book('Confirmed', self.today, '10:00 PM'), self.book('Confirmed', tomorrow)]
+        paid = self.book('Pending', tomorrow, paid='Success', booked_hours_ago=5)
+        abandoned = self.book('Pending', tomorrow, '3:00 PM', paid='Failed', booked_hours_ago=1)
+        waiting = self.book('Pending', tomorrow, booked_hours_ago=0)
+        # Still being charged: it waits for the outcome, seats kept.
+        charging = self.book('Pending', tomorrow, '12:00 PM', paid='Pending', booked_hours_ago=1)
+        for service in self.services:
+            TimeslotCapacity.objects.create(city=self.city, service=service, date=tomorrow, start_time='15:00', capacity=2, booked=1)
+            TimeslotCapacity.objects.create(city=self.city, service=service, date=tomorrow, start_time='12:00', capacity=2, booked=1)
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True), patch('django.utils.timezone.now', return_value=self.now):
+            call_command('advance_bookings', chunk_size=1, stdout=out)
+        self.assertIn('paid: 1, unpaid_timeout: 1, slot_ended: 2', out.getvalue())
+        self.assertEqual([self.status(booking) for booking in ended], ['Completed', 'Completed'])
+        self.assertEqual([self.status(booking) for booking in upcoming], ['Confirmed', 'Confirmed'])
+        self.assertEqual((self.status(paid), self.status(abandoned), self.status(waiting)), ('Confirmed', 'Cancelled', 'Pending'))
+        self.assertEqual(self.status(charging), 'Pending')
+        seats = TimeslotCapacity.objects.values_list('start_time', 'booked')
+        self.assertEqual({(start.hour, booked) for start, booked in seats}, {(15, 0), (12, 1)})
+
+        # The rollups followed the bulk updates.
+        incremental = rollup_tables()
+        call_command('rebuild_analytics', stdout=StringIO())
+        self.assertEqual(rollup_tables(), incremental)
+
+        self.assertEqual(advance_bookings(now=self.now), {'paid': 0, 'unpaid_timeout': 0, 'slot_ended': 0})
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('submit-rating'), {'booking_id': ended[0].booking_id, 'rating': 5}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_command_reports_each_rule(self):
+        self.book('Confirmed', self.today - timedelta(days=3))
+        out = StringIO()
+        call_command('advance_bookings', stdout=out)
+        self.assertIn('paid: 0, unpaid_timeout: 0, slot_ended: 1', out.getvalue())
+
+
+class BulkServiceUpsertTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = seed_catalog(categories=3, services_per_category=2)
+        cls.staff = User.objects.create_user(username='nila', email='nila@example.com', phone='9000000009', password='secret', is_staff=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.staff)
+
+    def row(self, category, name, price='100.00'):
+        return {'category': category.id, 'name': name, 'price': price, 'duration': '30 mins', 'description': name}
+
+    def test_upserts_in_batches_with_per_row_results(self):
+        existing = list(Service.objects.order_by('id'))
+        rows = [self.row(service.category, service.name, '1.00') for service in existing]
+        rows += [self.row(self.categories[i % 3], f'Bulk service {i}') for i in range(2500)]
+        rows += [self.row(self.categories[0], 'Bulk service 0', '7.00'), {'category': 'x', 'name': ''}, 'oops']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('admin-bulk-services'), rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['invalid']), (2500, 6, 2))
+        # Two lookups and batched writes, never a statement per row (SQLite
+        # caps a batch at its variable limit, so it needs more batches).
+        self.assertLess(len(ctx), 25)
+
+        results = response.data['results']
+        self.assertEqual([row['status'] for row in results[:6]], ['updated'] * 6)
+        self.assertEqual(results[0]['id'], existing[0].id)
+        self.assertEqual(results[6]['id'], results[-3]['id'])
+        self.assertEqual(Service.objects.get(id=results[6]['id']).price, Decimal('7.00'))
+        self.assertEqual(set(results[-2]['errors']), {'category', 'name', 'price', 'duration', 'description'})
+        self.assertEqual(results[-1]['status'], 'invalid')
+        self.assertEqual(Service.objects.filter(price=Decimal('1.00')).count(), 6)
+        self.assertEqual(Service.objects.count(), 2506)
+
+    def test_retries_with_an_idempotency_key_are_replayed(self):
+        rows = [self.row(self.categories[0], 'Bulk service')]
+        first = self.client.post(reverse('admin-bulk-services'), rows, format='json', HTTP_IDEMPOTENCY_KEY='bulk-1')
+        with self.assertNumQueries(0):
+            retry = self.client.post(reverse('admin-bulk-services'), rows, format='json', HTTP_IDEMPOTENCY_KEY='bulk-1')
+        self.assertEqual((retry['Idempotent-Replayed'], retry.data), ('true', first.data))
+        self.assertEqual(first.data['created'], 1)
+
+    def test_rejects_bad_payloads_and_non_staff(self):
+        self.assertEqual(self.client.post(reverse('admin-bulk-services'), {'name': 'x'}, format='json').status_code, 400)
+        with override_settings(YES_MADAM_API={'ADMIN_BULK_MAX_ROWS': 1}):
+            rows = [self.row(self.categories[0], 'a'), self.row(self.categories[0], 'b')]
+            self.assertEqual(self.client.post(reverse('admin-bulk-services'), rows, format='json').status_code, 400)
+        self.client.force_authenticate(User(is_staff=False))
+        self.assertEqual(self.client.post(reverse('admin-bulk-services'), [], format='json').status_code, 403)
+
+
+class BatchRequestTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = seed_catalog(categories=2, services_per_category=3)
+        cls.services = list(Service.objects.order_by('id'))
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.token = Token.objects.create(user=cls.user)
+        seed_bookings(cls.user, cls.services, 3)
+        Cart.objects.add_items(cls.user.id, {service.id: 1 for service in cls.services[:2]})
+
+    def setUp(self):
+        clear_catalog_cache()
+        local_tokens.clear()
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def batch(self, *paths, **kwargs):
+        response = self.client.post(reverse('batch'), {'requests': [{'path': path} for path in paths], **kwargs}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['responses']
+
+    def test_parts_match_separate_requests(self):
+        paths = [
+            reverse('city-list'), reverse('category-list'),
+            reverse('services-by-category', args=[self.categories[1].id]),
+            f"{reverse('view-cart')}?user_id={self.user.id}",
+            f"{reverse('booking-history')}?user_id={self.user.id}",
+            reverse('payment-status', args=['YM000000']),
+        ]
+        parts = self.batch(*paths)
+        for path, part in zip(paths, parts):
+            response = self.client.get(path)
+            self.assertEqual((part['status'], part['body']), (response.status_code, response.json()), path)
+        self.assertEqual(len(parts[4]['body']['results']), 3)
+
+        etag = parts[1]['headers']['ETag']
+        response = self.client.post(reverse('batch'), {'requests': [{'id': 'categories', 'path': paths[1], 'etag': etag}]}, format='json')
+        self.assertEqual(response.json()['responses'], [{'id': 'categories', 'status': 304, 'headers': response.json()['responses'][0]['headers'], 'body': None}])
+
+    def test_parts_share_authentication(self):
+        cart = f"{reverse('view-cart')}?user_id={self.user.id}"
+        # The token is looked up once, for the batch request itself.
+        with CaptureQueriesContext(connection) as ctx:
+            parts = self.batch(cart, cart)
+        self.assertEqual([part['status'] for part in parts], [200, 200])
+        self.assertEqual(sum('authtoken_token' in query['sql'] for query in ctx.captured_queries), 1)
+
+        self.client.credentials()
+        self.assertEqual([part['status'] for part in self.batch(reverse('city-list'), cart)], [200, 401])
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(self.client.post(reverse('batch'), {'requests': [{'path': cart}]}, format='json').status_code, 401)
+
+    def test_rejects_unknown_and_unbatchable_paths(self):
+        parts = self.batch('/nowhere/', reverse('admin-booking-export'), reverse('batch'))
+        self.assertEqual([part['status'] for part in parts], [404, 400, 400])
+        self.assertEqual(self.client.post(reverse('batch'), {'requests': []}, format='json').status_code, 400)
+        with override_settings(YES_MADAM_API={'BATCH_MAX_REQUESTS': 1}):
+            response = self.client.post(reverse('batch'), {'requests': [{'path': '/a/'}, {'path': '/b/'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['requests']['non_field_errors'][0].code, 'max_length')
+
+    @override_settings(
+        MIDDLEWARE=['yes_madam_api.throttling.ThrottleMiddleware'],
+        YES_MADAM_API={'THROTTLE_RATES': {'services-by-category': {'token': '1/min'}}},
+    )
+    def test_parts_count_against_route_limits(self):
+        services = reverse('services-by-category', args=[self.categories[0].id])
+        parts = self.batch(services, services)
+        self.assertEqual([part['status'] for part in parts], [200, 429])
+        self.assertIn('Retry-After', parts[1]['headers'])
+
+    def test_async_views_accept_the_batch_user(self):
+        request = APIRequestFactory().get('/cart/', {'user_id': self.user.id})
+        request._force_auth_user, request._force_auth_token = self.user, self.token
+        response = async_to_sync(async_views.ViewCartView.as_view())(request)
+        self.assertEqual((response.status_code, len(json.loads(response.content))), (200, 2))
+
+
+class ConcurrentBatchTests(TransactionTestCase):
+
+    def test_concurrent_parts_match_sequential(self):
+        categories = seed_catalog(categories=3, services_per_category=2)
+        user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        seed_bookings(user, list(Service.objects.all()), 2)
+        clear_catalog_cache()
+        client = APIClient()
+        client.force_authenticate(user)
+        requests = [{'path': reverse('services-by-category', args=[category.id])} for category in categories]
+        requests += [{'path': f"{reverse('booking-history')}?user_id={user.id}"}, {'path': reverse('city-list')}]
+
+        sequential = client.post(reverse('batch'), {'requests': requests}, format='json').json()
+        threads = set()
+        dispatch = batch.dispatch
+
+        def record(*args):
+            threads.add(threading.get_ident())
+            return dispatch(*args)
+        with patch('yes_madam_api.batch.dispatch', record):
+            concurrent = client.post(reverse('batch'), {'requests': requests, 'concurrent': True}, format='json').json()
+        self.assertEqual(concurrent, sequential)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual([part['status'] for part in concurrent['responses']], [200] * 5)
+
+
+class GenerateDatasetTests(APITestCase):
+    options = dict(users=7, cities=2, categories=2, services_per_category=3, bookings_per_user=3, batch_size=3, stdout=StringIO())
+
+    def shape(self, prefix):
+        bookings = Booking.objects.filter(booking_id__startswith=prefix.upper()).order_by('booking_id')
+        return [
+            (booking.status, booking.total_amount, booking.timeslot, booking.bookingservice_set.count())
+            for booking in bookings
+        ]
+
+    def test_counts_and_determinism(self):
+        call_command('generate_dataset', prefix='a', **self.options)
+        self.assertEqual(User.objects.count(), 7)
+        self.assertEqual(Service.objects.count(), 6)
+        self.assertEqual(Booking.objects.count(), 21)
+        self.assertTrue(BookingService.objects.exists())
+        self.assertEqual(
+            ServiceRating.objects.aggregate(total=Sum('count'))['total'] or 0,
+            BookingService.objects.filter(booking__review__isnull=False).count(),
+        )
+        self.assertTrue(User.objects.get(username='a_user0').check_password('password'))
+
+        call_command('generate_dataset', prefix='b', **self.options)
+        self.assertEqual(User.objects.count(), 14)
+        self.assertEqual(self.shape('a'), self.shape('b'))
+
+    def test_rejects_bad_prefix(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', prefix='a-b', **self.options)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, YES_MADAM_API={'PAYMENT_GATEWAY_OPTIONS': {'latency': 0}})
+class LoadTestCommandTests(LiveServerTestCase):
+
+    def test_flow_runs_end_to_end(self):
+        clear_catalog_cache()
+        seed_catalog(cities=2, categories=2)
+        for city in City.objects.all():
+            call_command('open_timeslots', city=city.name, days=8, stdout=StringIO())
+        out = StringIO()
+        # One virtual user and no background charging: SQLite fails writers
+        # that overlap instead of queueing them.
+        with patch.object(payment_pipeline, 'submit_on_commit'):
+            call_command('loadtest', base_url=f'{self.live_server_url}/api/', users=1, iterations=4, stdout=out)
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[1:-1]}
+        self.assertEqual(list(rows), [
+            'register', 'login', 'city-list', 'category-list', 'services-by-category',
+            'add-to-cart', 'view-cart', 'confirm-booking', 'initiate-payment', 'submit-rating',
+        ])
+        self.assertEqual(rows['confirm-booking'][1:3], ['4', '0'])
+        self.assertTrue(all(row[2] == '0' for row in rows.values()), out.getvalue())
+        self.assertEqual(Booking.objects.count(), 4)
+
+
+@override_settings(
+    MIDDLEWARE=['yes_madam_api.instrumentation.InstrumentationMiddleware'],
+    YES_MADAM_API={'METRICS_SLOW_REQUEST_SECONDS': 0, 'METRICS_SLOW_REQUEST_STATEMENTS': 2},
+)
+class InstrumentationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+        cls.user = User.objects.create_user(username='asha', email='asha@example.com', phone='9000000001', password='secret')
+        cls.staff = User.objects.create_user(username='nila', email='nila@example.com', phone='9000000009', password='secret', is_staff=True)
+        seed_bookings(cls.user, list(Service.objects.order_by('id')), 5)
+
+    def setUp(self):
+        metrics.reset()
+        slow_requests.clear()
+
+    def test_records_queries_and_render_time_per_route(self):
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            self.client.get(reverse('booking-history'), {'user_id': self.user.id})
+        self.client.get('/api/nowhere/')
+
+        self.client.force_authenticate(self.staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('yes_madam_api_requests_total{route="booking-history",method="GET",status="200"} 2', body)
+        self.assertIn('yes_madam_api_requests_total{route="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('yes_madam_api_db_queries_bucket{route="booking-history",le="2"} 0', body)
+        self.assertIn('yes_madam_api_db_queries_bucket{route="booking-history",le="3"} 2', body)
+        self.assertIn('yes_madam_api_render_duration_seconds_count{route="booking-history"} 2', body)
+        self.assertIn('yes_madam_api_view_duration_seconds_count{route="booking-history"} 2', body)
+        for family in ('render', 'view'):
+            total = next(line for line in body.splitlines() if line.startswith(f'yes_madam_api_{family}_duration_seconds_sum{{route="booking-history"}}'))
+            self.assertGreater(float(total.split()[-1]), 0)
+
+    def test_slow_requests_keep_their_sql(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(reverse('booking-history'), {'user_id': self.user.id})
+
+        self.client.force_authenticate(self.staff)
+        samples = self.client.get(reverse('slow-requests')).data
+        self.assertEqual(samples[0]['route'], 'booking-history')
+        self.assertEqual(samples[0]['queries'], 3)
+        self.assertEqual(len(samples[0]['statements']), 2)
+        self.assertIn('yes_madam_api_booking', samples[0]['statements'][0]['sql'])
+
+    def test_metrics_are_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Metrics()
+        for value in (0.001, 0.2, 30):
+            registry.observe('x', 'GET', 200, {'request_duration_seconds': value})
+        lines = registry.render().splitlines()
+        self.assertIn('yes_madam_api_request_duration_seconds_bucket{route="x",le="0.005"} 1', lines)
+        self.assertIn('yes_madam_api_request_duration_seconds_bucket{route="x",le="0.25"} 2', lines)
+        self.assertIn('yes_madam_api_request_duration_seconds_bucket{route="x",le="10.0"} 2', lines)
+        self.assertIn('yes_madam_api_request_duration_seconds_bucket{route="x",le="+Inf"} 3', lines)
+        self.assertIn('yes_madam_api_request_duration_seconds_count{route="x"} 3', lines)
+
+
+class SlidingWindowThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_previous_window_slides_out(self):
+        throttle = Throttle(100)
+        self.assertEqual([throttle.hit('k', 3, 60, now) for now in (0, 1, 2)], [0, 0, 0])
+        self.assertEqual(throttle.hit('k', 3, 60, 3), 57)
+        # Half way into the next window half of the previous one still counts.
+        self.assertEqual(throttle.hit('k', 3, 60, 90), 0)
+        self.assertAlmostEqual(throttle.hit('k', 3, 60, 90), 10)
+        self.assertEqual(throttle.hit('other', 3, 60, 90), 0)
+        self.assertEqual(throttle.hit('k', 3, 60, 200), 0)
+
+    def test_processes_share_counts_through_the_cache(self):
+        first, second = Throttle(100, 'default', sync_interval=0), Throttle(100, 'default', sync_interval=0)
+        self.assertEqual([first.hit('k', 3, 60, 1), first.hit('k', 3, 60, 2)], [0, 0])
+        self.assertEqual(second.hit('k', 3, 60, 3), 0)
+        self.assertGreater(second.hit('k', 3, 60, 4), 0)
+
+
+@override_settings(
+    MIDDLEWARE=['yes_madam_api.throttling.ThrottleMiddleware'],
+    YES_MADAM_API={'THROTTLE_RATES': {'login': {'ip': '2/min'}, 'booking-history': {'ip': '4/min', 'token': '1/min'}}},
+)
+class ThrottleMiddlewareTests(APITestCase):
+
+    def test_rejects_before_any_query(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('login'), {'username': 'asha', 'password': 'wrong'}).status_code, 401)
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('login'), {'username': 'asha', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+        self.assertEqual(self.client.post(reverse('login'), REMOTE_ADDR='10.0.0.2').status_code, 401)
+
+    def test_limits_each_token(self):
+        history = reverse('booking-history')
+        first, second = (
+            Token.objects.create(user=User.objects.create_user(username=name, email=f'{name}@example.com', phone=phone))
+            for name, phone in (('asha', '9000000001'), ('ravi', '9000000002'))
+        )
+        self.assertEqual(self.client.get(history, HTTP_AUTHORIZATION=f'Token {first.key}').status_code, 200)
+        self.assertEqual(self.client.get(history, HTTP_AUTHORIZATION=f'Token {first.key}').status_code, 429)
+        self.assertEqual(self.client.get(history, HTTP_AUTHORIZATION=f'Token {second.key}').status_code, 200)
+        # Made-up tokens get no limit of their own, only the ip one.
+        self.assertEqual(self.client.get(history, HTTP_AUTHORIZATION='Token made-up').status_code, 401)
+        self.assertEqual(self.client.get(history, HTTP_AUTHORIZATION='Token another').status_code, 429)
 
-# Create your tests here.
@@ -0,0 +1,188 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.authentication import get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+from .caching import LocalLRUCache
+from .conf import get_setting
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    # The format DRF throttles use: '10/min', '1000/hour', '5/s'.
+    limit, period = rate.split('/')
+    return int(limit), PERIODS[period[0]]
+
+
+class SlidingWindow:
+    """
+    Approximate sliding window: the count of the current fixed window plus
+    the previous window's count weighted by how much of it the sliding
+    window still covers. ``shared`` counts are other processes' hits, as
+    last read from the shared cache.
+    """
+    __slots__ = ('window', 'current', 'previous', 'shared', 'shared_previous', 'unsynced', 'synced_at')
+
+    def __init__(self, window):
+        self.window = window
+        self.current = self.previous = self.shared = self.shared_previous = self.unsynced = 0
+        self.synced_at = 0.0
+
+    def roll(self, window):
+        if window == self.window + 1:
+            self.previous, self.shared_previous = self.current, self.shared
+        else:
+            self.previous = self.shared_previous = 0
+        self.window = window
+        self.current = self.shared = self.unsynced = 0
+
+
+class Throttle:
+    """
+    Sliding-window counters per key, kept in process memory. With a cache
+    alias, each counter pushes its new hits to the shared cache and reads
+    the cluster-wide total back at most every ``sync_interval`` seconds, so
+    the limits hold across processes without a round trip per request.
+    """
+
+    def __init__(self, maxsize, cache_alias=None, sync_interval=1.0):
+        self.counters = LocalLRUCache(maxsize)
+        self.cache = caches[cache_alias] if cache_alias else None
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, period, now=None):
+        """Count one request against ``key``; returns 0 if it is allowed, else the seconds to wait."""
+        now = time.time() if now is None else now
+        window, offset = divmod(now, period)
+        window = int(window)
+        with self.lock:
+            counter = self.counters.get(key)
+            if counter is None:
+                counter = SlidingWindow(window)
+                self.counters.set(key, counter)
+            elif counter.window != window:
+                counter.roll(window)
+
+            current = counter.current + counter.shared
+            previous = counter.previous + counter.shared_previous
+            if previous * (1 - offset / period) + current + 1 > limit:
+                if current + 1 > limit:
+                    return period - offset
+                # Wait until enough of the previous window has slid out.
+                return max((1 - (limit - 1 - current) / previous) * period - offset, 0.001)
+            counter.current += 1
+            counter.unsynced += 1
+            sync = self.cache is not None and now - counter.synced_at >= self.sync_interval
+            if sync:
+                counter.synced_at = now
+        if sync:
+            self.sync(key, counter, period)
+        return 0
+
+    def sync(self, key, counter, period):
+        with self.lock:
+            window, hits = counter.window, counter.unsynced
+            counter.unsynced = 0
+        # Hash the key so raw tokens never show up in cache keys.
+        cache_key = 'yes_madam_api:throttle:' + hashlib.sha256(repr((key, window)).encode()).hexdigest()
+        # add() and incr() are atomic in every cache backend, so hits from
+        # other processes are never overwritten.
+        self.cache.add(cache_key, 0, 2 * period)
+        try:
+            total = self.cache.incr(cache_key, hits)
+        except ValueError:
+            # Expired between add() and incr(); start the window over, unless
+            # another process got there first.
+            if self.cache.add(cache_key, hits, 2 * period):
+                total = hits
+            else:
+                total = self.cache.incr(cache_key, hits)
+        with self.lock:
+            if counter.window == window:
+                counter.shared = max(total - (counter.current - counter.unsynced), 0)
+
+
+def client_ip(request):
+    header = get_setting('THROTTLE_CLIENT_IP_HEADER')
+    if header and request.META.get(header):
+        # The last address is the one the trusted proxy saw.
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def request_token(request):
+    # Only tokens that authenticate are counted: a made-up token per request
+    # would otherwise get a fresh limit every time. Bad tokens still count
+    # against the ip scope. Valid tokens resolve from the auth cache.
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(auth[1].decode())
+    except (UnicodeError, AuthenticationFailed):
+        return None
+    return user.pk
+
+
+SCOPES = {
+    'ip': client_ip,
+    # DRF tokens are one per user, so this is also the per-user limit.
+    'token': request_token,
+}
+
+
+def route_rates():
+    from .urls import throttle_rates
+
+    rates = {**throttle_rates, **get_setting('THROTTLE_RATES')}
+    return {
+        route: [(scope, *parse_rate(rate)) for scope, rate in scopes.items()]
+        for route, scopes in rates.items() if scopes
+    }
+
+
+class ThrottleMiddleware:
+    """
+    Rejects requests over the limits set for their URL name (throttle_rates
+    in urls.py, overridden by the THROTTLE_RATES setting) with a 429. The
+    check runs in process_view: the route is resolved, but the view and
+    every query are still ahead, apart from the token lookup of the token
+    scope on an auth cache miss.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rates = route_rates()
+        self.throttle = Throttle(
+            get_setting('THROTTLE_LOCAL_CACHE_SIZE'), get_setting('THROTTLE_CACHE_ALIAS'), get_setting('THROTTLE_SYNC_INTERVAL'),
+        )
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Kept on the request so the batch endpoint can check its sub-requests.
+        request.throttle = self.check
+        return self.check(request, request.resolver_match.view_name)
+
+    def check(self, request, route):
+        now = time.time()
+        for scope, limit, period in self.rates.get(route, ()):
+            identity = SCOPES[scope](request)
+            if identity is None:
+                continue
+            wait = self.throttle.hit((route, scope, identity), limit, period, now)
+            if wait:
+                seconds = math.ceil(wait)
+                response = JsonResponse({'detail': f'Request was throttled. Expected available in {seconds} seconds.'}, status=429)
+                response['Retry-After'] = str(seconds)
+                return response
+        return None
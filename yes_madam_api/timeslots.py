@@ -0,0 +1,62 @@
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+from django.db.models import F
+
+from .models import TimeslotCapacity
+
+
+class TimeslotUnavailable(Exception):
+    pass
+
+
+def format_timeslot(value):
+    return value.strftime('%I:%M %p').lstrip('0')
+
+
+def parse_timeslot(label):
+    return datetime.strptime(label.strip().upper(), '%I:%M %p').time()
+
+
+def open_slots(service_id, start, days=1, city_id=None):
+    queryset = TimeslotCapacity.objects.filter(
+        service_id=service_id,
+        date__gte=start,
+        date__lt=start + timedelta(days=days),
+        booked__lt=F('capacity'),
+    )
+    if city_id is not None:
+        queryset = queryset.filter(city_id=city_id)
+    return queryset.order_by('date', 'start_time').values_list('date', 'start_time').distinct()
+
+
+def weekly_availability(service_id, start, days=7, city_id=None):
+    availability = OrderedDict((start + timedelta(days=offset), []) for offset in range(days))
+    for slot_date, start_time in open_slots(service_id, start, days, city_id):
+        availability[slot_date].append(format_timeslot(start_time))
+    return availability
+
+
+def reserve(city_id, service_ids, date, start_time):
+    # One conditional UPDATE takes a seat on every slot or on none of them:
+    # rows already at capacity are skipped by the WHERE clause, so a short
+    # row count means the caller's transaction must be rolled back.
+    service_ids = set(service_ids)
+    reserved = TimeslotCapacity.objects.filter(
+        city_id=city_id,
+        service_id__in=service_ids,
+        date=date,
+        start_time=start_time,
+        booked__lt=F('capacity'),
+    ).update(booked=F('booked') + 1)
+    if reserved != len(service_ids):
+        raise TimeslotUnavailable
+
+
+def release(slots):
+    # Give back one seat per (city_id, service_id, date, start_time) entry,
+    # with one UPDATE per distinct slot. Slots already at zero are skipped.
+    for (city_id, service_id, slot_date, start_time), seats in Counter(slots).items():
+        TimeslotCapacity.objects.filter(
+            city_id=city_id, service_id=service_id, date=slot_date, start_time=start_time, booked__gte=seats,
+        ).update(booked=F('booked') - seats)
@@ -1,28 +1,63 @@
 from django.urls import path
 from .views import (
-    RegisterView, LoginView, CityListView, SetUserLocationView,
-    CategoryListView, ServiceByCategoryView, AddServiceToCartView, ViewCartView,
-    ChooseTimeslotView, ConfirmBookingView, InitiatePaymentView, PaymentStatusView,
-    BookingHistoryView, SubmitRatingView, AdminAddServiceView, AdminUserListView,
-    AdminBookingListView
+    RegisterView, LoginView, LogoutView, CityListView, SetUserLocationView,
+    CategoryListView, ServiceByCategoryView, ServiceSearchView, AddServiceToCartView, BatchAddToCartView, ViewCartView,
+    ChooseTimeslotView, ConfirmBookingView, InitiatePaymentView, PaymentStatusView, BookingEventsView, BookingEventStreamView,
+    BookingHistoryView, SubmitRatingView, AdminAddServiceView, AdminBulkServiceView, AdminUserListView,
+    AdminBookingListView, AdminBookingExportView, AdminUserExportView, AdminAnalyticsView, MetricsView, SlowRequestListView,
+    BatchView,
 )
+from .conf import get_setting
+
+if get_setting('ASYNC_VIEWS'):
+    from .async_views import (
+        CityListView, CategoryListView, ServiceByCategoryView, ViewCartView, PaymentStatusView, BookingHistoryView
+    )
+
+# Request limits per URL name, enforced by throttling.ThrottleMiddleware per
+# client IP and per API token; the THROTTLE_RATES setting overrides them.
+throttle_rates = {
+    'login': {'ip': '10/min'},
+    'register': {'ip': '10/min'},
+    'services-by-category': {'ip': '300/min', 'token': '120/min'},
+    'choose-timeslot': {'ip': '300/min', 'token': '120/min'},
+}
+
+# Read-only routes BatchView may run as sub-requests. Streams, exports and
+# long polls stay out: they would hold the whole batch open.
+batch_routes = {
+    'city-list', 'category-list', 'services-by-category', 'service-search', 'view-cart',
+    'choose-timeslot', 'payment-status', 'booking-history',
+}
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('cities/', CityListView.as_view(), name='city-list'),
     path('set-location/', SetUserLocationView.as_view(), name='set-location'),
     path('categories/', CategoryListView.as_view(), name='category-list'),
     path('categories/<int:category_id>/services/', ServiceByCategoryView.as_view(), name='services-by-category'),
+    path('services/search/', ServiceSearchView.as_view(), name='service-search'),
     path('cart/add/', AddServiceToCartView.as_view(), name='add-to-cart'),
+    path('cart/add/batch/', BatchAddToCartView.as_view(), name='add-to-cart-batch'),
     path('cart/', ViewCartView.as_view(), name='view-cart'),
     path('timeslots/', ChooseTimeslotView.as_view(), name='choose-timeslot'),
     path('book/', ConfirmBookingView.as_view(), name='confirm-booking'),
     path('payment/initiate/', InitiatePaymentView.as_view(), name='initiate-payment'),
     path('payment/status/<str:booking_id>/', PaymentStatusView.as_view(), name='payment-status'),
+    path('bookings/<str:booking_id>/events/', BookingEventsView.as_view(), name='booking-events'),
+    path('bookings/<str:booking_id>/events/stream/', BookingEventStreamView.as_view(), name='booking-event-stream'),
     path('bookings/', BookingHistoryView.as_view(), name='booking-history'),
     path('rate/', SubmitRatingView.as_view(), name='submit-rating'),
     path('admin/services/add/', AdminAddServiceView.as_view(), name='admin-add-service'),
+    path('admin/services/bulk/', AdminBulkServiceView.as_view(), name='admin-bulk-services'),
     path('admin/users/', AdminUserListView.as_view(), name='admin-user-list'),
+    path('admin/users/export/', AdminUserExportView.as_view(), name='admin-user-export'),
     path('admin/bookings/', AdminBookingListView.as_view(), name='admin-booking-list'),
+    path('admin/bookings/export/', AdminBookingExportView.as_view(), name='admin-booking-export'),
+    path('admin/analytics/', AdminAnalyticsView.as_view(), name='admin-analytics'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('metrics/slow-requests/', SlowRequestListView.as_view(), name='slow-requests'),
+    path('batch/', BatchView.as_view(), name='batch'),
 ]
\ No newline at end of file
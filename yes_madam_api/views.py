@@ -1,22 +1,45 @@
 from rest_framework import generics, status, views
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.contrib.auth import authenticate
+from django.http import HttpResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.utils import timezone
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
 import random
 import string
-from django.db.models import F
-
-from .models import User, City, Category, Service, Cart, Booking, Payment, Review, BookingService
+from django.db.models import F, Prefetch, Sum, prefetch_related_objects
+
+from .analytics import summarize
+from .archive import booking_history
+from .batch import run_batch
+from .catalog import CatalogCacheMixin, bump_catalog_keys_on_commit, bump_catalog_version_on_commit, services_key
+from .conf import get_setting
+from .exports import streaming_export
+from .fastpath import FastListMixin
+from .geo import resolve_city
+from .idempotency import idempotent
+from .instrumentation import metrics, slow_requests
+from .notifications import booking_topic, hub
+from .search import invalidate_search_index, search_index
+from .timeslots import TimeslotUnavailable, format_timeslot, parse_timeslot, reserve, weekly_availability
+from .payments import payment_pipeline
+from .pagination import BookingCursorPagination, UserCursorPagination
+from .models import User, City, Category, Service, ServiceRating, Cart, Booking, Payment, Review, BookingService, ArchivedBooking
 from .serializers import (
     UserSerializer, LoginSerializer, CitySerializer, SetLocationSerializer,
-    CategorySerializer, ServiceSerializer, AddToCartSerializer, CartItemSerializer,
+    CategorySerializer, ServiceSerializer, AddToCartSerializer, BatchAddToCartSerializer, CartItemSerializer,
     ConfirmBookingSerializer, BookingResponseSerializer, InitiatePaymentSerializer,
     PaymentStatusSerializer, BookingHistorySerializer, SubmitRatingSerializer,
-    AdminAddServiceSerializer, AdminUserListSerializer, AdminBookingListSerializer
+    AdminAddServiceSerializer, BulkServiceSerializer, AdminUserListSerializer, AdminBookingListSerializer,
+    AnalyticsFilterSerializer, BookingExportFilterSerializer, UserExportFilterSerializer, BatchSerializer
 )
 
 class RegisterView(generics.CreateAPIView):
@@ -44,7 +67,29 @@ class LoginView(ObtainAuthToken):
             return Response({"token": token.key, "user_id": user.id}, status=status.HTTP_200_OK)
         return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
-class CityListView(generics.ListAPIView):
+class LogoutView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        Token.objects.filter(user=request.user).delete()
+        return Response({"message": "Logged out successfully"}, status=status.HTTP_200_OK)
+
+def booking_lines_prefetch():
+    return Prefetch('bookingservice_set', queryset=BookingService.objects.select_related('service'))
+
+def booking_state(booking_id, user):
+    state = Booking.objects.filter(booking_id=booking_id, user=user).values(
+        'booking_id', 'status', payment_status=F('payment__status'), transaction_id=F('payment__transaction_id')
+    ).first()
+    if state is not None:
+        state['version'] = hashlib.sha1(f"{state['status']}:{state['payment_status']}:{state['transaction_id']}".encode()).hexdigest()[:16]
+    return state
+
+def server_sent_event(state):
+    return f"event: booking\ndata: {json.dumps(state)}\n\n"
+
+class CityListView(CatalogCacheMixin, generics.ListAPIView):
+    catalog_key = 'cities'
     queryset = City.objects.all()
     serializer_class = CitySerializer
     permission_classes = [AllowAny]
@@ -56,36 +101,71 @@ class SetUserLocationView(views.APIView):
         serializer = SetLocationSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user_id = serializer.validated_data['user_id']
-        city_name = serializer.validated_data['city']
+        city_name = serializer.validated_data.get('city')
         latitude = serializer.validated_data['latitude']
         longitude = serializer.validated_data['longitude']
 
         try:
-            user = User.objects.get(id=user_id)
-            return Response({"message": f"Location set for user {user.username} to {city_name}"}, status=status.HTTP_200_OK)
+            user = User.objects.only('id', 'username').get(id=user_id)
         except User.DoesNotExist:
             return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-class CategoryListView(generics.ListAPIView):
+        # Coordinates decide; the city name is only a fallback for a point just
+        # outside every mapped service area.
+        city_id, resolved_name = resolve_city(latitude, longitude)
+        if city_id is None and city_name:
+            city = City.objects.filter(name__iexact=city_name).values_list('id', 'name').first()
+            if city:
+                city_id, resolved_name = city
+        if city_id is None:
+            return Response({"detail": "This location is outside our service areas"}, status=status.HTTP_400_BAD_REQUEST)
+
+        user.city_id, user.latitude, user.longitude = city_id, latitude, longitude
+        user.save(update_fields=['city', 'latitude', 'longitude'])
+        return Response(
+            {"message": f"Location set for user {user.username} to {resolved_name}", "city_id": city_id, "city": resolved_name},
+            status=status.HTTP_200_OK
+        )
+
+class CategoryListView(CatalogCacheMixin, generics.ListAPIView):
+    catalog_key = 'categories'
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
 
-class ServiceByCategoryView(generics.ListAPIView):
+class ServiceByCategoryView(CatalogCacheMixin, generics.ListAPIView):
     serializer_class = ServiceSerializer
     permission_classes = [AllowAny]
 
+    def get_catalog_key(self):
+        return services_key(self.kwargs['category_id'])
+
     def get_queryset(self):
-        category_id = self.kwargs['category_id']
+        return Service.objects.filter(category_id=self.kwargs['category_id']).select_related('rating')
+
+class ServiceSearchView(views.APIView):
+    permission_classes = [AllowAny]
+    max_limit = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            category = Category.objects.get(id=category_id)
-            return Service.objects.filter(category=category)
-        except Category.DoesNotExist:
-            return Service.objects.none()
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        search_index.ensure_current()
+        service_ids = search_index.search(query, limit)
+        services = Service.objects.select_related('rating').in_bulk(service_ids)
+        ranked = [services[service_id] for service_id in service_ids if service_id in services]
+        return Response(ServiceSerializer(ranked, many=True).data, status=status.HTTP_200_OK)
 
 class AddServiceToCartView(views.APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = AddToCartSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -93,57 +173,84 @@ class AddServiceToCartView(views.APIView):
         service_id = serializer.validated_data['service_id']
         quantity = serializer.validated_data['quantity']
 
-        try:
-            user = User.objects.get(id=user_id)
-            service = Service.objects.get(id=service_id)
+        # Adding more of something already in the cart is a single UPDATE.
+        if not Cart.objects.filter(user_id=user_id, service_id=service_id).update(quantity=F('quantity') + quantity):
+            if not User.objects.filter(id=user_id).exists() or not Service.objects.filter(id=service_id).exists():
+                return Response({"detail": "User or Service not found"}, status=status.HTTP_404_NOT_FOUND)
+            Cart.objects.add_items(user_id, {service_id: quantity})
+        return Response({"message": "Service added to cart successfully"}, status=status.HTTP_200_OK)
 
-            cart_item, created = Cart.objects.get_or_create(user=user, service=service, defaults={'quantity': quantity})
-            if not created:
-                cart_item.quantity += quantity
-            cart_item.save()
-            return Response({"message": "Service added to cart successfully"}, status=status.HTTP_200_OK)
-        except (User.DoesNotExist, Service.DoesNotExist):
-            return Response({"detail": "User or Service not found"}, status=status.HTTP_404_NOT_FOUND)
+class BatchAddToCartView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @idempotent
+    def post(self, request):
+        serializer = BatchAddToCartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_id = serializer.validated_data['user_id']
 
-class ViewCartView(generics.ListAPIView):
+        quantities = {}
+        for item in serializer.validated_data['items']:
+            quantities[item['service_id']] = quantities.get(item['service_id'], 0) + item['quantity']
+
+        if not User.objects.filter(id=user_id).exists():
+            return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        missing = set(quantities) - set(Service.objects.filter(id__in=quantities).values_list('id', flat=True))
+        if missing:
+            return Response({"detail": "Services not found", "service_ids": sorted(missing)}, status=status.HTTP_404_NOT_FOUND)
+
+        Cart.objects.add_items(user_id, quantities)
+        return Response({"message": "Services added to cart successfully", "items": len(quantities)}, status=status.HTTP_200_OK)
+
+class ViewCartView(FastListMixin, generics.ListAPIView):
     serializer_class = CartItemSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         user_id = self.request.query_params.get('user_id')
         if user_id:
-            try:
-                user = User.objects.get(id=user_id)
-                queryset = Cart.objects.filter(user=user).select_related('service').annotate(total=F('quantity') * F('service__price'))
-                return queryset
-            except User.DoesNotExist:
-                return Cart.objects.none()
+            return Cart.objects.filter(user_id=user_id).select_related('service__rating').annotate(total=F('quantity') * F('service__price'))
         return Cart.objects.none()
 
 class ChooseTimeslotView(views.APIView):
     permission_classes = [IsAuthenticated]
+    max_days = 14
 
     def get(self, request):
         service_id = request.query_params.get('service_id')
         date_str = request.query_params.get('date')
+        city_id = request.query_params.get('city_id')
+        days = request.query_params.get('days')
 
         if not service_id or not date_str:
             return Response({"detail": "service_id and date are required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            service = Service.objects.get(id=service_id)
-            available_timeslots = [
-                "10:00 AM", "12:00 PM", "3:00 PM", "5:00 PM"
-            ]
-            return Response(available_timeslots, status=status.HTTP_200_OK)
-        except Service.DoesNotExist:
-            return Response({"detail": "Service not found"}, status=status.HTTP_404_NOT_FOUND)
+            start = datetime.strptime(date_str, '%Y-%m-%d').date()
         except ValueError:
             return Response({"detail": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            city_id = int(city_id) if city_id else request.user.city_id
+            day_count = int(days) if days else 1
+            if not 1 <= day_count <= self.max_days:
+                raise ValueError
+        except ValueError:
+            return Response({"detail": f"city_id must be an integer and days between 1 and {self.max_days}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            service = Service.objects.only('id').get(id=service_id)
+        except (Service.DoesNotExist, ValueError):
+            return Response({"detail": "Service not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        availability = weekly_availability(service.id, start, day_count, city_id)
+        if days is None:
+            return Response(availability[start], status=status.HTTP_200_OK)
+        return Response({slot_date.isoformat(): slots for slot_date, slots in availability.items()}, status=status.HTTP_200_OK)
 
 class ConfirmBookingView(views.APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = ConfirmBookingSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -153,19 +260,45 @@ class ConfirmBookingView(views.APIView):
         date = serializer.validated_data['date']
         timeslot = serializer.validated_data['timeslot']
         address = serializer.validated_data['address']
+        city_id = serializer.validated_data.get('city_id')
 
         try:
             user = User.objects.get(id=user_id)
-            cart_items = Cart.objects.filter(id__in=cart_ids, user=user).select_related('service')
+            if city_id is None:
+                city_id = user.city_id
+            # Slot capacity is per city, so a booking without one can't be checked.
+            if city_id is None:
+                return Response({"detail": "city_id is required until the user sets a location"}, status=status.HTTP_400_BAD_REQUEST)
 
-            if not cart_items.exists():
-                return Response({"detail": "No valid cart items found for booking"}, status=status.HTTP_400_BAD_REQUEST)
-
-            total_amount = sum(item.quantity * item.service.price for item in cart_items)
+            try:
+                start_time = parse_timeslot(timeslot)
+            except ValueError:
+                return Response({"detail": "Invalid timeslot. Use a label such as 10:00 AM"}, status=status.HTTP_400_BAD_REQUEST)
+            timeslot = format_timeslot(start_time)
 
             with transaction.atomic():
+                # Lock the cart rows first: a concurrent checkout of the same cart
+                # blocks here and then finds the rows already consumed.
+                cart_items = list(
+                    Cart.objects.select_for_update(of=('self',))
+                    .filter(id__in=cart_ids, user=user)
+                    .select_related('service')
+                    .order_by('id')
+                )
+                if not cart_items:
+                    return Response({"detail": "No valid cart items found for booking"}, status=status.HTTP_400_BAD_REQUEST)
+
+                locked_ids = [item.id for item in cart_items]
+                total_amount = Cart.objects.filter(id__in=locked_ids).aggregate(
+                    total=Sum(F('quantity') * F('service__price'))
+                )['total']
+
+                reserve(city_id, [item.service_id for item in cart_items], date, start_time)
+
                 booking_id = 'YM' + ''.join(random.choices(string.digits, k=6))
-                while Booking.objects.filter(booking_id=booking_id).exists():
+                # Archived bookings keep their ids, so those are taken too.
+                while (Booking.objects.filter(booking_id=booking_id).exists()
+                       or ArchivedBooking.objects.filter(booking_id=booking_id).exists()):
                     booking_id = 'YM' + ''.join(random.choices(string.digits, k=6))
 
                 booking = Booking.objects.create(
@@ -175,23 +308,30 @@ class ConfirmBookingView(views.APIView):
                     timeslot=timeslot,
                     address=address,
                     total_amount=total_amount,
-                    status='Confirmed'
+                    # Confirmed by advance_bookings once the payment succeeds.
+                    status='Pending',
+                    city_id=city_id
                 )
 
-                for item in cart_items:
-                    BookingService.objects.create(
+                BookingService.objects.bulk_create([
+                    BookingService(
                         booking=booking,
                         service=item.service,
                         quantity=item.quantity,
                         price_at_booking=item.service.price
                     )
-                    item.delete()
+                    for item in cart_items
+                ])
+                Cart.objects.filter(id__in=locked_ids).delete()
 
+            prefetch_related_objects([booking], booking_lines_prefetch())
             response_serializer = BookingResponseSerializer(booking)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
         except User.DoesNotExist:
             return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        except TimeslotUnavailable:
+            return Response({"detail": "Selected timeslot is no longer available"}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({"detail": f"An error occurred during booking: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -199,6 +339,7 @@ class ConfirmBookingView(views.APIView):
 class InitiatePaymentView(views.APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = InitiatePaymentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -206,25 +347,34 @@ class InitiatePaymentView(views.APIView):
         payment_method = serializer.validated_data['payment_method']
 
         try:
-            booking = Booking.objects.get(booking_id=booking_id)
+            booking = Booking.objects.only('id', 'booking_id', 'total_amount', 'status').get(booking_id=booking_id)
+            if booking.status == 'Cancelled':
+                return Response({"detail": "Booking has been cancelled"}, status=status.HTTP_409_CONFLICT)
             payment, created = Payment.objects.get_or_create(
                 booking=booking,
                 defaults={'payment_method': payment_method, 'status': 'Pending'}
             )
+            if payment.status == 'Success':
+                return Response({
+                    "message": "Booking is already paid",
+                    "transaction_id": payment.transaction_id,
+                    "status": payment.status
+                }, status=status.HTTP_200_OK)
             if not created:
                 payment.payment_method = payment_method
                 payment.status = 'Pending'
-                payment.save()
-            transaction_id = 'TXN' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=7))
-            payment.transaction_id = transaction_id
-            payment.status = 'Success'
-            payment.save()
+                payment.pending_since = timezone.now()
+                payment.save(update_fields=['payment_method', 'status', 'pending_since'])
+            # The gateway is called by the payment pipeline once this row is
+            # committed; clients poll payment-status for the outcome. A repeat
+            # while the charge is in flight is dropped by the pipeline.
+            payment_pipeline.submit_on_commit(payment.id, booking.booking_id, booking.total_amount, payment_method)
 
             return Response({
-                "message": "Payment initiated successfully (dummy)",
+                "message": "Payment initiated",
                 "transaction_id": payment.transaction_id,
                 "status": payment.status
-            }, status=status.HTTP_200_OK)
+            }, status=status.HTTP_202_ACCEPTED)
         except Booking.DoesNotExist:
             return Response({"detail": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -239,9 +389,8 @@ class PaymentStatusView(generics.RetrieveAPIView):
     def get_object(self):
         booking_id = self.kwargs['booking_id']
         try:
-            booking = Booking.objects.get(booking_id=booking_id)
-            return Payment.objects.get(booking=booking)
-        except (Booking.DoesNotExist, Payment.DoesNotExist):
+            return Payment.objects.select_related('booking').get(booking__booking_id=booking_id)
+        except Payment.DoesNotExist:
             return None
 
     def retrieve(self, request, *args, **kwargs):
@@ -251,23 +400,80 @@ class PaymentStatusView(generics.RetrieveAPIView):
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-class BookingHistoryView(generics.ListAPIView):
+class BookingEventsView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, booking_id):
+        since = request.query_params.get('since')
+        try:
+            timeout = float(request.query_params.get('timeout', get_setting('NOTIFICATION_LONG_POLL_TIMEOUT')))
+        except ValueError:
+            return Response({"detail": "timeout must be a number of seconds"}, status=status.HTTP_400_BAD_REQUEST)
+        timeout = max(0.0, min(timeout, get_setting('NOTIFICATION_LONG_POLL_MAX_TIMEOUT')))
+
+        topic = booking_topic(booking_id)
+        seen = hub.current(topic)
+        state = booking_state(booking_id, request.user)
+        if state is None:
+            return Response({"detail": "Booking not found or does not belong to user"}, status=status.HTTP_404_NOT_FOUND)
+
+        # The client already has this version: park until this process sees a
+        # change or the timeout passes. The state is read again either way, so
+        # changes made by other processes still arrive within one timeout.
+        if state['version'] == since:
+            hub.wait(topic, seen, timeout)
+            state = booking_state(booking_id, request.user) or state
+        return Response(state, status=status.HTTP_200_OK)
+
+class BookingEventStreamView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, booking_id):
+        topic = booking_topic(booking_id)
+        seen = hub.current(topic)
+        state = booking_state(booking_id, request.user)
+        if state is None:
+            return Response({"detail": "Booking not found or does not belong to user"}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(self.stream(topic, seen, state, request.user), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, topic, seen, state, user):
+        # An async iterator, so under ASGI an open stream is a parked coroutine
+        # rather than a worker thread.
+        load = sync_to_async(booking_state)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + get_setting('NOTIFICATION_STREAM_MAX_AGE')
+        yield server_sent_event(state)
+        while (remaining := deadline - loop.time()) > 0:
+            await hub.wait_async(topic, seen, min(get_setting('NOTIFICATION_KEEPALIVE'), remaining))
+            seen = hub.current(topic)
+            fresh = await load(state['booking_id'], user)
+            if fresh is None:
+                return
+            if fresh['version'] != state['version']:
+                state = fresh
+                yield server_sent_event(state)
+            else:
+                yield ': keep-alive\n\n'
+
+class BookingHistoryView(FastListMixin, generics.ListAPIView):
     serializer_class = BookingHistorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BookingCursorPagination
 
     def get_queryset(self):
         user_id = self.request.query_params.get('user_id')
         if user_id:
-            try:
-                user = User.objects.get(id=user_id)
-                return Booking.objects.filter(user=user).order_by('-booked_at')
-            except User.DoesNotExist:
-                return Booking.objects.none()
-        return Booking.objects.none() 
+            return booking_history(user_id=user_id)
+        return Booking.objects.none()
 
 class SubmitRatingView(views.APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = SubmitRatingSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -279,15 +485,24 @@ class SubmitRatingView(views.APIView):
             booking = Booking.objects.get(booking_id=booking_id, user=request.user)
             if booking.status != 'Completed':
                 return Response({"detail": "Booking must be completed to submit a rating."}, status=status.HTTP_400_BAD_REQUEST)
-            review, created = Review.objects.get_or_create(
-                booking=booking,
-                user=request.user,
-                defaults={'rating': rating, 'review_text': review_text}
-            )
-            if not created:
-                review.rating = rating
-                review.review_text = review_text
-                review.save()
+            with transaction.atomic():
+                # get_or_create survives two first submissions racing on the
+                # one review per booking; an existing review is then locked so
+                # concurrent edits apply their rating deltas one after another.
+                review, created = Review.objects.get_or_create(
+                    booking=booking, defaults={'user': request.user, 'rating': rating, 'review_text': review_text},
+                )
+                previous = None
+                if not created:
+                    review = Review.objects.select_for_update().get(pk=review.pk)
+                    previous = review.rating
+                    review.rating = rating
+                    review.review_text = review_text
+                    review.save(update_fields=['rating', 'review_text'])
+                lines = list(booking.bookingservice_set.values_list('service_id', 'service__category_id'))
+                ServiceRating.objects.record([service_id for service_id, _ in lines], rating, previous)
+                # Ratings only show in their categories' service listings.
+                bump_catalog_keys_on_commit(services_key(category_id) for _, category_id in lines)
 
             return Response({"message": "Rating submitted successfully", "review_id": review.id}, status=status.HTTP_201_CREATED)
 
@@ -300,12 +515,191 @@ class AdminAddServiceView(generics.CreateAPIView):
     serializer_class = AdminAddServiceSerializer
     permission_classes = [IsAuthenticated] 
 
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
+
+class AdminBulkServiceView(views.APIView):
+    """
+    Create or update up to ADMIN_BULK_MAX_ROWS services in one request,
+    matched on (category, name). Invalid rows are reported and skipped; the
+    rest are written with batched INSERT ... ON CONFLICT DO UPDATE.
+    """
+    permission_classes = [IsAdminUser]
+    update_fields = ['price', 'duration', 'description']
+    batch_size = 1000
+
+    @idempotent
+    def post(self, request):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({"detail": "Expected a non-empty list of services"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > get_setting('ADMIN_BULK_MAX_ROWS'):
+            return Response({"detail": f"At most {get_setting('ADMIN_BULK_MAX_ROWS')} services per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        category_ids = set()
+        for row in rows:
+            try:
+                category_ids.add(int(row['category']))
+            except (TypeError, KeyError, ValueError):
+                continue
+        # One serializer validates every row, as ListSerializer does, so its
+        # fields are built once rather than once per row.
+        serializer = BulkServiceSerializer(context={'categories': Category.objects.in_bulk(category_ids)})
+
+        results = [None] * len(rows)
+        services = {}
+        for index, row in enumerate(rows):
+            try:
+                service = Service(**serializer.run_validation(row))
+            except ValidationError as exc:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': exc.detail}
+                continue
+            # The last row for a (category, name) wins; every row reports its outcome.
+            key = (service.category_id, service.name)
+            services[key] = (service, services.get(key, (None, []))[1] + [index])
+
+        existing = {}
+        if services:
+            existing = {
+                (category_id, name): pk
+                for pk, category_id, name in Service.objects.filter(
+                    category_id__in={category_id for category_id, _ in services}, name__in={name for _, name in services},
+                ).values_list('id', 'category_id', 'name')
+            }
+        with transaction.atomic():
+            Service.objects.bulk_create(
+                [service for service, _ in services.values()], batch_size=self.batch_size, update_conflicts=True,
+                unique_fields=['category', 'name'], update_fields=self.update_fields,
+            )
+            if services:
+                bump_catalog_version_on_commit()
+                transaction.on_commit(invalidate_search_index)
+
+        for key, (service, indexes) in services.items():
+            outcome = 'updated' if key in existing else 'created'
+            for index in indexes:
+                results[index] = {'index': index, 'status': outcome, 'id': existing.get(key, service.pk)}
+        updated = len(existing.keys() & services.keys())
+        return Response({
+            'created': len(services) - updated, 'updated': updated,
+            'invalid': sum(result['status'] == 'invalid' for result in results),
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
 class AdminUserListView(generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = AdminUserListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UserCursorPagination
 
-class AdminBookingListView(generics.ListAPIView):
-    queryset = Booking.objects.all().order_by('-booked_at')
+class AdminBookingListView(FastListMixin, generics.ListAPIView):
     serializer_class = AdminBookingListSerializer
-    permission_classes = [IsAuthenticated]
\ No newline at end of file
+    permission_classes = [IsAuthenticated]
+    pagination_class = BookingCursorPagination
+
+    def get_queryset(self):
+        return booking_history('user')
+
+class AdminBookingExportView(views.APIView):
+    permission_classes = [IsAdminUser]
+    chunk_size = 500
+    columns = ['id', 'booking_id', 'user_username', 'date', 'timeslot', 'address', 'total_amount', 'status', 'booked_at', 'services']
+
+    def get(self, request):
+        filters = BookingExportFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+
+        filters = {}
+        if 'date_from' in params:
+            filters['date__gte'] = params['date_from']
+        if 'date_to' in params:
+            filters['date__lte'] = params['date_to']
+        if 'status' in params:
+            filters['status'] = params['status']
+        # Archived bookings too, so date ranges stay complete after archiving.
+        queryset = booking_history('user', **filters).order_by('id')
+
+        return streaming_export(self.rows(queryset, params['output']), params['output'], 'bookings', self.columns)
+
+    def chunks(self, queryset):
+        # Keyset pages merged across both tables by id, each with its own
+        # line-item prefetch, so only one chunk is ever held in memory.
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:self.chunk_size])
+            yield from chunk
+            if len(chunk) < self.chunk_size:
+                return
+            last_id = chunk[-1].id
+
+    def rows(self, queryset, output):
+        for booking in self.chunks(queryset):
+            row = AdminBookingListSerializer(booking).data
+            if output == 'csv':
+                row['services'] = '; '.join(
+                    f"{line['quantity']} x {line['service_name']} @ {line['price_at_booking']}" for line in row['services']
+                )
+            yield row
+
+class AdminUserExportView(views.APIView):
+    permission_classes = [IsAdminUser]
+    chunk_size = 2000
+    columns = ['id', 'username', 'email', 'phone', 'is_active', 'date_joined']
+
+    def get(self, request):
+        filters = UserExportFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+
+        queryset = User.objects.order_by('id')
+        if 'date_from' in params:
+            queryset = queryset.filter(date_joined__date__gte=params['date_from'])
+        if 'date_to' in params:
+            queryset = queryset.filter(date_joined__date__lte=params['date_to'])
+        if params['is_active'] is not None:
+            queryset = queryset.filter(is_active=params['is_active'])
+
+        rows = (AdminUserListSerializer(user).data for user in queryset.iterator(chunk_size=self.chunk_size))
+        return streaming_export(rows, params['output'], 'users', self.columns)
+
+class AdminAnalyticsView(views.APIView):
+    permission_classes = [IsAdminUser]
+    default_days = 30
+
+    def get(self, request):
+        filters = AnalyticsFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+
+        date_to = params.get('date_to', timezone.localdate())
+        date_from = params.get('date_from', date_to - timedelta(days=self.default_days - 1))
+        return Response(summarize(date_from, date_to, params['top_services']))
+
+class MetricsView(views.APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class SlowRequestListView(views.APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list(reversed(slow_requests)))
+
+class BatchView(views.APIView):
+    """
+    Several GETs in one round trip, e.g. everything the app's home screen
+    loads. Each part runs its own view, with the batch request's user and
+    headers, and gets its own status; ``concurrent`` runs them in parallel.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        body = run_batch(request, serializer.validated_data['requests'], serializer.validated_data['concurrent'])
+        return HttpResponse(body, content_type='application/json')
+